@@ -0,0 +1,263 @@
+"""
+Установка схемы БД и хранимых процедур при запуске.
+
+Источник - файлы db_storaged_procedures:
+    schema.txt     - базовые таблицы, индексы и разовые изменения схемы
+                     (операторы через ';')
+    procedures.txt - хранимые процедуры и триггеры (каждый начинается строкой
+                     CREATE PROCEDURE / CREATE TRIGGER)
+
+Для каждого объекта в таблице schema_objects хранится контрольная сумма
+его текста; пересоздаются только изменившиеся объекты:
+    процедура, триггер - DROP + CREATE;
+    индекс    - DROP INDEX + CREATE INDEX;
+    прочие операторы schema.txt (CREATE TABLE, ALTER, UPDATE) - выполняются один раз.
+
+Новая БД поднимается целиком из файлов: базовые таблицы - в начале schema.txt
+(CREATE TABLE IF NOT EXISTS, в существующей БД ничего не меняют).
+Уникальный индекс не создается поверх дубликатов: запуск прерывается
+с ошибкой, в которой названы индекс и повторяющийся ключ.
+
+Общая сумма обоих файлов хранится строкой bundle: если она совпадает,
+запуск стоит одного SELECT. Иначе установку выполняет один процесс под
+GET_LOCK - остальные воркеры ждут и затем видят актуальную сумму.
+
+Пока процедура пересоздается (между DROP и CREATE), ее вызовы падают -
+изменения процедур лучше выкатывать вне пиковой нагрузки.
+
+Переменные окружения:
+    SCHEMA_BOOTSTRAP     - выполнять установку при запуске (по умолчанию true)
+    SCHEMA_LOCK_TIMEOUT  - сколько секунд ждать блокировку установки (60)
+"""
+import hashlib
+import logging
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_BOOTSTRAP = os.getenv('SCHEMA_BOOTSTRAP', 'true').lower() in ('1', 'true', 'yes')
+SCHEMA_LOCK_TIMEOUT = int(os.getenv('SCHEMA_LOCK_TIMEOUT', '60'))
+
+SQL_DIR = Path(__file__).resolve().parent.parent / 'db_storaged_procedures'
+
+LOCK_NAME = 'warehouse_schema_bootstrap'
+BUNDLE = ('bundle', 'warehouse')
+
+# Объект уже есть в БД (установлен вручную до появления schema_objects)
+ER_TABLE_EXISTS = 1050
+ER_DUP_FIELDNAME = 1060
+ER_DUP_KEYNAME = 1061
+ER_DUP_ENTRY = 1062
+ER_NO_SUCH_TABLE = 1146
+_ALREADY_EXISTS = (ER_TABLE_EXISTS, ER_DUP_FIELDNAME, ER_DUP_KEYNAME)
+
+_CREATE_OBJECTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_objects (
+        object_type VARCHAR(20) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (object_type, name)
+    )
+"""
+
+_PROCEDURE_START = re.compile(r'^CREATE\b', re.IGNORECASE)
+_PROCEDURE_NAME = re.compile(r'^CREATE\s+(PROCEDURE|TRIGGER)\s+(\w+)\b', re.IGNORECASE)
+_INDEX = re.compile(r'^CREATE\s+(?:UNIQUE\s+|FULLTEXT\s+)?INDEX\s+(\w+)\s+ON\s+(\w+)', re.IGNORECASE)
+_END = re.compile(r'^END\s*;?\s*$', re.IGNORECASE)
+
+
+class SchemaObject:
+    """Объект схемы: тип, имя, текст DDL и его контрольная сумма"""
+
+    def __init__(self, object_type: str, name: str, ddl: str, table: Optional[str] = None):
+        self.object_type = object_type
+        self.name = name
+        self.ddl = ddl
+        self.table = table
+        self.checksum = _checksum(ddl)
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.object_type, self.name)
+
+
+def _checksum(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _strip_comments(lines: List[str]) -> List[str]:
+    return [line.rstrip() for line in lines if not line.lstrip().startswith('--')]
+
+
+def parse_procedures(source: str) -> List[SchemaObject]:
+    """
+    Разбить procedures.txt на процедуры и триггеры.
+    Каждый объект - от строки CREATE PROCEDURE/TRIGGER до последней строки END перед следующим.
+    """
+    lines = source.splitlines()
+    starts = [index for index, line in enumerate(lines) if _PROCEDURE_START.match(line)]
+    procedures = []
+
+    for number, start in enumerate(starts):
+        end = starts[number + 1] if number + 1 < len(starts) else len(lines)
+        match = _PROCEDURE_NAME.match(lines[start])
+        if match is None:
+            raise ValueError(f"procedures.txt:{start + 1}: ожидается CREATE PROCEDURE|TRIGGER <имя>: {lines[start]!r}")
+
+        body = lines[start:end]
+        last = max((index for index, line in enumerate(body) if _END.match(line)), default=None)
+        if last is None:
+            raise ValueError(f"procedures.txt:{start + 1}: {match.group(2)} без END")
+        # Комментарии перед следующей процедурой в текст не входят; 'END ;' -> 'END'
+        body = body[:last] + ['END']
+        object_type, name = match.group(1).lower(), match.group(2)
+        procedures.append(SchemaObject(object_type, name, '\n'.join(line.rstrip() for line in body)))
+
+    return procedures
+
+
+def parse_schema(source: str) -> List[SchemaObject]:
+    """Разбить schema.txt на операторы (конец оператора - ';' в конце строки)"""
+    objects = []
+    statement: List[str] = []
+
+    for line in _strip_comments(source.splitlines()):
+        if not line.strip():
+            continue
+        statement.append(line)
+        if line.endswith(';'):
+            ddl = '\n'.join(statement)[:-1].strip()
+            statement = []
+            match = _INDEX.match(ddl)
+            if match:
+                objects.append(SchemaObject('index', match.group(1), ddl, table=match.group(2)))
+            else:
+                # Разовое изменение: имя - сумма текста, выполняется один раз
+                objects.append(SchemaObject('migration', _checksum(ddl)[:16], ddl))
+
+    if statement:
+        raise ValueError(f"schema.txt: оператор без ';' в конце: {statement[0]!r}")
+    return objects
+
+
+def load_objects() -> Tuple[List[SchemaObject], str]:
+    """Объекты из файлов и общая контрольная сумма"""
+    schema = (SQL_DIR / 'schema.txt').read_text(encoding='utf-8')
+    procedures = (SQL_DIR / 'procedures.txt').read_text(encoding='utf-8')
+    objects = parse_schema(schema) + parse_procedures(procedures)
+    bundle = _checksum('\n'.join(f"{obj.object_type}:{obj.name}:{obj.checksum}" for obj in objects))
+    return objects, bundle
+
+
+def _error_code(error: DBAPIError) -> Optional[int]:
+    args = getattr(error.orig, 'args', ())
+    return args[0] if args and isinstance(args[0], int) else None
+
+
+def _ddl(conn: Connection, statement: str) -> None:
+    # Без параметров: '%' и ':' в теле процедур не разбираются как плейсхолдеры
+    conn.exec_driver_sql(statement, execution_options={'no_parameters': True})
+
+
+def _stored_bundle(conn: Connection) -> Optional[str]:
+    try:
+        return conn.exec_driver_sql(
+            "SELECT checksum FROM schema_objects WHERE object_type = %s AND name = %s", BUNDLE
+        ).scalar()
+    except DBAPIError as e:
+        if _error_code(e) == ER_NO_SUCH_TABLE:
+            return None
+        raise
+
+
+def _record(conn: Connection, key: Tuple[str, str], checksum: str) -> None:
+    conn.exec_driver_sql(
+        "INSERT INTO schema_objects (object_type, name, checksum) VALUES (%s, %s, %s) AS new "
+        "ON DUPLICATE KEY UPDATE checksum = new.checksum",
+        (key[0], key[1], checksum),
+    )
+
+
+def _apply(conn: Connection, obj: SchemaObject, installed: bool) -> None:
+    if obj.object_type in ('procedure', 'trigger'):
+        _ddl(conn, f"DROP {obj.object_type.upper()} IF EXISTS {obj.name}")
+        _ddl(conn, obj.ddl)
+        return
+
+    if obj.object_type == 'index' and installed:
+        _ddl(conn, f"DROP INDEX {obj.name} ON {obj.table}")
+
+    try:
+        _ddl(conn, obj.ddl)
+    except DBAPIError as e:
+        code = _error_code(e)
+        if code == ER_DUP_ENTRY and obj.object_type == 'index':
+            # Текст ошибки MySQL содержит повторяющийся ключ: Duplicate entry '<значения>' for key ...
+            raise RuntimeError(
+                f"schema: индекс {obj.name} на {obj.table} не создан - в таблице есть повторяющиеся строки "
+                f"({e.orig.args[1]}). Сведите их в одну строку и перезапустите сервис"
+            ) from e
+        if code not in _ALREADY_EXISTS:
+            raise
+        logger.info("schema: %s %s уже есть в БД", obj.object_type, obj.name)
+
+
+def install(conn: Connection, objects: List[SchemaObject], bundle: str) -> List[Tuple[str, str]]:
+    """Применить изменившиеся объекты; возвращает список (тип, имя) примененных"""
+    _ddl(conn, _CREATE_OBJECTS_TABLE)
+    installed = {
+        (row.object_type, row.name): row.checksum
+        for row in conn.exec_driver_sql("SELECT object_type, name, checksum FROM schema_objects")
+    }
+
+    applied = []
+    for obj in objects:
+        if installed.get(obj.key) == obj.checksum:
+            continue
+        _apply(conn, obj, obj.key in installed)
+        _record(conn, obj.key, obj.checksum)
+        applied.append(obj.key)
+
+    _record(conn, BUNDLE, bundle)
+    return applied
+
+
+def bootstrap(engine: Engine) -> None:
+    """Привести схему и процедуры к файлам db_storaged_procedures"""
+    if not SCHEMA_BOOTSTRAP:
+        return
+
+    objects, bundle = load_objects()
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+
+        # Быстрый путь: все уже установлено
+        if _stored_bundle(conn) == bundle:
+            return
+
+        acquired = conn.exec_driver_sql("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, SCHEMA_LOCK_TIMEOUT)).scalar()
+        if acquired != 1:
+            raise RuntimeError(f"Не удалось получить блокировку {LOCK_NAME} за {SCHEMA_LOCK_TIMEOUT} с")
+        try:
+            # Пока ждали блокировку, установку мог выполнить другой процесс
+            if _stored_bundle(conn) == bundle:
+                return
+            applied = install(conn, objects, bundle)
+            logger.info(
+                "schema: применено объектов - %d: %s",
+                len(applied), ', '.join(f"{object_type} {name}" for object_type, name in applied) or '-',
+            )
+        finally:
+            conn.exec_driver_sql("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+
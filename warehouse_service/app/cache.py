@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей.
+
+    Считает попадания, промахи, вытеснения (по размеру), истечения (по TTL)
+    и инвалидации - по ним подбирается размер кэша.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Номер последней инвалидации. Значение, прочитанное из БД до
+        # инвалидации ключа, не должно попасть в кэш после нее - инвалидация
+        # других ключей заполнению не мешает.
+        self._generation = 0
+        # Ключ -> номер его последней инвалидации (не больше max_size последних);
+        # отброшенные и clear() поднимают _floor - заполнения, начатые раньше
+        # него, не кэшируются
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Вернуть значение или None, если его нет или оно устарело"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """
+        Положить значение в кэш.
+
+        generation - значение self.generation до чтения из БД; если с тех пор
+        был инвалидирован этот ключ, значение могло устареть и не кэшируется.
+        """
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and (generation < self._floor or self._invalidated.get(key, 0) > generation):
+                return
+
+            self._data[key] = (value, self._clock() + self.ttl_seconds)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            self._invalidated[key] = self._generation
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.max_size:
+                _, self._floor = self._invalidated.popitem(last=False)
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._floor = self._generation
+            self._invalidated.clear()
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# Кэш карточек товаров для GET /products/{id}, GET /products/thermocups/{id}
+# и GET /catalog/products/{id}.
+# PRODUCT_CACHE_SIZE=0 отключает кэширование.
+product_cache = TTLCache(
+    max_size=int(os.getenv('PRODUCT_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.getenv('PRODUCT_CACHE_TTL', '60')),
+)
+
+# Кэш фасет GET /products/facets по набору фильтров.
+# Не сбрасывается при изменении товаров: счетчики панели фильтров
+# допускают отставание на FACETS_CACHE_TTL секунд.
+facets_cache = TTLCache(
+    max_size=int(os.getenv('FACETS_CACHE_SIZE', '1000')),
+    ttl_seconds=float(os.getenv('FACETS_CACHE_TTL', '30')),
+)
+
+
+def product_key(product_id: int) -> tuple:
+    return ('product', product_id)
+
+
+def thermocup_key(product_id: int) -> tuple:
+    return ('thermocup', product_id)
+
+
+def catalog_key(product_id: int) -> tuple:
+    return ('catalog', product_id)
+
+
+def invalidate_product(product_id: int) -> None:
+    """Сбросить все закэшированные представления товара"""
+    product_cache.invalidate(product_key(product_id))
+    product_cache.invalidate(thermocup_key(product_id))
+    product_cache.invalidate(catalog_key(product_id))
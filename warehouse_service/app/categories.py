@@ -0,0 +1,280 @@
+"""
+Реестр категорий товаров и общие для всех категорий операции (/catalog).
+
+Категория = имя в API (/catalog/{category}) + строка categories в БД +
+таблица атрибутов с первичным ключом product_id + схемы атрибутов для
+создания и обновления (app/models.py). Новая категория - таблица атрибутов
+в БД, две схемы и запись в CATEGORIES; эндпоинты, запросы и процедуры для
+нее не нужны.
+
+Имя в API не совпадает с categories.name: товары и category_id сверяются
+с категорией по categories.name, заданному для нее в окружении (по умолчанию -
+имена, которыми категории заполняются в новой БД, db_storaged_procedures/schema.txt).
+
+Список товаров разных категорий дочитывает атрибуты одним запросом на
+каждую категорию, встретившуюся на странице (WHERE product_id IN (...)),
+а не вызовом на каждый товар: на страницу - не больше 1 + число категорий
+запросов.
+
+Создание и изменение - в одной транзакции сессии (как в app/importer.py):
+строка products, строка атрибутов и начальный остаток через
+apply_stock_adjustments. Транзакцию (commit/rollback) завершает вызывающий код.
+
+Переменные окружения:
+    CATEGORY_THERMOCUPS_NAME  - categories.name термокружек (Термокружки)
+    CATEGORY_SERVERS_NAME     - categories.name серверов (Серверы)
+"""
+import os
+from typing import Any, Dict, List, Tuple, Type
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.models import CatalogProductCreate, CatalogProductUpdate
+from app.models import ServerAttributes, ServerAttributesUpdate
+from app.models import ThermocupAttributes, ThermocupAttributesUpdate
+from app.stock import apply_stock_adjustments
+
+load_dotenv()
+
+
+class Category:
+    """Категория: имя в API, имя в categories, таблица атрибутов и схемы атрибутов"""
+
+    def __init__(self, name: str, db_name: str, table: str, attributes: Type[BaseModel], attributes_update: Type[BaseModel]):
+        self.name = name
+        self.db_name = db_name
+        self.table = table
+        self.attributes = attributes
+        self.attributes_update = attributes_update
+        self.columns = tuple(attributes.model_fields)
+
+
+CATEGORIES: Dict[str, Category] = {
+    category.name: category
+    for category in (
+        Category('thermocups', os.getenv('CATEGORY_THERMOCUPS_NAME', 'Термокружки'),
+                 'product_attributes_thermocups', ThermocupAttributes, ThermocupAttributesUpdate),
+        Category('servers', os.getenv('CATEGORY_SERVERS_NAME', 'Серверы'),
+                 'product_attributes_servers', ServerAttributes, ServerAttributesUpdate),
+    )
+}
+
+# categories.name -> категория: category_name строк товаров приходит из БД
+CATEGORIES_BY_DB_NAME: Dict[str, Category] = {category.db_name: category for category in CATEGORIES.values()}
+
+
+class CategoryNotFoundError(Exception):
+    pass
+
+
+class CatalogProductNotFoundError(Exception):
+    pass
+
+
+class InvalidProductDataError(Exception):
+    """Ссылка на несуществующую категорию/склад или категория не та"""
+
+
+def get_category(name: str) -> Category:
+    category = CATEGORIES.get(name)
+    if category is None:
+        raise CategoryNotFoundError(f"Категория '{name}' не найдена")
+    return category
+
+
+def validate_attributes(category: Category, data: Dict[str, Any], partial: bool = False) -> Dict[str, Any]:
+    """
+    Проверить атрибуты схемой категории (partial - схемой обновления).
+    Неизвестные поля - ошибка: иначе опечатка в имени атрибута молча теряется.
+    """
+    model = category.attributes_update if partial else category.attributes
+    unknown = [
+        {'type': 'extra_forbidden', 'loc': (key,), 'input': value}
+        for key, value in data.items() if key not in category.columns
+    ]
+    if unknown:
+        raise ValidationError.from_exception_data(model.__name__, unknown)
+    attributes = model.model_validate(data)
+    if partial:
+        return attributes.model_dump(exclude_none=True)
+    return attributes.model_dump()
+
+
+# ==================== Чтение ====================
+
+_PRODUCTS_SELECT = """
+    SELECT
+        p.id,
+        p.name,
+        p.sku,
+        c.name as category_name,
+        p.base_price,
+        p.total_quantity,
+        COALESCE(p.num_reserved_goods, 0) as num_reserved_goods,
+        p.is_active,
+        p.created_at,
+        p.updated_at,
+        p.path_to_photo
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+"""
+
+_GET_PRODUCT = text(_PRODUCTS_SELECT + "    WHERE p.id = :product_id")
+
+_LOCK_PRODUCT = text("""
+    SELECT p.id, c.name as category_name
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+    WHERE p.id = :product_id
+    FOR UPDATE
+""")
+
+_CATEGORY_NAME = text("SELECT name FROM categories WHERE id = :category_id")
+
+
+def products_query(filters: Dict[str, Any], limit: int, offset: int) -> Tuple[Any, Dict[str, Any]]:
+    """SELECT страницы товаров любых категорий - условия только по заданным фильтрам"""
+    conditions = []
+    params: Dict[str, Any] = {'limit': limit, 'offset': offset}
+    expanding = []
+
+    if not filters['include_inactive']:
+        conditions.append("p.is_active = 1")
+    if not filters['include_out_of_stock']:
+        conditions.append("p.total_quantity > 0")
+    if filters['category']:
+        conditions.append("c.name IN :category")
+        params['category'] = list(filters['category'])
+        expanding.append(bindparam('category', expanding=True))
+    if filters['min_price'] is not None:
+        conditions.append("p.base_price >= :min_price")
+        params['min_price'] = filters['min_price']
+    if filters['max_price'] is not None:
+        conditions.append("p.base_price <= :max_price")
+        params['max_price'] = filters['max_price']
+
+    sql = _PRODUCTS_SELECT
+    if conditions:
+        sql += "    WHERE " + "\n        AND ".join(conditions) + "\n"
+    sql += "    ORDER BY p.is_active DESC, p.total_quantity DESC, p.name, p.id\n    LIMIT :limit OFFSET :offset"
+
+    statement = text(sql)
+    if expanding:
+        statement = statement.bindparams(*expanding)
+    return statement, params
+
+
+def _attributes_query(category: Category):
+    return text(
+        f"SELECT product_id, {', '.join(category.columns)} FROM {category.table} WHERE product_id IN :ids"
+    ).bindparams(bindparam('ids', expanding=True))
+
+
+def load_attributes(db: Session, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Дочитать атрибуты: один запрос на каждую категорию из products"""
+    by_category: Dict[str, List[Dict[str, Any]]] = {}
+    for product in products:
+        product['attributes'] = None
+        if product['category_name'] in CATEGORIES_BY_DB_NAME:
+            by_category.setdefault(product['category_name'], []).append(product)
+
+    for db_name, items in by_category.items():
+        category = CATEGORIES_BY_DB_NAME[db_name]
+        rows = db.execute(_attributes_query(category), {'ids': [product['id'] for product in items]})
+        attributes = {row.product_id: {column: getattr(row, column) for column in category.columns} for row in rows}
+        for product in items:
+            product['attributes'] = attributes.get(product['id'])
+    return products
+
+
+def get_product(db: Session, product_id: int) -> Dict[str, Any]:
+    row = db.execute(_GET_PRODUCT, {'product_id': product_id}).fetchone()
+    if row is None:
+        raise CatalogProductNotFoundError(f"Товар {product_id} не найден")
+    return load_attributes(db, [dict(row._mapping)])[0]
+
+
+# ==================== Запись ====================
+
+def check_category_id(db: Session, category: Category, category_id: int) -> None:
+    """category_id должен существовать и быть строкой categories этой категории"""
+    name = db.execute(_CATEGORY_NAME, {'category_id': category_id}).scalar()
+    if name is None:
+        raise InvalidProductDataError("Указанная категория не существует")
+    if name != category.db_name:
+        raise InvalidProductDataError(f"category_id {category_id} не относится к категории '{category.name}'")
+
+
+def create_product(db: Session, category: Category, product_data: CatalogProductCreate) -> Dict[str, Any]:
+    """Создать товар категории с атрибутами и (опционально) начальным остатком"""
+    attributes = validate_attributes(category, product_data.attributes)
+    check_category_id(db, category, product_data.category_id)
+
+    product_id = db.execute(
+        text("""
+            INSERT INTO products (name, category_id, base_price, path_to_photo, total_quantity)
+            VALUES (:name, :category_id, :base_price, :path_to_photo, 0)
+        """),
+        {
+            'name': product_data.name,
+            'category_id': product_data.category_id,
+            'base_price': product_data.base_price,
+            'path_to_photo': product_data.path_to_photo or None,
+        }
+    ).lastrowid
+
+    columns = ('product_id',) + category.columns
+    db.execute(
+        text(f"INSERT INTO {category.table} ({', '.join(columns)}) VALUES ({', '.join(':' + column for column in columns)})"),
+        {'product_id': product_id, **attributes}
+    )
+
+    # Как в AddProductQuantity: остаток создается только при quantity > 0
+    if product_data.warehouse_id is not None and (product_data.initial_quantity or 0) > 0:
+        results, _ = apply_stock_adjustments(db, [(product_id, product_data.warehouse_id, product_data.initial_quantity)])
+        if results[0]['status'] != 'applied':
+            raise InvalidProductDataError("Указанный склад не существует")
+
+    return get_product(db, product_id)
+
+
+_PRODUCT_UPDATE_FIELDS = ('name', 'category_id', 'base_price', 'sku', 'is_active', 'path_to_photo')
+
+
+def update_product(db: Session, category: Category, product_id: int, product_data: CatalogProductUpdate) -> Dict[str, Any]:
+    """
+    Изменить товар категории: переданные поля товара и атрибутов,
+    не переданные (None) не меняются - как в UpdateThermocup
+    """
+    attributes = validate_attributes(category, product_data.attributes or {}, partial=True)
+
+    row = db.execute(_LOCK_PRODUCT, {'product_id': product_id}).fetchone()
+    if row is None or row.category_name != category.db_name:
+        raise CatalogProductNotFoundError(f"Товар {product_id} не найден в категории '{category.name}'")
+    if product_data.category_id is not None:
+        check_category_id(db, category, product_data.category_id)
+
+    fields = {name: getattr(product_data, name) for name in _PRODUCT_UPDATE_FIELDS if getattr(product_data, name) is not None}
+    # updated_at - всегда: по нему строится ETag, в том числе при изменении только атрибутов
+    assignments = [f"{name} = :{name}" for name in fields] + ["updated_at = CURRENT_TIMESTAMP(6)"]
+    db.execute(
+        text(f"UPDATE products SET {', '.join(assignments)} WHERE id = :product_id"),
+        {**fields, 'product_id': product_id}
+    )
+
+    if attributes:
+        # Строки атрибутов может не быть (товар создан без них) - вставляем
+        columns = ('product_id',) + tuple(attributes)
+        db.execute(
+            text(
+                f"INSERT INTO {category.table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(':' + column for column in columns)}) AS new "
+                f"ON DUPLICATE KEY UPDATE {', '.join(f'{column} = new.{column}' for column in attributes)}"
+            ),
+            {'product_id': product_id, **attributes}
+        )
+
+    return get_product(db, product_id)
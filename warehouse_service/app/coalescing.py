@@ -0,0 +1,189 @@
+"""
+Склейка параллельных изменений остатка одного товара на одном складе.
+
+Включается STOCK_COALESCING=true. Первый запрос по ключу (product_id,
+warehouse_id) становится ведущим: ждет STOCK_COALESCE_WINDOW_MS, забирает
+все изменения, пришедшие за это время по тому же ключу, и применяет их
+одной транзакцией через apply_stock_adjustments (фиксированное число
+запросов, одна блокировка строки вместо очереди транзакций на ней).
+Остальные запросы ждут результат ведущего.
+
+Изменения применяются по порядку прихода с all_or_nothing=False: каждое
+видит результат предыдущих, и проверка на отрицательный остаток идет
+для каждого запроса отдельно - отклоненное изменение не мешает остальным.
+Каждый запрос получает свой результат (остаток сразу после его изменения).
+
+Пачку собирает задача в event loop, запросы ждут asyncio.Future пачки и не
+занимают потоки threadpool (их у Starlette 40 - ожидание окна в потоках
+исчерпало бы их под нагрузкой). AsyncStockCoalescer применяет пачку на
+async-сессии (DB_ASYNC=true), StockCoalescer - для синхронного роутера: на
+сессии SessionLocal в потоке asyncio.to_thread, только на время транзакции.
+
+Ожидание результата не ограничено по времени: пачку, которую задача уже
+забрала, может успеть зафиксировать БД, и ответ по таймауту был бы ложным.
+Если задачу отменили после того, как она забрала пачку (остановка
+приложения), запросы получают StockOutcomeUnknownError - изменение могло
+быть применено; до этого - StockNotAppliedError.
+
+Переменные окружения:
+    STOCK_COALESCING            - включить склейку (по умолчанию false)
+    STOCK_COALESCE_WINDOW_MS    - окно сбора изменений, мс (5)
+    STOCK_COALESCE_MAX_BATCH    - не больше изменений в одной транзакции (200)
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.stock import apply_stock_adjustments
+
+load_dotenv()
+
+STOCK_COALESCING = os.getenv('STOCK_COALESCING', 'false').lower() in ('1', 'true', 'yes')
+STOCK_COALESCE_WINDOW_MS = float(os.getenv('STOCK_COALESCE_WINDOW_MS', '5'))
+STOCK_COALESCE_MAX_BATCH = int(os.getenv('STOCK_COALESCE_MAX_BATCH', '200'))
+
+
+class StockNotAppliedError(Exception):
+    """Пачка не применялась (приложение остановлено до окончания окна)"""
+
+
+class StockOutcomeUnknownError(Exception):
+    """Транзакция пачки прервана на стороне приложения - могла быть зафиксирована"""
+
+
+class _BaseCoalescer:
+    """Сбор пачек по ключу и статистика - общие для обоих вариантов"""
+
+    def __init__(self, session_factory: Callable, window_ms: float, max_batch: int):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._open: Dict[Tuple[int, int], Any] = {}
+        # Статистика для /internal: сколько запросов пришло и сколько транзакций понадобилось
+        self.requests = 0
+        self.transactions = 0
+
+    def _join(self, key: Tuple[int, int], quantity_change: int, new_batch: Callable) -> Tuple[Any, int, bool]:
+        """Добавить изменение в открытую пачку ключа: (пачка, номер в ней, ведущий ли)"""
+        with self._lock:
+            self.requests += 1
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = new_batch()
+            index = len(batch.changes)
+            batch.changes.append(quantity_change)
+            # Полная пачка закрывается - следующие запросы начнут новую
+            if len(batch.changes) >= self.max_batch:
+                self._open.pop(key, None)
+        return batch, index, leader
+
+    def _close(self, key: Tuple[int, int], batch: Any) -> List[Tuple[int, int, int]]:
+        """Закрыть пачку после окна и вернуть ее строки для apply_stock_adjustments"""
+        with self._lock:
+            if self._open.get(key) is batch:
+                del self._open[key]
+            changes = list(batch.changes)
+        product_id, warehouse_id = key
+        return [(product_id, warehouse_id, change) for change in changes]
+
+    def _count_transaction(self) -> None:
+        with self._lock:
+            self.transactions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": STOCK_COALESCING,
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "requests": self.requests,
+                "transactions": self.transactions,
+                "open_batches": len(self._open),
+            }
+
+
+class _AsyncBatch:
+    def __init__(self):
+        self.changes: List[int] = []
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+
+
+class AsyncStockCoalescer(_BaseCoalescer):
+    async def submit(self, product_id: int, warehouse_id: int, quantity_change: int) -> Dict[str, Any]:
+        """
+        Применить изменение остатка. Возвращает результат строки
+        apply_stock_adjustments: status 'applied' или 'rejected' с текстом
+        ошибки как у UpdateProductStockQuantity.
+        Пачку применяет отдельная задача, поэтому отмена запроса ведущего
+        не оставляет остальных без результата.
+        """
+        key = (product_id, warehouse_id)
+        batch, index, leader = self._join(key, quantity_change, _AsyncBatch)
+
+        if leader:
+            batch.task = asyncio.create_task(self._flush(key, batch))
+
+        results = await asyncio.shield(batch.future)
+        return results[index]
+
+    async def _flush(self, key: Tuple[int, int], batch: _AsyncBatch) -> None:
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            self._close(key, batch)
+            batch.future.set_exception(StockNotAppliedError("Stock update was not applied"))
+            raise
+        lines = self._close(key, batch)
+
+        try:
+            results = await self._apply(lines)
+            batch.future.set_result(results)
+        except asyncio.CancelledError:
+            batch.future.set_exception(StockOutcomeUnknownError("Stock update outcome is unknown"))
+            raise
+        except Exception as e:
+            batch.future.set_exception(e)
+        finally:
+            self._count_transaction()
+
+    async def _apply(self, lines: List[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+        async with self.session_factory() as db:
+            try:
+                results, _ = await db.run_sync(
+                    lambda session: apply_stock_adjustments(session, lines, all_or_nothing=False)
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        return results
+
+
+class StockCoalescer(AsyncStockCoalescer):
+    """Для синхронного роутера: транзакция пачки - на SessionLocal в отдельном потоке"""
+
+    async def _apply(self, lines: List[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._apply_sync, lines)
+
+    def _apply_sync(self, lines: List[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+        with self.session_factory() as db:
+            try:
+                results, _ = apply_stock_adjustments(db, lines, all_or_nothing=False)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        return results
+
+
+stock_coalescer = StockCoalescer(SessionLocal, STOCK_COALESCE_WINDOW_MS, STOCK_COALESCE_MAX_BATCH)
+
+# AsyncSessionLocal есть только при DB_ASYNC=true - тогда и используется
+async_stock_coalescer = AsyncStockCoalescer(AsyncSessionLocal, STOCK_COALESCE_WINDOW_MS, STOCK_COALESCE_MAX_BATCH)
@@ -0,0 +1,115 @@
+"""
+Условные GET-запросы (ETag / Last-Modified -> 304 Not Modified).
+
+Версия товара - (id, updated_at, total_quantity, num_reserved_goods):
+updated_at (TIMESTAMP(6)) обновляют все процедуры и запросы записи товара
+и его остатков, остатки и резерв дополнительно входят в версию на случай
+записи в пределах одной микросекунды.
+
+Для карточки товара ETag строится из полей самого ответа, а при условном
+запросе версия проверяется одним чтением строки products по первичному
+ключу - тяжелая процедура (остатки по складам и т.п.) не вызывается.
+Для списка версия - MAX(updated_at) по products (край индекса
+idx_products_updated_at) и MAX(id) по outbox_events (край первичного
+ключа) вместе с фильтрами и страницей: оба чтения не зависят от размера
+каталога. updated_at меняет любая запись товара; удаление товара его не
+меняет, но пишет событие deleted в outbox (триггер trg_products_outbox_delete).
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+from fastapi import Request, Response, status
+from sqlalchemy import text
+
+PRODUCT_VERSION = text("""
+    SELECT id, updated_at, total_quantity, COALESCE(num_reserved_goods, 0) as num_reserved_goods
+    FROM products
+    WHERE id = :product_id
+""")
+
+CATALOG_VERSION = text("""
+    SELECT
+        (SELECT MAX(updated_at) FROM products) as updated_at,
+        (SELECT COALESCE(MAX(id), 0) FROM outbox_events) as last_event_id
+""")
+
+
+def _timestamp(value: Optional[datetime]) -> str:
+    return str(int(_utc(value).timestamp() * 1_000_000)) if value is not None else '0'
+
+
+def product_etag(product: Mapping[str, Any]) -> str:
+    """ETag товара по полям версии (строка PRODUCT_VERSION или тело ответа)"""
+    return '"p{}-{}-{}-{}"'.format(
+        product['id'],
+        _timestamp(product.get('updated_at')),
+        product.get('total_quantity') or 0,
+        product.get('num_reserved_goods') or 0,
+    )
+
+
+def catalog_etag(version: Mapping[str, Any], query: Dict[str, Any]) -> str:
+    """ETag страницы списка: версия каталога + фильтры и параметры страницы"""
+    payload = json.dumps(
+        [_timestamp(version['updated_at']), version['last_event_id'], sorted(query.items())],
+        default=str,
+    )
+    return '"l' + hashlib.sha1(payload.encode()).hexdigest()[:20] + '"'
+
+
+def is_conditional(request: Request) -> bool:
+    return 'if-none-match' in request.headers or 'if-modified-since' in request.headers
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Проверка If-None-Match / If-Modified-Since.
+    If-Modified-Since учитывается только без If-None-Match (RFC 9110).
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in candidates or etag in candidates
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return _utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def _utc(value: datetime) -> datetime:
+    # TIMESTAMP из MySQL приходит без зоны (в зоне соединения). Last-Modified
+    # сравнивается только с ранее отданным нами же значением - важна согласованность
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime]) -> None:
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = format_datetime(_utc(last_modified).replace(microsecond=0), usegmt=True)
+
+
+def product_not_modified(request: Request, version) -> Optional[Response]:
+    """304 по строке PRODUCT_VERSION, если версия у клиента актуальна"""
+    if version is None:
+        return None
+    version = version._mapping
+    etag = product_etag(version)
+    if not_modified(request, etag, version['updated_at']):
+        return not_modified_response(etag, version['updated_at'])
+    return None
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime]) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
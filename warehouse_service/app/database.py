@@ -4,11 +4,16 @@ from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+from app.pool import InstrumentedQueuePool, instrument_pool, pool_options
+from app.replica import replica_state
+
 load_dotenv()
 
 DATABASE_URL = f"mysql+pymysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Размер пула, recycle, timeout и pre-ping - из DB_POOL_* (см. app/pool.py)
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **pool_options())
+instrument_pool(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -18,4 +23,82 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# ==================== Реплика для чтения ====================
+# DB_REPLICA_HOST задает реплику для GET-эндпоинтов (get_read_db);
+# пользователь и пароль - DB_REPLICA_USER / DB_REPLICA_PASSWORD или те же, что у основной БД.
+# Отставание и read-your-writes - app/replica.py.
+
+DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST')
+
+def _replica_url(driver: str) -> str:
+    user = os.getenv('DB_REPLICA_USER') or os.getenv('DB_USER')
+    password = os.getenv('DB_REPLICA_PASSWORD') or os.getenv('DB_PASSWORD')
+    return f"mysql+{driver}://{user}:{password}@{DB_REPLICA_HOST}/{os.getenv('DB_NAME')}"
+
+replica_engine = None
+ReplicaSessionLocal = None
+
+if DB_REPLICA_HOST:
+    replica_engine = create_engine(_replica_url('pymysql'), poolclass=InstrumentedQueuePool, **pool_options())
+    instrument_pool(replica_engine)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+def get_read_db():
+    """Сессия для чтения: реплика, если она исправна и клиент не закреплен за основной БД"""
+    use_replica = ReplicaSessionLocal is not None and replica_state.use_replica()
+    db = ReplicaSessionLocal() if use_replica else SessionLocal()
+    db.info['replica'] = use_replica
+    try:
+        yield db
+    finally:
+        db.close()
+
+def is_replica_session(db) -> bool:
+    """Сессия get_read_db / get_async_read_db читает с реплики (данные могут отставать)"""
+    return db.info.get('replica', False)
+
+def read_engine():
+    """Движок для чтения вне сессии (потоковая выгрузка) - по тем же правилам, что get_read_db"""
+    if replica_engine is not None and replica_state.use_replica():
+        return replica_engine
+    return engine
+
+# ==================== Асинхронный доступ к БД ====================
+# DB_ASYNC=true переключает роутер товаров на async-обработчики поверх aiomysql:
+# запрос не занимает поток из threadpool на время ожидания БД,
+# и параллельность ограничивается только пулом соединений.
+
+DB_ASYNC = os.getenv('DB_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+
+ASYNC_DATABASE_URL = f"mysql+aiomysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from app.pool import InstrumentedAsyncQueuePool
+
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **pool_options())
+    instrument_pool(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+
+if DB_ASYNC and DB_REPLICA_HOST:
+    async_replica_engine = create_async_engine(_replica_url('aiomysql'), poolclass=InstrumentedAsyncQueuePool, **pool_options())
+    instrument_pool(async_replica_engine.sync_engine)
+    AsyncReplicaSessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    use_replica = AsyncReplicaSessionLocal is not None and replica_state.use_replica()
+    async with (AsyncReplicaSessionLocal if use_replica else AsyncSessionLocal)() as db:
+        db.info['replica'] = use_replica
+        yield db
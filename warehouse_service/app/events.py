@@ -0,0 +1,223 @@
+"""
+Поток изменений товаров: outbox-таблица + брокер в процессе.
+
+События пишут триггеры products (procedures.txt) в таблицу outbox_events
+в той же транзакции, что и изменение: stock, reservation, price,
+activation, created, deleted. Брокер - одна фоновая задача на процесс - читает
+новые строки по возрастанию id раз в OUTBOX_POLL_INTERVAL секунд и
+раздает их подписчикам GET /events/stream, сколько бы их ни было.
+Заодно сбрасывает локальный кэш карточек измененных товаров - в том
+числе после записей через другие воркеры.
+
+Id события растет, но транзакции фиксируются не по порядку id: строка
+с меньшим id может появиться позже. Поэтому на пропуске в id брокер
+ждет до OUTBOX_GAP_TIMEOUT секунд (пропуск от отката так и не заполнится).
+
+Переподключение: клиент передает Last-Event-ID, пропущенные события
+досылаются из таблицы (не больше OUTBOX_REPLAY_LIMIT - иначе событие
+reset: состояние нужно перечитать целиком). События старше
+OUTBOX_RETENTION_HOURS удаляются.
+
+Переменные окружения:
+    OUTBOX_POLL_INTERVAL      - период опроса outbox_events, с (0.5)
+    OUTBOX_BATCH              - строк за один опрос (1000)
+    OUTBOX_GAP_TIMEOUT        - сколько ждать заполнения пропуска в id, с (2)
+    OUTBOX_REPLAY_LIMIT       - максимум досылаемых при переподключении событий (10000)
+    OUTBOX_SUBSCRIBER_QUEUE   - очередь подписчика; переполнена - поток закрывается (1000)
+    OUTBOX_RETENTION_HOURS    - сколько часов хранить события (24)
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app.cache import invalidate_product
+from app.database import engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '0.5'))
+OUTBOX_BATCH = int(os.getenv('OUTBOX_BATCH', '1000'))
+OUTBOX_GAP_TIMEOUT = float(os.getenv('OUTBOX_GAP_TIMEOUT', '2'))
+OUTBOX_REPLAY_LIMIT = int(os.getenv('OUTBOX_REPLAY_LIMIT', '10000'))
+OUTBOX_SUBSCRIBER_QUEUE = int(os.getenv('OUTBOX_SUBSCRIBER_QUEUE', '1000'))
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', '24'))
+
+EVENT_TYPES = ('stock', 'reservation', 'price', 'activation', 'created', 'deleted')
+
+# Удаление старых событий - не чаще раза в 5 минут
+_CLEANUP_INTERVAL = 300
+
+_MAX_ID = text("SELECT COALESCE(MAX(id), 0) FROM outbox_events")
+
+_MIN_ID = text("SELECT MIN(id) FROM outbox_events")
+
+_EVENTS_AFTER = text("""
+    SELECT id, event_type, product_id, payload, created_at
+    FROM outbox_events
+    WHERE id > :after_id AND id <= :up_to
+    ORDER BY id
+    LIMIT :limit
+""")
+
+_DELETE_OLD = text("""
+    DELETE FROM outbox_events
+    WHERE created_at < CURRENT_TIMESTAMP(6) - INTERVAL :hours HOUR
+    ORDER BY id
+    LIMIT 10000
+""")
+
+# Верхняя граница id без ограничения
+_NO_LIMIT = 2 ** 63 - 1
+
+
+def _event(row) -> Dict[str, Any]:
+    payload = row.payload
+    if isinstance(payload, (str, bytes)):
+        payload = json.loads(payload)
+    return {
+        'id': row.id,
+        'type': row.event_type,
+        'product_id': row.product_id,
+        'created_at': row.created_at.isoformat(),
+        **payload,
+    }
+
+
+def fetch_events(after_id: int, up_to: int = _NO_LIMIT, limit: int = OUTBOX_BATCH) -> List[Dict[str, Any]]:
+    with engine.connect() as conn:
+        rows = conn.execute(_EVENTS_AFTER, {'after_id': after_id, 'up_to': up_to, 'limit': limit}).fetchall()
+    return [_event(row) for row in rows]
+
+
+def _max_id() -> int:
+    with engine.connect() as conn:
+        return conn.execute(_MAX_ID).scalar()
+
+
+def oldest_id() -> Optional[int]:
+    with engine.connect() as conn:
+        return conn.execute(_MIN_ID).scalar()
+
+
+def _delete_old() -> int:
+    deleted = 0
+    with engine.connect() as conn:
+        while True:
+            count = conn.execute(_DELETE_OLD, {'hours': OUTBOX_RETENTION_HOURS}).rowcount
+            conn.commit()
+            deleted += count
+            if count < 10000:
+                return deleted
+
+
+class Subscriber:
+    def __init__(self, types: Optional[Set[str]], product_ids: Optional[Set[int]]):
+        self.types = types
+        self.product_ids = product_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=OUTBOX_SUBSCRIBER_QUEUE)
+        # Очередь переполнилась: после ее разбора поток закрывается,
+        # клиент переподключается с Last-Event-ID и получает пропущенное из таблицы
+        self.overflowed = False
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        return (
+            (self.types is None or event['type'] in self.types)
+            and (self.product_ids is None or event['product_id'] in self.product_ids)
+        )
+
+
+class EventBroker:
+    def __init__(self):
+        self.last_id = 0
+        self._subscribers: Set[Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._gap_since: Optional[float] = None
+        self._last_cleanup = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        # Живым подписчикам - только события после запуска
+        self.last_id = await asyncio.to_thread(_max_id)
+        self._last_cleanup = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def subscribe(self, types: Optional[Set[str]] = None, product_ids: Optional[Set[int]] = None) -> Subscriber:
+        subscriber = Subscriber(types, product_ids)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'running': self.running, 'last_id': self.last_id, 'subscribers': len(self._subscribers)}
+
+    def _deliverable(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """События до первого пропуска в id (пропуск ждем не дольше OUTBOX_GAP_TIMEOUT)"""
+        ready = []
+        expected = self.last_id + 1
+        for event in events:
+            if event['id'] != expected:
+                now = time.monotonic()
+                if self._gap_since is None:
+                    self._gap_since = now
+                if now - self._gap_since < OUTBOX_GAP_TIMEOUT:
+                    break
+            self._gap_since = None
+            ready.append(event)
+            expected = event['id'] + 1
+        return ready
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        invalidate_product(event['product_id'])
+        for subscriber in list(self._subscribers):
+            if subscriber.overflowed or not subscriber.matches(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+
+    async def _poll(self) -> int:
+        events = self._deliverable(await asyncio.to_thread(fetch_events, self.last_id))
+        for event in events:
+            self._publish(event)
+            self.last_id = event['id']
+        return len(events)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delivered = await self._poll()
+                if time.monotonic() - self._last_cleanup > _CLEANUP_INTERVAL:
+                    self._last_cleanup = time.monotonic()
+                    deleted = await asyncio.to_thread(_delete_old)
+                    if deleted:
+                        logger.info("events: удалено старых событий - %d", deleted)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                delivered = 0
+                logger.exception("events: ошибка чтения outbox_events")
+            # Полная пачка - читаем дальше сразу
+            if delivered < OUTBOX_BATCH:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+broker = EventBroker()
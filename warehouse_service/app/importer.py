@@ -0,0 +1,304 @@
+"""
+Потоковый импорт каталога термокружек из CSV или NDJSON.
+
+Строки проверяются схемой ProductCreateThermocup (category_id - категория
+термокружек, app/categories.py) и записываются пачками:
+одна многострочная вставка в products, одна в product_attributes_thermocups
+и одна в product_stocks на пачку. Ошибочные строки попадают в отчет и не
+прерывают загрузку; каждая пачка фиксируется отдельно.
+
+Запуск из командной строки:
+    python -m app.importer catalog.csv
+    python -m app.importer catalog.ndjson --batch-size 1000
+"""
+import argparse
+import codecs
+import csv
+import json
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.categories import CATEGORIES
+from app.models import ProductCreateThermocup
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+ATTRIBUTE_FIELDS = ('volume_ml', 'color', 'brand', 'model', 'is_hermetic', 'material')
+
+
+class ImportFormatError(ValueError):
+    """Файл не удалось разобрать как CSV/NDJSON"""
+
+
+# ==================== Разбор входного потока ====================
+
+def iter_text_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Разбить поток байтов (UTF-8, допускается BOM) на строки с '\\n' на конце"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line + '\n'
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer
+
+
+def _nest_attributes(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Плоская строка (CSV) -> структура ProductCreateThermocup"""
+    if 'attributes' in row:
+        return row
+    item = {key: value for key, value in row.items() if key not in ATTRIBUTE_FIELDS}
+    item['attributes'] = {key: row.get(key) for key in ATTRIBUTE_FIELDS if key in row}
+    return item
+
+
+def iter_rows(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Выдать (номер строки, данные, ошибка разбора) по каждой записи файла.
+
+    Номер строки - номер записи в файле, начиная с 1 (заголовок CSV не считается).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row_no, row in enumerate(reader, start=1):
+            if None in row:
+                yield row_no, None, "Лишние значения в строке"
+                continue
+            # Пустая ячейка CSV - значение не указано
+            row = {key: (value if value != '' else None) for key, value in row.items()}
+            yield row_no, _nest_attributes(row), None
+    elif fmt == 'ndjson':
+        row_no = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            row_no += 1
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield row_no, None, f"Некорректный JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield row_no, None, "Ожидается JSON-объект"
+                continue
+            yield row_no, _nest_attributes(row), None
+    else:
+        raise ImportFormatError(f"Неизвестный формат: {fmt}")
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+# ==================== Запись в БД ====================
+
+def _multirow_insert(table: str, columns: Tuple[str, ...], rows: List[Dict[str, Any]]):
+    """INSERT с одним VALUES (...) на каждую строку: один запрос на пачку"""
+    values = []
+    params = {}
+    for index, row in enumerate(rows):
+        placeholders = []
+        for column in columns:
+            name = f"{column}_{index}"
+            placeholders.append(f":{name}")
+            params[name] = row[column]
+        values.append(f"({', '.join(placeholders)})")
+    statement = text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(values)}")
+    return statement, params
+
+
+_PRODUCT_COLUMNS = ('name', 'category_id', 'base_price', 'path_to_photo', 'total_quantity')
+_ATTRIBUTE_COLUMNS = ('product_id',) + ATTRIBUTE_FIELDS
+_STOCK_COLUMNS = ('product_id', 'warehouse_id', 'quantity')
+
+
+class ThermocupImporter:
+    """Накопление проверенных строк и запись их пачками"""
+
+    def __init__(self, db: Session, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.batch: List[Tuple[int, ProductCreateThermocup]] = []
+        self.total_rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        # Справочники маленькие - проверяем ссылки без обращения к БД на каждую строку
+        self.category_names = {row.id: row.name for row in db.execute(text("SELECT id, name FROM categories"))}
+        self.warehouse_ids = {row.id for row in db.execute(text("SELECT id FROM warehouses"))}
+
+    def error(self, row_no: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_no, 'error': message})
+
+    def add(self, row_no: int, data: Optional[Dict[str, Any]], parse_error: Optional[str] = None) -> None:
+        self.total_rows += 1
+        if parse_error is not None:
+            self.error(row_no, parse_error)
+            return
+
+        try:
+            item = ProductCreateThermocup.model_validate(data)
+        except ValidationError as e:
+            self.error(row_no, _validation_message(e))
+            return
+
+        # Как у POST /catalog/thermocups/products: category_id - категория термокружек
+        category = CATEGORIES['thermocups']
+        if item.category_id not in self.category_names:
+            self.error(row_no, "Указанная категория не существует")
+            return
+        if self.category_names[item.category_id] != category.db_name:
+            self.error(row_no, f"category_id {item.category_id} не относится к категории '{category.name}'")
+            return
+        if item.warehouse_id is not None and item.warehouse_id not in self.warehouse_ids:
+            self.error(row_no, "Указанный склад не существует")
+            return
+
+        self.batch.append((row_no, item))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Записать накопленную пачку и зафиксировать транзакцию"""
+        if not self.batch:
+            return
+
+        batch, self.batch = self.batch, []
+        try:
+            self._insert_batch(batch)
+            self.db.commit()
+            self.imported += len(batch)
+        except Exception:
+            self.db.rollback()
+            # Пачка не прошла (дубликат, нарушение ограничения и т.п.) -
+            # повторяем построчно, чтобы отсечь только ошибочные строки
+            for row_no, item in batch:
+                try:
+                    self._insert_batch([(row_no, item)])
+                    self.db.commit()
+                    self.imported += 1
+                except Exception as e:
+                    self.db.rollback()
+                    self.error(row_no, str(e))
+
+    def _insert_batch(self, batch: List[Tuple[int, ProductCreateThermocup]]) -> None:
+        products = []
+        for _, item in batch:
+            # Как в AddProductQuantity: остаток создается только при quantity > 0
+            has_stock = item.warehouse_id is not None and (item.initial_quantity or 0) > 0
+            products.append({
+                'name': item.name,
+                'category_id': item.category_id,
+                'base_price': item.base_price,
+                'path_to_photo': item.path_to_photo,
+                'total_quantity': item.initial_quantity if has_stock else 0,
+            })
+
+        statement, params = _multirow_insert('products', _PRODUCT_COLUMNS, products)
+        first_id = self.db.execute(statement, params).lastrowid
+        product_ids = self._inserted_ids(first_id, [product['name'] for product in products])
+
+        attributes = []
+        stocks = []
+        for product_id, (_, item) in zip(product_ids, batch):
+            attributes.append({
+                'product_id': product_id,
+                'volume_ml': item.attributes.volume_ml,
+                'color': item.attributes.color,
+                'brand': item.attributes.brand,
+                'model': item.attributes.model or '',
+                'is_hermetic': 1 if item.attributes.is_hermetic else 0,
+                'material': item.attributes.material or '',
+            })
+            if item.warehouse_id is not None and (item.initial_quantity or 0) > 0:
+                stocks.append({
+                    'product_id': product_id,
+                    'warehouse_id': item.warehouse_id,
+                    'quantity': item.initial_quantity,
+                })
+
+        self.db.execute(*_multirow_insert('product_attributes_thermocups', _ATTRIBUTE_COLUMNS, attributes))
+        if stocks:
+            self.db.execute(*_multirow_insert('product_stocks', _STOCK_COLUMNS, stocks))
+
+    def _inserted_ids(self, first_id: int, names: List[str]) -> List[int]:
+        """
+        ID строк многострочной вставки.
+
+        InnoDB выдает одному INSERT последовательные id, но при
+        innodb_autoinc_lock_mode=2 это не гарантировано под параллельной
+        нагрузкой - поэтому сверяем диапазон с вставленными названиями.
+        При несовпадении пачка откатывается и повторяется построчно.
+        """
+        last_id = first_id + len(names) - 1
+        rows = self.db.execute(
+            text("SELECT id, name FROM products WHERE id BETWEEN :first_id AND :last_id ORDER BY id"),
+            {'first_id': first_id, 'last_id': last_id}
+        ).fetchall()
+        if [row.name for row in rows] != names:
+            raise RuntimeError("Неподряд идущие id во вставленной пачке")
+        return [row.id for row in rows]
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'total_rows': self.total_rows,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def import_thermocups(db: Session, lines: Iterable[str], fmt: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, Any]:
+    """Импортировать термокружки из строк файла; вернуть отчет"""
+    importer = ThermocupImporter(db, batch_size=batch_size)
+    for row_no, data, parse_error in iter_rows(lines, fmt):
+        importer.add(row_no, data, parse_error)
+    importer.flush()
+    return importer.report()
+
+
+def detect_format(filename: str) -> str:
+    if filename.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+def main(argv=None) -> int:
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Импорт каталога термокружек")
+    parser.add_argument("path", help="CSV или NDJSON файл")
+    parser.add_argument("--format", choices=FORMATS, help="Формат файла (по умолчанию - по расширению)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Строк в одной пачке")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.path)
+
+    db = SessionLocal()
+    try:
+        with open(args.path, encoding='utf-8-sig', newline='') as f:
+            report = import_thermocups(db, f, fmt, batch_size=args.batch_size)
+    finally:
+        db.close()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
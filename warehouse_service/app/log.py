@@ -0,0 +1,159 @@
+"""
+Структурное логирование без блокировки обработчиков запросов.
+
+Обработчик запроса только кладет запись в ограниченную очередь
+(QueueHandler, put_nowait); форматирование в JSON и запись в stdout
+делает отдельный поток QueueListener. Если очередь переполнена (stdout
+не успевает), запись отбрасывается и учитывается в метрике
+warehouse_log_dropped_total - запрос никогда не ждет логгер.
+
+Каждая запись получает request_id текущего запроса (заголовок X-Request-ID
+или сгенерированный). Частые записи об успехе помечаются extra={'sampled': True}
+и пишутся с вероятностью LOG_SUCCESS_SAMPLE_RATE.
+
+Переменные окружения:
+    LOG_LEVEL                - уровень (INFO)
+    LOG_FORMAT               - json или text (json)
+    LOG_QUEUE_SIZE           - размер очереди записей (10000)
+    LOG_SUCCESS_SAMPLE_RATE  - доля записываемых sampled-записей, 0..1 (1.0)
+"""
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from app.metrics import Counter, registry
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv('LOG_SUCCESS_SAMPLE_RATE', '1.0'))
+
+REQUEST_ID_HEADER = 'x-request-id'
+
+request_id_var: ContextVar[str] = ContextVar('request_id', default='-')
+
+log_dropped = registry.register(Counter(
+    'warehouse_log_dropped_total',
+    'Log records dropped because the log queue was full',
+))
+
+# Атрибуты LogRecord - все остальное в record.__dict__ пришло из extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'sampled'}
+
+
+class RequestContextFilter(logging.Filter):
+    """Проставить request_id и отсеять sampled-записи (в потоке запроса)"""
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'sampled', False) and self.sample_rate < 1.0:
+            if random.random() >= self.sample_rate:
+                return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который отбрасывает запись вместо ожидания места в очереди"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_dropped.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging() -> None:
+    """Подключить очередь к логгеру приложения и запустить поток записи"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == 'text':
+        stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+    else:
+        stream.setFormatter(JsonFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    handler.addFilter(RequestContextFilter(LOG_SUCCESS_SAMPLE_RATE))
+
+    logger = logging.getLogger('app')
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Дописать оставшиеся записи и остановить поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """ASGI-middleware: request_id из X-Request-ID (или новый) и тот же заголовок в ответе"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope['headers']:
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode('latin-1')[:128]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message.setdefault('headers', [])
+                message['headers'] = list(message['headers']) + [(REQUEST_ID_HEADER.encode(), request_id.encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,14 +1,47 @@
+import asyncio
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
-from app.database import engine, Base
-from app.routers import products
+from app.database import engine, DB_ASYNC, async_engine, SessionLocal, replica_engine, async_replica_engine
+from app.bootstrap import bootstrap
+from app.log import RequestIdMiddleware, setup_logging, shutdown_logging
+from app.metrics import MetricsMiddleware, instrument_engine, registry
+from app.events import broker
+from app.replica import ReadYourWritesMiddleware, run_replica_monitor
+from app.reservations import RESERVATION_SWEEP_INTERVAL, run_reserved_sync, run_sweeper
+from app.routers import products, catalog, stock, orders, reservations, events, imports, internal, export
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Создаем таблицы при запуске (в продакшене лучше использовать миграции)
-    Base.metadata.create_all(bind=engine)
+    setup_logging()
+    # Таблицы, индексы и процедуры из db_storaged_procedures: только изменившиеся
+    # объекты, без изменений - одна проверка контрольной суммы. Базовые таблицы
+    # тоже там (Base.metadata пуст - модели app/schemas.py не импортируются)
+    bootstrap(engine)
+    # Снятие истекших резервов (app/reservations.py)
+    sweeper = asyncio.create_task(run_sweeper(SessionLocal)) if RESERVATION_SWEEP_INTERVAL > 0 else None
+    # Копия резерва в products.num_reserved_goods (app/reservations.py)
+    reserved_sync = asyncio.create_task(run_reserved_sync(SessionLocal))
+    # Раздача событий outbox_events подписчикам GET /events/stream
+    await broker.start()
+    # Отставание реплики для чтения (app/replica.py)
+    replica_monitor = asyncio.create_task(run_replica_monitor(replica_engine)) if replica_engine is not None else None
     yield
+    if replica_monitor is not None:
+        replica_monitor.cancel()
+    await broker.stop()
+    if sweeper is not None:
+        sweeper.cancel()
+    # Отмененная задача успевает скопировать последние изменения резерва
+    reserved_sync.cancel()
+    await asyncio.gather(reserved_sync, return_exceptions=True)
     # Действия при остановке приложения
+    if async_engine is not None:
+        await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+    shutdown_logging()
 
 app = FastAPI(
     title="Warehouse Goods Service",
@@ -17,8 +50,36 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Метрики: время запросов по маршрутам и время вызова хранимых процедур
+app.add_middleware(MetricsMiddleware)
+# X-Request-ID: сквозной идентификатор запроса в логах и ответе
+app.add_middleware(RequestIdMiddleware)
+# Чтения клиента сразу после его записи - с основной БД, а не с реплики
+app.add_middleware(ReadYourWritesMiddleware)
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+if replica_engine is not None:
+    instrument_engine(replica_engine)
+if async_replica_engine is not None:
+    instrument_engine(async_replica_engine.sync_engine)
+
 # Подключаем роутеры
-app.include_router(products.router)
+# export - до products: иначе /products/export перехватит /products/{product_id}
+app.include_router(export.router)
+# DB_ASYNC=true - те же эндпоинты товаров, но на async-сессиях
+if DB_ASYNC:
+    from app.routers import products_async
+    app.include_router(products_async.router)
+else:
+    app.include_router(products.router)
+app.include_router(catalog.router)
+app.include_router(stock.router)
+app.include_router(orders.router)
+app.include_router(reservations.router)
+app.include_router(events.router)
+app.include_router(imports.router)
+app.include_router(internal.router)
 
 @app.get("/")
 def read_root():
@@ -28,6 +89,10 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Метрики сервиса в текстовом формате Prometheus (GET /metrics).
+
+Собирается:
+    warehouse_http_request_duration_seconds   - гистограмма по шаблону маршрута,
+                                                методу и статусу ответа
+    warehouse_db_procedure_duration_seconds   - гистограмма каждого CALL <процедура>
+    warehouse_db_procedure_rows_total         - строк вернула/затронула процедура
+    warehouse_db_procedure_errors_total       - ошибки при вызове процедуры
+
+Без внешних зависимостей: запись в метрику - bisect по границам корзин и
+инкремент под блокировкой, поэтому метрики можно держать включенными.
+Маршрут берется шаблоном (/products/{product_id}), а не фактическим путем,
+чтобы число рядов не росло с числом товаров.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+from sqlalchemy import event
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_CALL_RE = re.compile(r"^\s*CALL\s+`?(\w+)", re.IGNORECASE)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = HTTP_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label_values -> [счетчики по корзинам (+Inf последней), сумма]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for label_values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    'warehouse_http_request_duration_seconds',
+    'HTTP request latency by route template, method and status',
+    labels=('route', 'method', 'status'),
+    buckets=HTTP_BUCKETS,
+))
+db_procedure_duration = registry.register(Histogram(
+    'warehouse_db_procedure_duration_seconds',
+    'Stored procedure call latency',
+    labels=('procedure',),
+    buckets=DB_BUCKETS,
+))
+db_procedure_rows = registry.register(Counter(
+    'warehouse_db_procedure_rows_total',
+    'Rows returned or affected by stored procedure calls',
+    labels=('procedure',),
+))
+db_procedure_errors = registry.register(Counter(
+    'warehouse_db_procedure_errors_total',
+    'Failed stored procedure calls',
+    labels=('procedure',),
+))
+
+
+# ==================== HTTP ====================
+
+class MetricsMiddleware:
+    """ASGI-middleware: время запроса до отправки последнего байта ответа"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status_code[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            # Путь без найденного маршрута (404) не пишем как есть - иначе ряды без предела
+            template = getattr(route, 'path', None) or 'unmatched'
+            http_request_duration.observe(
+                time.perf_counter() - started, template, scope['method'], str(status_code[0])
+            )
+
+
+# ==================== Хранимые процедуры ====================
+
+def _procedure_name(statement: str):
+    match = _CALL_RE.match(statement)
+    return match.group(1) if match else None
+
+
+def instrument_engine(sync_engine) -> None:
+    """Подписаться на выполнение запросов движка (для async - async_engine.sync_engine)"""
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        procedure = _procedure_name(statement)
+        if procedure is not None and context is not None:
+            context.metrics_call = (procedure, time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        call = getattr(context, 'metrics_call', None)
+        if call is None:
+            return
+        procedure, started = call
+        db_procedure_duration.observe(time.perf_counter() - started, procedure)
+        if cursor.rowcount is not None and cursor.rowcount > 0:
+            db_procedure_rows.inc(procedure, amount=cursor.rowcount)
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def _error(exception_context):
+        call = getattr(exception_context.execution_context, 'metrics_call', None)
+        if call is None:
+            return
+        procedure, started = call
+        db_procedure_duration.observe(time.perf_counter() - started, procedure)
+        db_procedure_errors.inc(procedure)
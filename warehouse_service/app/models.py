@@ -2,7 +2,7 @@
 from pydantic import BaseModel, Field
 from decimal import Decimal
 from datetime import datetime
-from typing import Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 
 # Базовые схемы для создания
@@ -55,6 +55,22 @@ class ProductCreateBase(BaseModel):
 class ProductCreateThermocup(ProductCreateBase):
     attributes: ThermocupAttributes
 
+class CatalogProductCreate(ProductCreateBase):
+    # Проверяются схемой атрибутов категории (app/categories.py)
+    attributes: Dict[str, Any]
+
+# ==================== Import ===============================
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    total_rows: int
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+    errors_truncated: bool = False
+
 # ==================== Update ===============================
 class ProductUpdateBase(BaseModel):
     name: Optional[str] = None
@@ -76,6 +92,24 @@ class ThermocupAttributesUpdate(BaseModel):
 class ProductUpdateThermocup(ProductUpdateBase):
     attributes: Optional[ThermocupAttributesUpdate] = None
 
+class ServerAttributesUpdate(BaseModel):
+    ram_gb: Optional[int] = None
+    cpu_model: Optional[str] = None
+    cpu_cores: Optional[int] = None
+    hdd_size_gb: Optional[int] = None
+    ssd_size_gb: Optional[int] = None
+    form_factor: Optional[str] = None
+    manufacturer: Optional[str] = None
+
+class CatalogProductUpdate(BaseModel):
+    name: Optional[str] = None
+    category_id: Optional[int] = None
+    base_price: Optional[float] = None
+    sku: Optional[str] = None
+    is_active: Optional[bool] = None
+    path_to_photo: Optional[str] = None
+    attributes: Optional[Dict[str, Any]] = None
+
 class UpdateReservedGoodsRequest(BaseModel):
     quantity_change: int
 
@@ -83,6 +117,49 @@ class UpdateStockQuantityRequest(BaseModel):
     warehouse_id: int
     quantity_change: int
 
+class StockAdjustmentLine(BaseModel):
+    product_id: int
+    warehouse_id: int
+    quantity_change: int
+
+class BatchStockAdjustmentRequest(BaseModel):
+    lines: List[StockAdjustmentLine] = Field(..., min_length=1, max_length=5000)
+
+class StockAdjustmentResult(BaseModel):
+    line: int
+    product_id: int
+    warehouse_id: int
+    quantity_change: int
+    product_name: Optional[str] = None
+    warehouse_name: Optional[str] = None
+    # applied / rejected / not_applied (пакет отклонен из-за других строк)
+    status: str
+    error: Optional[str] = None
+    current_quantity: Optional[int] = None
+    total_quantity_all_warehouses: Optional[int] = None
+
+class BatchStockAdjustmentResponse(BaseModel):
+    applied: bool
+    results: List[StockAdjustmentResult]
+
+class StockMatrixRequest(BaseModel):
+    product_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class StockMatrixWarehouse(BaseModel):
+    id: int
+    name: str
+
+class StockMatrixRow(BaseModel):
+    product_id: int
+    total_quantity: int
+    # warehouse_id -> количество; склады без остатка не перечисляются
+    quantities: Dict[int, int]
+
+class StockMatrixResponse(BaseModel):
+    warehouses: List[StockMatrixWarehouse]
+    products: List[StockMatrixRow]
+    missing_product_ids: List[int]
+
 class ReservedGoodsResponse(BaseModel):
     id: int
     name: str
@@ -90,6 +167,36 @@ class ReservedGoodsResponse(BaseModel):
     total_quantity: int
     available_quantity: int
 
+class OrderReservationLine(BaseModel):
+    product_id: int
+    quantity: int = Field(..., gt=0)
+
+class OrderReservationRequest(BaseModel):
+    order_id: Optional[str] = None
+    lines: List[OrderReservationLine] = Field(..., min_length=1, max_length=500)
+
+class OrderReservationResponse(BaseModel):
+    order_id: Optional[str] = None
+    lines: List[ReservedGoodsResponse]
+
+class ReservationCreateRequest(BaseModel):
+    product_id: int
+    quantity: int = Field(..., gt=0)
+    owner: str = Field(..., min_length=1, max_length=255)
+    # Время жизни резерва; по умолчанию RESERVATION_TTL
+    ttl_seconds: Optional[int] = Field(None, gt=0, le=7 * 24 * 3600)
+
+class ReservationResponse(BaseModel):
+    id: int
+    product_id: int
+    owner: str
+    quantity: int
+    # active / confirmed / cancelled / expired / fulfilled
+    status: str
+    expires_at: datetime
+    created_at: datetime
+    updated_at: datetime
+
 class StockQuantityResponse(BaseModel):
     product_id: int
     product_name: str
@@ -117,6 +224,43 @@ class ProductResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ProductLookupRequest(BaseModel):
+    ids: List[int] = Field(default_factory=list, max_length=500)
+    skus: List[str] = Field(default_factory=list, max_length=500)
+
+class ProductLookupResponse(BaseModel):
+    # id -> товар
+    products: Dict[int, ProductResponse]
+    missing_ids: List[int]
+    missing_skus: List[str]
+
+class ProductSearchResponse(ProductResponse):
+    relevance: float
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min_price: float
+    max_price: float
+    count: int
+
+class ProductFacetsResponse(BaseModel):
+    total: int
+    categories: List[FacetValue]
+    brands: List[FacetValue]
+    colors: List[FacetValue]
+    materials: List[FacetValue]
+    volumes: List[FacetValue]
+    price_histogram: List[PriceBucket]
+    hermetic: List[FacetValue]
+
+class WarehouseStock(BaseModel):
+    warehouse_id: int
+    warehouse_name: str
+    quantity: int
+
 class ThermocupResponse(ProductResponse):
     # Специфичные атрибуты термокружки
     volume_ml: int
@@ -126,4 +270,14 @@ class ThermocupResponse(ProductResponse):
     is_hermetic: bool
     material: Optional[str] = None
     # Информация по складам
-    warehouse_info: Optional[str] = None
\ No newline at end of file
+    warehouse_info: Optional[str] = None
+    warehouses: List[WarehouseStock] = []
+
+class CatalogProductResponse(ProductResponse):
+    # Атрибуты категории; None - у категории нет таблицы атрибутов в реестре
+    attributes: Optional[Dict[str, Any]] = None
+
+class CatalogCategoryResponse(BaseModel):
+    name: str
+    # JSON Schema атрибутов для создания товара
+    attributes: Dict[str, Any]
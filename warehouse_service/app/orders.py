@@ -0,0 +1,98 @@
+"""
+Резервирование товаров под заказ: все строки заказа атомарно, целиком или никак.
+
+Счетчики резерва товаров (app/reservations.py) блокируются одним запросом
+в порядке id (как и в пакетном изменении остатков), доступность проверяется
+по заблокированным значениям, затем резерв прибавляется одним запросом.
+Параллельные резервы того же товара выстраиваются в очередь на блокировке
+счетчика и видят уже обновленный резерв - перепродажи нет. Строки products
+не блокируются и не меняются.
+
+Каждый товар заказа записывается в журнал резервов (app/reservations.py)
+подтвержденным резервом владельца order:<order_id> - одной вставкой на
+заказ; снимается при отгрузке (POST /reservations/{id}/fulfil).
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.reservations import add_reserved, lock_reserved
+
+PRODUCT_NOT_FOUND = "Product not found"
+NOT_ENOUGH_GOODS = "Not enough available goods to reserve"
+
+_INSERT_RESERVATIONS = text("""
+    INSERT INTO reservations (product_id, owner, quantity, status, expires_at)
+    SELECT l.product_id, :owner, l.quantity, 'confirmed', CURRENT_TIMESTAMP(6)
+    FROM JSON_TABLE(:lines, '$[*]' COLUMNS (
+        product_id INT PATH '$.product_id',
+        quantity INT PATH '$.quantity'
+    )) l
+""")
+
+
+def order_owner(order_id: Optional[str]) -> str:
+    """Владелец резервов заказа в журнале"""
+    return f"order:{order_id}"[:255] if order_id else "order"
+
+
+class ReservationError(Exception):
+    """Заказ не может быть зарезервирован; lines - разбор по строкам"""
+
+    def __init__(self, lines: List[Dict[str, Any]]):
+        super().__init__(NOT_ENOUGH_GOODS)
+        self.lines = lines
+
+
+def _merge_lines(lines: Sequence[Tuple[int, int]]) -> Dict[int, int]:
+    """Сложить строки с одинаковым товаром"""
+    merged: Dict[int, int] = {}
+    for product_id, quantity in lines:
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return dict(sorted(merged.items()))
+
+
+def reserve_order_lines(db: Session, lines: Sequence[Tuple[int, int]], owner: str = "order") -> List[Dict[str, Any]]:
+    """
+    Зарезервировать строки заказа (product_id, quantity).
+
+    Возвращает итоговые total/reserved/available по каждому товару.
+    Если хоть одну строку зарезервировать нельзя, ничего не записывает и
+    бросает ReservationError. Транзакцию завершает вызывающий код.
+    """
+    requested = _merge_lines(lines)
+
+    products = lock_reserved(db, requested)
+
+    problems = []
+    for product_id, quantity in requested.items():
+        product = products.get(product_id)
+        if product is None:
+            problems.append({'product_id': product_id, 'requested': quantity, 'available': None, 'error': PRODUCT_NOT_FOUND})
+            continue
+
+        available = product['total_quantity'] - product['reserved_quantity']
+        if quantity > available:
+            problems.append({'product_id': product_id, 'requested': quantity, 'available': available, 'error': NOT_ENOUGH_GOODS})
+
+    if problems:
+        raise ReservationError(problems)
+
+    add_reserved(db, requested)
+    payload = json.dumps([{'product_id': product_id, 'quantity': quantity} for product_id, quantity in requested.items()])
+    db.execute(_INSERT_RESERVATIONS, {'lines': payload, 'owner': owner})
+
+    reserved = []
+    for product_id, quantity in requested.items():
+        product = products[product_id]
+        reserved_quantity = product['reserved_quantity'] + quantity
+        reserved.append({
+            'id': product_id,
+            'name': product['name'],
+            'reserved_quantity': reserved_quantity,
+            'total_quantity': product['total_quantity'],
+            'available_quantity': product['total_quantity'] - reserved_quantity,
+        })
+    return reserved
@@ -0,0 +1,64 @@
+import base64
+import binascii
+import hashlib
+import json
+from typing import Any, Dict, Mapping
+
+
+class InvalidCursorError(ValueError):
+    """Курсор повреждён или выдан для другого набора фильтров"""
+
+
+def filters_fingerprint(filters: Mapping[str, Any]) -> str:
+    """
+    Короткий отпечаток набора фильтров.
+
+    Зашивается в курсор, чтобы курсор, полученный с одними фильтрами,
+    нельзя было продолжить с другими (получились бы пропуски/дубли).
+    """
+    raw = json.dumps(dict(filters), sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(row: Mapping[str, Any], filters: Mapping[str, Any]) -> str:
+    """
+    Собрать курсор по последней строке страницы.
+
+    Курсор содержит ключи сортировки GetProducts
+    (is_active, total_quantity, name, id) и непрозрачен для клиента.
+    """
+    payload = {
+        "a": 1 if row["is_active"] else 0,
+        "q": int(row["total_quantity"]),
+        "n": row["name"],
+        "i": int(row["id"]),
+        "f": filters_fingerprint(filters),
+    }
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, filters: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Разобрать курсор в параметры процедуры GetProductsAfterCursor.
+
+    Бросает InvalidCursorError, если курсор не читается или был выдан
+    для других фильтров.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        after = {
+            "after_is_active": bool(payload["a"]),
+            "after_total_quantity": int(payload["q"]),
+            "after_name": str(payload["n"]),
+            "after_id": int(payload["i"]),
+        }
+        fingerprint = payload["f"]
+    except (ValueError, KeyError, TypeError, UnicodeError, binascii.Error):
+        raise InvalidCursorError("Некорректный курсор")
+
+    if fingerprint != filters_fingerprint(filters):
+        raise InvalidCursorError("Курсор выдан для другого набора фильтров")
+
+    return after
@@ -0,0 +1,169 @@
+"""
+Настройка и статистика пула соединений с БД.
+
+Параметры пула задаются переменными окружения (рядом с DB_HOST/DB_USER/...):
+    DB_POOL_SIZE       - постоянных соединений в пуле (по умолчанию 5)
+    DB_MAX_OVERFLOW    - сколько соединений можно открыть сверх пула (10)
+    DB_POOL_TIMEOUT    - сколько секунд ждать свободное соединение (30)
+    DB_POOL_RECYCLE    - пересоздавать соединение старше N секунд (-1 - никогда)
+    DB_POOL_PRE_PING   - проверять соединение запросом перед выдачей (true).
+                         false экономит лишний round trip на каждый запрос;
+                         тогда DB_POOL_RECYCLE стоит поставить меньше wait_timeout MySQL.
+
+Пулы обоих движков (sync и async) считают время ожидания свободного
+соединения и возраст открытых соединений - см. GET /internal/pool.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def pool_options() -> Dict[str, Any]:
+    """Аргументы create_engine для пула из переменных окружения"""
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', -1),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+
+
+class PoolStats:
+    """Счетчики пула: ожидание при выдаче соединения и возраст соединений"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.closes = 0
+        # id записи пула -> момент открытия соединения
+        self._opened: Dict[int, float] = {}
+
+    def observe_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+            # Быстрая выдача из очереди - не ожидание
+            if seconds >= 0.001:
+                self.waits += 1
+
+    def opened(self, record) -> None:
+        with self._lock:
+            self.connects += 1
+            self._opened[id(record)] = time.monotonic()
+
+    def closed(self, record) -> None:
+        with self._lock:
+            if self._opened.pop(id(record), None) is not None:
+                self.closes += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - opened for opened in self._opened.values()]
+            return {
+                'checkouts': self.checkouts,
+                'checkouts_waited': self.waits,
+                'checkout_timeouts': self.timeouts,
+                'checkout_wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'checkout_wait_max_ms': round(self.wait_max * 1000, 3),
+                'connections_opened': self.connects,
+                'connections_closed': self.closes,
+                'connection_age_max_s': round(max(ages), 1) if ages else 0.0,
+                'connection_age_avg_s': round(sum(ages) / len(ages), 1) if ages else 0.0,
+            }
+
+
+class _InstrumentedPoolMixin:
+    """Замер времени ожидания соединения в _do_get (включая таймауты)"""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.observe_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.observe_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() пересоздает пул - статистику переносим в новый
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_pool(sync_engine) -> None:
+    """Подключить PoolStats к пулу движка (для async - к async_engine.sync_engine)"""
+    stats = PoolStats()
+    sync_engine.pool.stats = stats
+
+    @event.listens_for(sync_engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        sync_engine.pool.stats.opened(connection_record)
+
+    @event.listens_for(sync_engine, 'close')
+    def _on_close(dbapi_connection, connection_record):
+        sync_engine.pool.stats.closed(connection_record)
+
+    @event.listens_for(sync_engine, 'invalidate')
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        sync_engine.pool.stats.closed(connection_record)
+
+
+def pool_status(sync_engine) -> Dict[str, Any]:
+    """Текущее состояние пула движка и накопленная статистика"""
+    pool = sync_engine.pool
+    status = {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        # overflow() отрицателен, пока пул не заполнен: -(свободных мест в пуле)
+        'overflow': max(pool.overflow(), 0),
+        'max_overflow': pool._max_overflow,
+        'timeout_s': pool.timeout(),
+        'recycle_s': pool._recycle,
+        'pre_ping': pool._pre_ping,
+    }
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
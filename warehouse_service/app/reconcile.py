@@ -0,0 +1,64 @@
+"""
+Сверка агрегатов: products.total_quantity - с суммой остатков по складам,
+счетчики резерва (product_reserved_stripes) - с активными и подтвержденными
+резервами журнала. При --fix копия products.num_reserved_goods тоже
+выставляется по журналу.
+
+Запуск:
+    python -m app.reconcile          # только показать расхождения
+    python -m app.reconcile --fix    # показать и исправить
+
+Код возврата 1, если найдены расхождения и они не были исправлены.
+"""
+import argparse
+import sys
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+
+def reconcile_totals(fix: bool = False) -> list:
+    """Вызвать ReconcileProductTotals и вернуть список расхождений"""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            text("CALL ReconcileProductTotals(:fix)"),
+            {'fix': fix}
+        )
+        drift = [dict(row._mapping) for row in result.fetchall()]
+        db.commit()
+        return drift
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Сверка общих остатков и резервов товаров")
+    parser.add_argument("--fix", action="store_true", help="Исправить найденные расхождения")
+    args = parser.parse_args(argv)
+
+    drift = reconcile_totals(fix=args.fix)
+
+    if not drift:
+        print("Расхождений не найдено")
+        return 0
+
+    print(f"Найдено расхождений: {len(drift)}")
+    for row in drift:
+        print(
+            f"  товар {row['product_id']} '{row['name']}' ({row['field']}): "
+            f"записано {row['stored_quantity']}, по источнику {row['actual_quantity']}"
+        )
+
+    if args.fix:
+        print("Расхождения исправлены")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
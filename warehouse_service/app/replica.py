@@ -0,0 +1,177 @@
+"""
+Чтение с реплики: проверка отставания и read-your-writes.
+
+GET-эндпоинты берут сессию из get_read_db / get_async_read_db
+(app/database.py): реплика, если она задана (DB_REPLICA_HOST), исправна и
+запрос не закреплен за основной БД; иначе - основная БД.
+
+Исправность проверяет фоновая задача lifespan раз в REPLICA_CHECK_INTERVAL
+секунд: SHOW REPLICA STATUS (Seconds_Behind_Source). Реплика с отставанием
+больше REPLICA_MAX_LAG, с остановленной репликацией или недоступная
+исключается из чтения до следующей успешной проверки. Пока проверок
+не было, чтение идет с основной БД. Пользователю реплики нужна привилегия
+REPLICATION CLIENT; сервер без настроенной репликации считается без отставания.
+
+Read-your-writes: после успешного изменяющего запроса (POST/PUT/PATCH/DELETE)
+клиент получает cookie и заголовок X-Primary-Until. Пока срок не истек,
+его чтения идут с основной БД. Срок - REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL:
+за это время запись успевает дойти до исправной реплики.
+Клиенты без cookie передают полученное значение заголовком X-Primary-Until.
+
+Кэш карточек товаров (app/cache.py) заполняется только чтениями с основной
+БД, а закрепленный клиент его не читает (routers/common.py: cached_card,
+cache_card): иначе карточка с отстающей реплики отдавалась бы до конца TTL.
+
+Переменные окружения:
+    REPLICA_MAX_LAG         - допустимое отставание реплики, с (5)
+    REPLICA_CHECK_INTERVAL  - период проверки реплики, с (1)
+"""
+import asyncio
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.engine import Engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '5'))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '1'))
+PIN_SECONDS = REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL
+
+PRIMARY_UNTIL_COOKIE = 'primary_until'
+PRIMARY_UNTIL_HEADER = 'X-Primary-Until'
+
+_WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# Запрос закреплен за основной БД (read-your-writes)
+read_primary_var: ContextVar[bool] = ContextVar('read_primary', default=False)
+
+
+class ReplicaState:
+    def __init__(self):
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.reads_replica = 0
+        self.reads_primary = 0
+
+    def use_replica(self) -> bool:
+        use = self.healthy and not read_primary_var.get()
+        if use:
+            self.reads_replica += 1
+        else:
+            self.reads_primary += 1
+        return use
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "lag_s": self.lag,
+            "max_lag_s": REPLICA_MAX_LAG,
+            "error": self.error,
+            "checked_ago_s": round(time.monotonic() - self.checked_at, 3) if self.checked_at else None,
+            "reads_replica": self.reads_replica,
+            "reads_primary": self.reads_primary,
+        }
+
+
+replica_state = ReplicaState()
+
+
+def replica_lag(replica_engine: Engine) -> Optional[float]:
+    """Отставание реплики в секундах; None - репликация остановлена"""
+    with replica_engine.connect() as conn:
+        try:
+            row = conn.exec_driver_sql("SHOW REPLICA STATUS").mappings().fetchone()
+            column = 'Seconds_Behind_Source'
+        except Exception:
+            # MySQL до 8.0.22
+            conn.rollback()
+            row = conn.exec_driver_sql("SHOW SLAVE STATUS").mappings().fetchone()
+            column = 'Seconds_Behind_Master'
+    if row is None:
+        return 0.0
+    lag = row[column]
+    return float(lag) if lag is not None else None
+
+
+def check_replica(replica_engine: Engine) -> None:
+    try:
+        lag = replica_lag(replica_engine)
+        replica_state.lag = lag
+        replica_state.error = None if lag is not None else "replication is not running"
+    except Exception as e:
+        replica_state.lag = None
+        replica_state.error = str(e)
+
+    healthy = replica_state.lag is not None and replica_state.lag <= REPLICA_MAX_LAG
+    if healthy != replica_state.healthy:
+        log = logger.info if healthy else logger.warning
+        log("replica: чтение %s (lag=%s, error=%s)",
+            "с реплики" if healthy else "переключено на основную БД", replica_state.lag, replica_state.error)
+    replica_state.healthy = healthy
+    replica_state.checked_at = time.monotonic()
+
+
+async def run_replica_monitor(replica_engine: Engine) -> None:
+    """Фоновая задача lifespan: проверка отставания реплики"""
+    while True:
+        await asyncio.to_thread(check_replica, replica_engine)
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+
+def _primary_until(scope) -> float:
+    """Срок закрепления из заголовка X-Primary-Until или cookie (больший из двух)"""
+    until = 0.0
+    for name, value in scope['headers']:
+        if name == PRIMARY_UNTIL_HEADER.lower().encode():
+            until = max(until, _parse_float(value.decode('latin-1')))
+        elif name == b'cookie':
+            for part in value.decode('latin-1').split(';'):
+                key, _, cookie_value = part.strip().partition('=')
+                if key == PRIMARY_UNTIL_COOKIE:
+                    until = max(until, _parse_float(cookie_value))
+    return until
+
+
+def _parse_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+class ReadYourWritesMiddleware:
+    """ASGI-middleware: закрепление чтений за основной БД после записи клиента"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        token = read_primary_var.set(_primary_until(scope) > time.time())
+        is_write = scope['method'] in _WRITE_METHODS
+
+        async def send_wrapper(message):
+            if is_write and message['type'] == 'http.response.start' and message['status'] < 400:
+                until = f"{time.time() + PIN_SECONDS:.3f}"
+                message['headers'] = list(message.get('headers', [])) + [
+                    (PRIMARY_UNTIL_HEADER.encode(), until.encode()),
+                    (b'set-cookie', f"{PRIMARY_UNTIL_COOKIE}={until}; Max-Age={int(PIN_SECONDS) + 1}; Path=/; HttpOnly; SameSite=Lax".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            read_primary_var.reset(token)
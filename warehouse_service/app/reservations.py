@@ -0,0 +1,414 @@
+"""
+Журнал резервов: у каждого резерва свой id, владелец, количество и срок жизни.
+
+Доступно = total_quantity - резерв товара. Резерв товара - сумма счетчиков
+product_reserved_stripes, а не products.num_reserved_goods: резервы и их
+снятие строку products не пишут и не блокируют (ее же меняют остатки, цены
+и триггер outbox, ее читают списки и карточки). Счетчики всегда равны сумме
+активных и подтвержденных резервов журнала - меняются в той же транзакции.
+
+Счетчик 0 товара - точка сериализации резервирования: резерв (здесь,
+POST /orders/reserve, PATCH .../reserved) блокирует его, читает сумму
+счетчиков и прибавляет к нему количество - перепродажи нет. Снятие резерва
+(отмена, истечение, отгрузка) уменьшает случайный счетчик 1..RESERVED_STRIPES-1
+без проверки и не ждет резервирующих. Прочитанные резервирующим без
+блокировки счетчики снятия могут быть только больше текущих - проверка
+доступности от этого лишь строже.
+
+products.num_reserved_goods - копия суммы счетчиков для чтения (списки,
+карточки, ETag, события outbox). Ее обновляет фоновая задача
+run_reserved_sync: товары, отмеченные reserved_changed после commit, раз в
+RESERVED_SYNC_INTERVAL_MS - одним UPDATE на все. Копия отстает от журнала
+не больше чем на интервал; при старте сверяется целиком. Расхождение
+счетчиков с журналом исправляет python -m app.reconcile --fix.
+
+Переходы резерва:
+    active -> confirmed     - заказ оформлен, резерв больше не истекает;
+    active -> cancelled     - резерв возвращается в доступное количество;
+    active -> expired       - то же, по истечении expires_at (фоновый sweeper);
+    confirmed -> fulfilled  - товар отгружен, резерв снимается.
+Каждый переход - обновление по первичному ключу резерва и одного счетчика.
+
+Sweeper забирает истекшие резервы пачками через FOR UPDATE SKIP LOCKED,
+поэтому несколько воркеров чистят журнал параллельно, не мешая друг другу.
+
+Переменные окружения:
+    RESERVATION_TTL             - срок жизни резерва по умолчанию, с (900)
+    RESERVATION_SWEEP_INTERVAL  - период запуска sweeper, с (30; 0 - отключен)
+    RESERVATION_SWEEP_BATCH     - резервов в одной транзакции sweeper (500)
+    RESERVED_STRIPES            - счетчиков резерва на товар, включая счетчик 0 (8)
+    RESERVED_SYNC_INTERVAL_MS   - период обновления products.num_reserved_goods, мс (200)
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.cache import invalidate_product
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL = int(os.getenv('RESERVATION_TTL', '900'))
+RESERVATION_SWEEP_INTERVAL = float(os.getenv('RESERVATION_SWEEP_INTERVAL', '30'))
+RESERVATION_SWEEP_BATCH = int(os.getenv('RESERVATION_SWEEP_BATCH', '500'))
+RESERVED_STRIPES = max(1, int(os.getenv('RESERVED_STRIPES', '8')))
+RESERVED_SYNC_INTERVAL_MS = float(os.getenv('RESERVED_SYNC_INTERVAL_MS', '200'))
+
+PRODUCT_NOT_FOUND = "Product not found"
+RESERVATION_NOT_FOUND = "Reservation not found"
+NOT_ENOUGH_GOODS = "Not enough available goods to reserve"
+
+_GET_PRODUCTS = text("""
+    SELECT p.id, p.name, p.total_quantity
+    FROM JSON_TABLE(:ids, '$[*]' COLUMNS (id INT PATH '$')) k
+    JOIN products p ON p.id = k.id
+""")
+
+_LOCKED_COUNTERS = text("""
+    SELECT s.product_id, s.quantity
+    FROM JSON_TABLE(:ids, '$[*]' COLUMNS (id INT PATH '$')) k
+    JOIN product_reserved_stripes s ON s.product_id = k.id AND s.stripe = 0
+    FOR UPDATE OF s
+""")
+
+_RELEASE_COUNTERS = text("""
+    SELECT s.product_id, SUM(s.quantity) as quantity
+    FROM JSON_TABLE(:ids, '$[*]' COLUMNS (id INT PATH '$')) k
+    JOIN product_reserved_stripes s ON s.product_id = k.id AND s.stripe > 0
+    GROUP BY s.product_id
+""")
+
+_INSERT_RESERVATION = text("""
+    INSERT INTO reservations (product_id, owner, quantity, expires_at)
+    VALUES (:product_id, :owner, :quantity, CURRENT_TIMESTAMP(6) + INTERVAL :ttl_seconds SECOND)
+""")
+
+_GET_RESERVATION = text("""
+    SELECT id, product_id, owner, quantity, status, expires_at, created_at, updated_at
+    FROM reservations
+    WHERE id = :reservation_id
+""")
+
+_OWNER_RESERVATIONS = text("""
+    SELECT id, product_id, owner, quantity, status, expires_at, created_at, updated_at
+    FROM reservations
+    WHERE owner = :owner
+    ORDER BY id
+    LIMIT :limit
+""")
+
+_LOCK_RESERVATION = text("""
+    SELECT id, product_id, quantity, status
+    FROM reservations
+    WHERE id = :reservation_id
+    FOR UPDATE
+""")
+
+_CONFIRM = text("""
+    UPDATE reservations
+    SET status = 'confirmed'
+    WHERE id = :reservation_id AND status = 'active' AND expires_at > CURRENT_TIMESTAMP(6)
+""")
+
+_SET_STATUS = text("UPDATE reservations SET status = :status WHERE id = :reservation_id")
+
+_LOCK_EXPIRED = text("""
+    SELECT id, product_id, quantity
+    FROM reservations
+    WHERE status = 'active' AND expires_at <= CURRENT_TIMESTAMP(6)
+    ORDER BY expires_at
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+""")
+
+_EXPIRE = text("""
+    UPDATE reservations r
+    JOIN JSON_TABLE(:ids, '$[*]' COLUMNS (id BIGINT PATH '$')) k ON k.id = r.id
+    SET r.status = 'expired'
+""")
+
+# Копия суммы счетчиков в products: только отличающиеся строки
+_SYNC_RESERVED = text("""
+    UPDATE products p
+    JOIN (
+        SELECT k.id as product_id, COALESCE(SUM(s.quantity), 0) as reserved
+        FROM JSON_TABLE(:ids, '$[*]' COLUMNS (id INT PATH '$')) k
+        LEFT JOIN product_reserved_stripes s ON s.product_id = k.id
+        GROUP BY k.id
+    ) r ON r.product_id = p.id
+    SET p.num_reserved_goods = r.reserved,
+        p.updated_at = CURRENT_TIMESTAMP(6)
+    WHERE COALESCE(p.num_reserved_goods, 0) <> r.reserved
+""")
+
+_SYNC_ALL_RESERVED = text("""
+    UPDATE products p
+    LEFT JOIN (
+        SELECT product_id, SUM(quantity) as reserved
+        FROM product_reserved_stripes
+        GROUP BY product_id
+    ) r ON r.product_id = p.id
+    SET p.num_reserved_goods = COALESCE(r.reserved, 0),
+        p.updated_at = CURRENT_TIMESTAMP(6)
+    WHERE COALESCE(p.num_reserved_goods, 0) <> COALESCE(r.reserved, 0)
+""")
+
+# Товары, чей резерв изменился, но еще не скопирован в products.num_reserved_goods
+_changed: Set[int] = set()
+_changed_lock = threading.Lock()
+
+
+class ReservationNotFoundError(Exception):
+    pass
+
+
+class ReservationConflictError(Exception):
+    """Резерв нельзя создать или перевести в запрошенный статус"""
+
+
+# ==================== Счетчики резерва =====================
+
+def _add_counters(db: Session, rows: List[Tuple[int, int, int]]) -> None:
+    """
+    Прибавить (product_id, stripe, quantity) к счетчикам одним запросом;
+    нет строки счетчика - создается. Строки блокируются в порядке передачи.
+    """
+    values = []
+    params = {}
+    for index, (product_id, stripe, quantity) in enumerate(rows):
+        values.append(f"(:product_id_{index}, :stripe_{index}, :quantity_{index})")
+        params[f"product_id_{index}"] = product_id
+        params[f"stripe_{index}"] = stripe
+        params[f"quantity_{index}"] = quantity
+    db.execute(
+        text(
+            "INSERT INTO product_reserved_stripes (product_id, stripe, quantity) "
+            f"VALUES {', '.join(values)} AS new "
+            "ON DUPLICATE KEY UPDATE quantity = product_reserved_stripes.quantity + new.quantity"
+        ),
+        params
+    )
+
+
+def lock_reserved(db: Session, product_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Заблокировать счетчики 0 товаров (в порядке id) и вернуть по найденным
+    товарам name, total_quantity и reserved_quantity (сумма счетчиков).
+    До конца транзакции резерв этих товаров другими запросами ждет.
+    """
+    ids = sorted(set(product_ids))
+    products = {row.id: dict(row._mapping) for row in db.execute(_GET_PRODUCTS, {'ids': json.dumps(ids)})}
+    if not products:
+        return {}
+
+    # Прибавка 0 через ON DUPLICATE KEY UPDATE - эксклюзивная блокировка
+    # строки (и ее создание для товара без резервов) без дедлока двух
+    # первых резервов, в отличие от SELECT ... FOR UPDATE по пустому месту
+    _add_counters(db, [(product_id, 0, 0) for product_id in products])
+    payload = {'ids': json.dumps(list(products))}
+    reserved = {row.product_id: row.quantity for row in db.execute(_LOCKED_COUNTERS, payload)}
+    for row in db.execute(_RELEASE_COUNTERS, payload):
+        reserved[row.product_id] += row.quantity
+
+    for product_id, product in products.items():
+        product['reserved_quantity'] = int(reserved.get(product_id, 0))
+    return products
+
+
+def add_reserved(db: Session, quantities: Dict[int, int]) -> None:
+    """Прибавить к резерву товаров (счетчики 0 уже заблокированы lock_reserved)"""
+    _add_counters(db, [(product_id, 0, quantity) for product_id, quantity in sorted(quantities.items())])
+
+
+def _release_stripe() -> int:
+    return random.randrange(1, RESERVED_STRIPES) if RESERVED_STRIPES > 1 else 0
+
+
+def release_reserved(db: Session, quantities: Dict[int, int]) -> None:
+    """Снять резерв товаров: уменьшить случайный счетчик снятия, без блокировки счетчика 0"""
+    _add_counters(db, [(product_id, _release_stripe(), -quantity) for product_id, quantity in sorted(quantities.items())])
+
+
+def reserved_changed(product_ids: Iterable[int]) -> None:
+    """Отметить после commit товары с изменившимся резервом - для run_reserved_sync"""
+    with _changed_lock:
+        _changed.update(product_ids)
+
+
+# ==================== Резервы =====================
+
+def get_reservation(db: Session, reservation_id: int) -> Dict[str, Any]:
+    row = db.execute(_GET_RESERVATION, {'reservation_id': reservation_id}).fetchone()
+    if row is None:
+        raise ReservationNotFoundError(RESERVATION_NOT_FOUND)
+    return dict(row._mapping)
+
+
+def list_reservations(db: Session, owner: str, limit: int) -> List[Dict[str, Any]]:
+    """Резервы владельца (индекс idx_reservations_owner)"""
+    return [dict(row._mapping) for row in db.execute(_OWNER_RESERVATIONS, {'owner': owner, 'limit': limit})]
+
+
+def create_reservation(db: Session, product_id: int, quantity: int, owner: str, ttl_seconds: int) -> Dict[str, Any]:
+    """
+    Зарезервировать quantity товара на ttl_seconds.
+    Транзакцию (commit/rollback) завершает вызывающий код.
+    """
+    product = lock_reserved(db, [product_id]).get(product_id)
+    if product is None:
+        raise ReservationNotFoundError(PRODUCT_NOT_FOUND)
+    if product['total_quantity'] - product['reserved_quantity'] < quantity:
+        raise ReservationConflictError(NOT_ENOUGH_GOODS)
+
+    add_reserved(db, {product_id: quantity})
+    result = db.execute(
+        _INSERT_RESERVATION,
+        {'product_id': product_id, 'quantity': quantity, 'owner': owner, 'ttl_seconds': ttl_seconds}
+    )
+    return get_reservation(db, result.lastrowid)
+
+
+def confirm_reservation(db: Session, reservation_id: int) -> Dict[str, Any]:
+    """Подтвердить активный резерв; количество остается зарезервированным"""
+    if db.execute(_CONFIRM, {'reservation_id': reservation_id}).rowcount == 0:
+        reservation = get_reservation(db, reservation_id)
+        if reservation['status'] == 'active':
+            raise ReservationConflictError("Reservation has expired")
+        raise ReservationConflictError(f"Reservation is {reservation['status']}")
+    return get_reservation(db, reservation_id)
+
+
+def _finish(db: Session, reservation_id: int, from_status: str, to_status: str) -> Dict[str, Any]:
+    """Перевести резерв из from_status в to_status и снять его количество с товара"""
+    row = db.execute(_LOCK_RESERVATION, {'reservation_id': reservation_id}).fetchone()
+    if row is None:
+        raise ReservationNotFoundError(RESERVATION_NOT_FOUND)
+    if row.status != from_status:
+        raise ReservationConflictError(f"Reservation is {row.status}")
+
+    db.execute(_SET_STATUS, {'reservation_id': reservation_id, 'status': to_status})
+    release_reserved(db, {row.product_id: row.quantity})
+    return get_reservation(db, reservation_id)
+
+
+def cancel_reservation(db: Session, reservation_id: int) -> Dict[str, Any]:
+    """Отменить активный резерв и вернуть количество в доступное"""
+    return _finish(db, reservation_id, 'active', 'cancelled')
+
+
+def fulfil_reservation(db: Session, reservation_id: int) -> Dict[str, Any]:
+    """Отгрузить подтвержденный резерв: количество больше не зарезервировано"""
+    return _finish(db, reservation_id, 'confirmed', 'fulfilled')
+
+
+def expire_reservations(db: Session, limit: int) -> List[int]:
+    """
+    Снять пачку истекших резервов. Возвращает id товаров, у которых
+    изменился резерв. Транзакцию завершает вызывающий код.
+    """
+    rows = db.execute(_LOCK_EXPIRED, {'limit': limit}).fetchall()
+    if not rows:
+        return []
+
+    released: Dict[int, int] = {}
+    for row in rows:
+        released[row.product_id] = released.get(row.product_id, 0) + row.quantity
+
+    db.execute(_EXPIRE, {'ids': json.dumps([row.id for row in rows])})
+    release_reserved(db, released)
+    return sorted(released)
+
+
+def sweep_expired(session_factory) -> int:
+    """Снимать истекшие резервы пачками, пока они есть; возвращает число пачек"""
+    batches = 0
+    while True:
+        with session_factory() as db:
+            # READ COMMITTED: без gap-блокировок на индексе (status, expires_at),
+            # вставки новых резервов не ждут sweeper
+            db.connection(execution_options={'isolation_level': 'READ COMMITTED'})
+            product_ids = expire_reservations(db, RESERVATION_SWEEP_BATCH)
+            db.commit()
+
+        if not product_ids:
+            return batches
+        batches += 1
+        reserved_changed(product_ids)
+
+
+def sync_all_reserved(session_factory) -> None:
+    """Сверить products.num_reserved_goods с суммой счетчиков по всем товарам (при старте)"""
+    with session_factory() as db:
+        db.connection(execution_options={'isolation_level': 'READ COMMITTED'})
+        db.execute(_SYNC_ALL_RESERVED)
+        db.commit()
+
+
+def sync_reserved(session_factory) -> List[int]:
+    """
+    Скопировать сумму счетчиков в products.num_reserved_goods одним UPDATE
+    по товарам, отмеченным reserved_changed. Возвращает их id.
+    """
+    with _changed_lock:
+        product_ids = sorted(_changed)
+        _changed.clear()
+    if not product_ids:
+        return []
+
+    try:
+        with session_factory() as db:
+            # READ COMMITTED: счетчики читаются без разделяемых блокировок
+            db.connection(execution_options={'isolation_level': 'READ COMMITTED'})
+            db.execute(_SYNC_RESERVED, {'ids': json.dumps(product_ids)})
+            db.commit()
+    except Exception:
+        # Товары остаются отмеченными - повторим на следующем запуске
+        reserved_changed(product_ids)
+        raise
+
+    for product_id in product_ids:
+        invalidate_product(product_id)
+    return product_ids
+
+
+async def run_sweeper(session_factory) -> None:
+    """Фоновая задача lifespan: раз в RESERVATION_SWEEP_INTERVAL секунд снимает истекшие резервы"""
+    while True:
+        await asyncio.sleep(RESERVATION_SWEEP_INTERVAL)
+        try:
+            batches = await asyncio.to_thread(sweep_expired, session_factory)
+            if batches:
+                logger.info("reservations: снято пачек истекших резервов - %d", batches)
+        except Exception:
+            logger.exception("reservations: ошибка при снятии истекших резервов")
+
+
+async def run_reserved_sync(session_factory) -> None:
+    """Фоновая задача lifespan: копирует резерв в products.num_reserved_goods раз в RESERVED_SYNC_INTERVAL_MS"""
+    try:
+        await asyncio.to_thread(sync_all_reserved, session_factory)
+    except Exception:
+        logger.exception("reservations: ошибка при сверке products.num_reserved_goods")
+    try:
+        while True:
+            await asyncio.sleep(RESERVED_SYNC_INTERVAL_MS / 1000.0)
+            try:
+                await asyncio.to_thread(sync_reserved, session_factory)
+            except Exception:
+                logger.exception("reservations: ошибка при обновлении products.num_reserved_goods")
+    except asyncio.CancelledError:
+        # Остановка приложения: изменения, отмеченные после последнего запуска
+        try:
+            await asyncio.to_thread(sync_reserved, session_factory)
+        except Exception:
+            logger.exception("reservations: ошибка при обновлении products.num_reserved_goods")
+        raise
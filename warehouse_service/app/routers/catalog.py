@@ -0,0 +1,206 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from typing import Optional, List
+from app.models import CatalogCategoryResponse
+from app.models import CatalogProductCreate
+from app.models import CatalogProductResponse
+from app.models import CatalogProductUpdate
+from app.cache import product_cache, catalog_key, invalidate_product
+from app import categories, conditional
+from app.routers import common
+from app.categories import CatalogProductNotFoundError, CategoryNotFoundError, InvalidProductDataError
+
+from app.database import get_db, get_read_db
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+def _category(name: str) -> categories.Category:
+    try:
+        return categories.get_category(name)
+    except CategoryNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+def _write(db: Session, action, *args):
+    """Выполнить создание/изменение в транзакции и перевести ошибки в HTTP"""
+    try:
+        product = action(db, *args)
+        db.commit()
+        return product
+
+    except ValidationError as e:
+        db.rollback()
+        # Ошибки атрибутов - как ошибки проверки тела запроса
+        raise RequestValidationError([
+            {**error, 'loc': ('body', 'attributes', *error['loc'])}
+            for error in e.errors(include_url=False)
+        ])
+    except CatalogProductNotFoundError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except InvalidProductDataError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        error_msg = str(e)
+        if "Duplicate entry" in error_msg:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Товар с таким названием или SKU уже существует"
+            )
+        elif "Data truncated" in error_msg or "Incorrect" in error_msg:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Недопустимое значение атрибута: {error_msg}"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при записи товара: {error_msg}"
+        )
+
+# ==================== Категории =====================
+
+@router.get("/catalog/categories", response_model=List[CatalogCategoryResponse])
+def get_categories():
+    """
+    Категории с таблицами атрибутов (реестр app/categories.py)
+
+    - **attributes**: JSON Schema атрибутов для создания товара категории
+    """
+    return [
+        {'name': category.name, 'attributes': category.attributes.model_json_schema()}
+        for category in categories.CATEGORIES.values()
+    ]
+
+# ==================== Товары всех категорий =====================
+
+@router.get("/catalog/products", response_model=List[CatalogProductResponse])
+def get_catalog_products(
+    request: Request,
+    response: Response,
+    category: Optional[List[str]] = Query(None, description="Категория (можно несколько)"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+    include_inactive: bool = Query(False, description="Включать неактивные товары"),
+    include_out_of_stock: bool = Query(False, description="Включать товары не в наличии"),
+    limit: int = Query(50, ge=1, le=100, description="Лимит записей"),
+    offset: int = Query(0, ge=0, description="Смещение"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Получить список товаров любых категорий вместе с атрибутами
+
+    - **category**: Одна или несколько категорий (?category=thermocups&category=servers)
+    - **min_price / max_price / include_inactive / include_out_of_stock**: Как в GET /products
+    - **limit / offset**: Пагинация
+
+    Атрибуты (**attributes**) дочитываются одним запросом на каждую
+    категорию страницы, а не на каждый товар. Сортировка та же, что у GET /products.
+    Ответ содержит **ETag** и **Last-Modified** (304 - как у GET /products).
+    """
+    filters = {
+        # Имена из API -> categories.name; неизвестная категория - 404
+        'category': [_category(name).db_name for name in category] if category else None,
+        'min_price': min_price,
+        'max_price': max_price,
+        'include_inactive': include_inactive,
+        'include_out_of_stock': include_out_of_stock
+    }
+
+    statement, params = categories.products_query(filters, limit, offset)
+
+    try:
+        version = db.execute(conditional.CATALOG_VERSION).fetchone()
+        not_modified = common.catalog_not_modified(request, response, version, {**filters, 'limit': limit, 'offset': offset, 'view': 'catalog'})
+        if not_modified is not None:
+            return not_modified
+
+        products = [dict(product._mapping) for product in db.execute(statement, params).fetchall()]
+        return categories.load_attributes(db, products)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@router.get("/catalog/products/{product_id}", response_model=CatalogProductResponse)
+def get_catalog_product(
+    product_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Получить товар любой категории по ID вместе с атрибутами
+
+    Поддерживает условные запросы (If-None-Match / If-Modified-Since -> 304).
+    """
+    if conditional.is_conditional(request):
+        try:
+            version = db.execute(conditional.PRODUCT_VERSION, {'product_id': product_id}).fetchone()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        not_modified = conditional.product_not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    cached = common.cached_card_response(response, catalog_key(product_id))
+    if cached is not None:
+        return cached
+
+    generation = product_cache.generation
+    try:
+        product = categories.get_product(db, product_id)
+    except CatalogProductNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    return common.card_response(db, response, catalog_key(product_id), product, generation)
+
+# ==================== Создание и изменение товара категории =====================
+
+@router.post("/catalog/{category}/products", response_model=CatalogProductResponse, status_code=status.HTTP_201_CREATED)
+def create_catalog_product(
+    category: str,
+    product_data: CatalogProductCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Создать товар категории
+
+    - **category**: Имя категории из GET /catalog/categories
+    - **name / category_id / base_price / path_to_photo**: Как у термокружки;
+      category_id должен относиться к категории **category**
+    - **initial_quantity / warehouse_id**: Начальный остаток (опционально)
+    - **attributes**: Атрибуты по схеме категории (422 - не прошли проверку)
+    """
+    product = _write(db, categories.create_product, _category(category), product_data)
+    invalidate_product(product['id'])
+    logger.info("create_catalog_product: товар создан", extra={'product_id': product['id'], 'category': category, 'sampled': True})
+    return product
+
+@router.put("/catalog/{category}/products/{product_id}", response_model=CatalogProductResponse)
+def update_catalog_product(
+    category: str,
+    product_id: int,
+    product_data: CatalogProductUpdate,
+    db: Session = Depends(get_db)
+):
+    """
+    Обновить товар категории
+
+    - **category**: Имя категории товара
+    - **product_id**: ID товара (404 - нет товара в этой категории)
+    - Обновляемые поля (все опциональны): **name**, **category_id** (в пределах
+      категории), **base_price**, **sku**, **is_active**, **path_to_photo**,
+      **attributes** - только изменяемые атрибуты
+    """
+    product = _write(db, categories.update_product, _category(category), product_id, product_data)
+    invalidate_product(product_id)
+    logger.info("update_catalog_product: товар обновлен", extra={'product_id': product_id, 'category': category, 'sampled': True})
+    return product
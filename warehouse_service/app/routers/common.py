@@ -0,0 +1,524 @@
+"""
+Общие части синхронного (products.py) и асинхронного (products_async.py)
+роутеров товаров: вызовы процедур, сборка параметров, разбор строк в ответы,
+условные запросы, кэш карточек и разбор ошибок БД.
+
+Обработчики роутеров только выполняют запросы (db.execute или await
+db.execute) и передают результат сюда - логика ответа у них одна.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import bindparam, text
+
+from app.models import ProductCreateThermocup, ProductUpdateThermocup
+from app.cache import product_cache, product_key
+from app.database import is_replica_session
+from app.replica import read_primary_var
+from app.pagination import InvalidCursorError, decode_cursor, encode_cursor
+from app.search import build_boolean_query
+from app import coalescing, conditional, serialization
+
+# ==================== Вызовы хранимых процедур ====================
+
+GET_PRODUCTS = text("CALL GetProducts(:category, :min_price, :max_price, :search, :include_inactive, :include_out_of_stock, :limit, :offset)")
+GET_PRODUCTS_AFTER_CURSOR = text("CALL GetProductsAfterCursor(:category, :min_price, :max_price, :search, :include_inactive, :include_out_of_stock, :after_is_active, :after_total_quantity, :after_name, :after_id, :limit)")
+GET_PRODUCT_FACETS = text("CALL GetProductFacets(:category, :min_price, :max_price, :search, :include_inactive, :include_out_of_stock, :price_step)")
+SEARCH_PRODUCTS = text("CALL SearchProducts(:query, :include_inactive, :limit)")
+GET_PRODUCT_BY_ID = text("CALL GetProductById(:product_id)")
+GET_PRODUCTS_BY_IDS = text("CALL GetProductsByIds(:ids, :skus)")
+GET_THERMOCUP_BY_ID = text("CALL GetThermocupById(:product_id)")
+CREATE_THERMOS = text("CALL CreateThermos(:name, :category_id, :base_price, :initial_quantity, :warehouse_id, :volume_ml, :color, :brand, :model, :is_hermetic, :material, :path_to_photo)")
+UPDATE_THERMOCUP = text("CALL UpdateThermocup(:product_id, :name, :category_id, :base_price, :sku, :is_active, :path_to_photo, :volume_ml, :color, :brand, :model, :is_hermetic, :material)")
+UPDATE_RESERVED_GOODS = text("CALL UpdateProductReservedGoods(:product_id, :quantity_change)")
+UPDATE_STOCK_QUANTITY = text("CALL UpdateProductStockQuantity(:product_id, :warehouse_id, :quantity_change)")
+
+# ==================== Ответы на чтение ====================
+
+def database_error(e: Exception) -> HTTPException:
+    return HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+def rows_response(request: Request, response: Response, rows, model):
+    """Строки -> ответ: через app/serialization.py (FAST_SERIALIZATION) или список dict"""
+    if serialization.FAST_SERIALIZATION:
+        return serialization.rows_response(request, response, rows, model)
+    return [dict(row._mapping) for row in rows]
+
+def catalog_not_modified(request: Request, response: Response, version, page: Dict[str, Any]) -> Optional[Response]:
+    """
+    Версия каталога + параметры страницы -> ETag. Возвращает 304, если
+    If-None-Match / If-Modified-Since актуальны (страница не запрашивается),
+    иначе ставит ETag и Last-Modified в response и возвращает None
+    """
+    version = version._mapping
+    etag = conditional.catalog_etag(version, page)
+    if conditional.not_modified(request, etag, version['updated_at']):
+        return conditional.not_modified_response(etag, version['updated_at'])
+    conditional.set_validators(response, etag, version['updated_at'])
+    return None
+
+# ==================== Список товаров ====================
+
+def products_page_query(filters: Dict[str, Any], limit: int, offset: int, cursor: Optional[str]) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Выбрать процедуру для страницы списка товаров: по offset или по курсору
+    """
+    if cursor is not None and offset:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Параметры cursor и offset нельзя использовать одновременно"
+        )
+
+    params = {**filters, 'search': build_boolean_query(filters['search'], require_all=True), 'limit': limit}
+
+    if cursor is None:
+        return GET_PRODUCTS, {**params, 'offset': offset}
+
+    try:
+        after = decode_cursor(cursor, filters)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return GET_PRODUCTS_AFTER_CURSOR, {**params, **after}
+
+def next_cursor(products: List[Dict[str, Any]], limit: int, filters: Dict[str, Any]) -> Optional[str]:
+    """Курсор следующей страницы - только если текущая заполнена целиком"""
+    if len(products) == limit:
+        return encode_cursor(products[-1], filters)
+    return None
+
+def products_page_response(request: Request, response: Response, rows, limit: int, filters: Dict[str, Any], model):
+    """Строки страницы -> ответ; полная страница - курсор следующей в X-Next-Cursor"""
+    products = [dict(product._mapping) for product in rows]
+
+    cursor_for_next = next_cursor(products, limit, filters)
+    if cursor_for_next:
+        response.headers["X-Next-Cursor"] = cursor_for_next
+
+    if serialization.FAST_SERIALIZATION:
+        return serialization.rows_response(request, response, products, model)
+    return products
+
+# ==================== Поиск ====================
+
+def search_params(q: str, include_inactive: bool, limit: int) -> Optional[Dict[str, Any]]:
+    """Параметры SearchProducts; None - в запросе не осталось слов (ответ - пустой список)"""
+    query = build_boolean_query(q)
+    if query is None:
+        return None
+    return {'query': query, 'include_inactive': include_inactive, 'limit': limit}
+
+# ==================== Фасеты ====================
+
+VOLUME_BUCKETS = ('0-350', '351-500', '501-750', '751+')
+
+_FACET_LISTS = {
+    'category': 'categories',
+    'brand': 'brands',
+    'color': 'colors',
+    'material': 'materials',
+    'volume': 'volumes',
+    'hermetic': 'hermetic',
+}
+
+def facets_params(filters: Dict[str, Any], price_step: float) -> Dict[str, Any]:
+    return {**filters, 'search': build_boolean_query(filters['search'], require_all=True), 'price_step': price_step}
+
+def facets_key(filters: Dict[str, Any], price_step: float) -> tuple:
+    return ('facets', tuple(sorted(filters.items())), price_step)
+
+def facets_from_rows(rows, price_step: float) -> Dict[str, Any]:
+    """Строки GetProductFacets (facet, value, cnt) -> ProductFacetsResponse"""
+    facets: Dict[str, Any] = {name: [] for name in _FACET_LISTS.values()}
+    facets['total'] = 0
+    facets['price_histogram'] = []
+
+    for row in rows:
+        facet, value, count = row.facet, row.value, int(row.cnt)
+        if facet == 'total':
+            facets['total'] = count
+        elif facet == 'price':
+            min_price = float(value)
+            facets['price_histogram'].append({'min_price': min_price, 'max_price': min_price + price_step, 'count': count})
+        elif facet == 'hermetic':
+            facets['hermetic'].append({'value': 'true' if value == '1' else 'false', 'count': count})
+        else:
+            facets[_FACET_LISTS[facet]].append({'value': value, 'count': count})
+
+    for name in ('categories', 'brands', 'colors', 'materials'):
+        facets[name].sort(key=lambda item: (-item['count'], item['value']))
+    facets['volumes'].sort(key=lambda item: VOLUME_BUCKETS.index(item['value']))
+    facets['price_histogram'].sort(key=lambda item: item['min_price'])
+    facets['hermetic'].sort(key=lambda item: item['value'], reverse=True)
+    return facets
+
+# ==================== Кэш карточек ====================
+# Кэш общий для процесса и заполняется только чтениями с основной БД:
+# карточка с отстающей реплики, положенная сразу после инвалидации,
+# отдавалась бы всем до истечения TTL. Клиент, закрепленный за основной
+# БД после своей записи (app/replica.py), кэш не читает - запись могла
+# пройти через другой воркер, чей сброс кэша сюда еще не дошел.
+
+def cached_card(key: tuple) -> Optional[Dict[str, Any]]:
+    if read_primary_var.get():
+        return None
+    return product_cache.get(key)
+
+def cache_card(db, key: tuple, card: Dict[str, Any], generation: int) -> None:
+    if not is_replica_session(db):
+        product_cache.set(key, card, generation)
+
+def cached_card_response(response: Response, key: tuple) -> Optional[Dict[str, Any]]:
+    """Карточка из кэша (с ETag и Last-Modified) или None"""
+    cached = cached_card(key)
+    if cached is not None:
+        conditional.set_validators(response, conditional.product_etag(cached), cached.get('updated_at'))
+    return cached
+
+def card_response(db, response: Response, key: tuple, card: Dict[str, Any], generation: int) -> Dict[str, Any]:
+    """Прочитанную карточку - в кэш (только с основной БД) и в ответ с ETag и Last-Modified"""
+    cache_card(db, key, card, generation)
+    conditional.set_validators(response, conditional.product_etag(card), card.get('updated_at'))
+    return card
+
+def product_card(row, product_id: int) -> Dict[str, Any]:
+    """Строка GetProductById -> ответ; нет строки - 404"""
+    if not row:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Product with ID {product_id} not found"
+        )
+    return dict(row._mapping)
+
+# ==================== Пакетное получение товаров ====================
+
+def check_lookup_request(ids: List[int], skus: List[str]) -> None:
+    if not ids and not skus:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Укажите ids и/или skus"
+        )
+
+def lookup_cached(ids: List[int]) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    """Товары из кэша карточек и id, которые нужно прочитать из БД"""
+    found: Dict[int, Dict[str, Any]] = {}
+    misses: List[int] = []
+    for product_id in dict.fromkeys(ids):
+        cached = cached_card(product_key(product_id))
+        if cached is not None:
+            found[product_id] = cached
+        else:
+            misses.append(product_id)
+    return found, misses
+
+def lookup_params(ids: List[int], skus: List[str]) -> Dict[str, Any]:
+    return {'ids': json.dumps(ids), 'skus': json.dumps(skus)}
+
+def lookup_response(found: Dict[int, Dict[str, Any]], rows, ids: List[int], skus: List[str], generation: int) -> Dict[str, Any]:
+    """Добавить прочитанные строки (и положить их в кэш), посчитать ненайденные"""
+    for row in rows:
+        product = dict(row._mapping)
+        found[product['id']] = product
+        product_cache.set(product_key(product['id']), product, generation)
+
+    found_skus = {product['sku'] for product in found.values() if product.get('sku')}
+    return {
+        'products': found,
+        'missing_ids': [product_id for product_id in dict.fromkeys(ids) if product_id not in found],
+        'missing_skus': [sku for sku in dict.fromkeys(skus) if sku not in found_skus],
+    }
+
+# ==================== Список термокружек ====================
+
+# Запрос собирается только из заданных фильтров: условие вида
+# "(:x IS NULL OR col = :x)" не дает оптимизатору выбрать индекс по col.
+# При фильтре по атрибутам чтение начинается с индексов
+# product_attributes_thermocups (idx_thermocups_*), к products - по первичному ключу.
+_THERMOCUPS_SELECT = """
+    SELECT
+        p.id,
+        p.name,
+        p.sku,
+        c.name as category_name,
+        p.base_price,
+        p.total_quantity,
+        p.num_reserved_goods,
+        p.is_active,
+        p.created_at,
+        p.updated_at,
+        p.path_to_photo,
+        pt.volume_ml,
+        pt.color,
+        pt.brand,
+        pt.model,
+        pt.is_hermetic,
+        pt.material
+    FROM product_attributes_thermocups pt
+    JOIN products p ON p.id = pt.product_id
+    JOIN categories c ON p.category_id = c.id
+"""
+
+def thermocups_query(filters: Dict[str, Any], limit: int, offset: int) -> Tuple[Any, Dict[str, Any]]:
+    """SELECT списка термокружек с условиями только по заданным фильтрам"""
+    conditions = []
+    params: Dict[str, Any] = {'limit': limit, 'offset': offset}
+    expanding = []
+
+    if not filters['include_inactive']:
+        conditions.append("p.is_active = 1")
+    if not filters['include_out_of_stock']:
+        conditions.append("p.total_quantity > 0")
+    if filters['category'] is not None:
+        conditions.append("c.name = :category")
+        params['category'] = filters['category']
+    if filters['min_price'] is not None:
+        conditions.append("p.base_price >= :min_price")
+        params['min_price'] = filters['min_price']
+    if filters['max_price'] is not None:
+        conditions.append("p.base_price <= :max_price")
+        params['max_price'] = filters['max_price']
+    if filters['min_volume'] is not None:
+        conditions.append("pt.volume_ml >= :min_volume")
+        params['min_volume'] = filters['min_volume']
+    if filters['max_volume'] is not None:
+        conditions.append("pt.volume_ml <= :max_volume")
+        params['max_volume'] = filters['max_volume']
+    for name in ('color', 'brand', 'material'):
+        values = filters[name]
+        if values:
+            conditions.append(f"pt.{name} IN :{name}")
+            params[name] = list(values)
+            expanding.append(bindparam(name, expanding=True))
+    if filters['is_hermetic'] is not None:
+        conditions.append("pt.is_hermetic = :is_hermetic")
+        params['is_hermetic'] = filters['is_hermetic']
+
+    sql = _THERMOCUPS_SELECT
+    if conditions:
+        sql += "    WHERE " + "\n        AND ".join(conditions) + "\n"
+    sql += "    ORDER BY p.is_active DESC, p.total_quantity DESC, p.name, p.id\n    LIMIT :limit OFFSET :offset"
+
+    statement = text(sql)
+    if expanding:
+        statement = statement.bindparams(*expanding)
+    return statement, params
+
+# ==================== Термокружки ====================
+
+def thermocup_from_row(row) -> Dict[str, Any]:
+    """Строка GetThermocupById -> ответ; warehouses приходит из БД JSON-строкой"""
+    thermocup = dict(row._mapping)
+    warehouses = thermocup.get('warehouses')
+    if isinstance(warehouses, (str, bytes)):
+        warehouses = json.loads(warehouses)
+    thermocup['warehouses'] = sorted(warehouses or [], key=lambda item: item['warehouse_id'])
+    return thermocup
+
+def thermocup_card(row, product_id: int) -> Dict[str, Any]:
+    """Строка GetThermocupById -> ответ; нет строки - 404"""
+    if not row:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Thermocup with ID {product_id} not found"
+        )
+    return thermocup_from_row(row)
+
+def create_thermocup_params(product_data: ProductCreateThermocup) -> Dict[str, Any]:
+    return {
+        'name': product_data.name,
+        'category_id': product_data.category_id,
+        'base_price': product_data.base_price,
+        # 'description': product_data.description,
+        'initial_quantity': product_data.initial_quantity,
+        'warehouse_id': product_data.warehouse_id,
+        'volume_ml': product_data.attributes.volume_ml,
+        'color': product_data.attributes.color,
+        'brand': product_data.attributes.brand,
+        'model': product_data.attributes.model or '',
+        'is_hermetic': 1 if product_data.attributes.is_hermetic else 0,
+        'material': product_data.attributes.material or '',
+        'path_to_photo': product_data.path_to_photo or ''
+    }
+
+def update_thermocup_params(product_id: int, product_data: ProductUpdateThermocup) -> Dict[str, Any]:
+    params = {
+        'product_id': product_id,
+        'name': product_data.name,
+        'category_id': product_data.category_id,
+        'base_price': product_data.base_price,
+        'sku': product_data.sku,
+        'is_active': product_data.is_active,
+        'path_to_photo': product_data.path_to_photo,
+        # Атрибуты термокружки (может быть None)
+        'volume_ml': None,
+        'color': None,
+        'brand': None,
+        'model': None,
+        'is_hermetic': None,
+        'material': None
+    }
+
+    # Если переданы атрибуты, заполняем их
+    if product_data.attributes:
+        params.update({
+            'volume_ml': product_data.attributes.volume_ml,
+            'color': product_data.attributes.color,
+            'brand': product_data.attributes.brand,
+            'model': product_data.attributes.model,
+            'is_hermetic': product_data.attributes.is_hermetic,
+            'material': product_data.attributes.material
+        })
+
+    return params
+
+def reserved_goods_params(product_id: int, request) -> Dict[str, Any]:
+    return {'product_id': product_id, 'quantity_change': request.quantity_change}
+
+def stock_quantity_params(product_id: int, request) -> Dict[str, Any]:
+    return {'product_id': product_id, 'warehouse_id': request.warehouse_id, 'quantity_change': request.quantity_change}
+
+# ==================== Ответы на запись ====================
+
+def written_row(row, detail: str = "Товар не найден") -> Dict[str, Any]:
+    """Строка, которую вернула процедура изменения; нет строки - 404"""
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=detail
+        )
+    return dict(row._mapping)
+
+# ==================== Разбор ошибок БД ====================
+
+def create_thermocup_error(error_msg: str) -> HTTPException:
+    if "Duplicate entry" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Товар с таким названием уже существует"
+        )
+    elif "Category not found" in error_msg or "foreign key constraint fails" in error_msg and "category_id" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Указанная категория не существует"
+        )
+    elif "foreign key constraint fails" in error_msg and "warehouse_id" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Указанный склад не существует"
+        )
+    elif "thermocups" in error_msg.lower():
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверная категория для термокружки. Убедитесь что category_id соответствует категории 'thermocups'"
+        )
+    else:
+        return HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при создании термокружки: {error_msg}"
+        )
+
+def update_thermocup_error(error_msg: str) -> HTTPException:
+    if "Duplicate entry" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Товар с таким SKU уже существует"
+        )
+    elif "foreign key constraint fails" in error_msg and "category_id" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Указанная категория не существует"
+        )
+    elif "Product not found" in error_msg or "doesn't exist" in error_msg.lower():
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Товар не найден"
+        )
+    else:
+        return HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при обновлении термокружки: {error_msg}"
+        )
+
+def reserved_goods_error(error_msg: str) -> HTTPException:
+    if "Product not found" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Товар не найден"
+        )
+    elif "Reserved quantity cannot be negative" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Зарезервированное количество не может быть отрицательным"
+        )
+    elif "Not enough available goods to reserve" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Недостаточно доступного товара для резервирования"
+        )
+    elif "Not enough PATCH reservations to release" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Недостаточно резервов, сделанных через PATCH .../reserved, для снятия"
+        )
+    else:
+        return HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при обновлении зарезервированного количества: {error_msg}"
+        )
+
+def coalesced_stock_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Результат строки склеенного изменения остатка -> StockQuantityResponse"""
+    if result['status'] != 'applied':
+        raise stock_quantity_error(result['error'])
+    return {
+        'product_id': result['product_id'],
+        'product_name': result['product_name'],
+        'warehouse_id': result['warehouse_id'],
+        'warehouse_name': result['warehouse_name'],
+        'current_quantity': result['current_quantity'],
+        'total_quantity_all_warehouses': result['total_quantity_all_warehouses'],
+    }
+
+def coalesced_stock_error(error: Exception) -> HTTPException:
+    """Ошибка склеенного изменения остатка (app/coalescing.py) -> HTTP"""
+    if isinstance(error, coalescing.StockOutcomeUnknownError):
+        # Транзакция могла быть зафиксирована: повтор без проверки остатка
+        # может применить изменение дважды
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Результат изменения остатка неизвестен: проверьте остаток перед повтором"
+        )
+    if isinstance(error, coalescing.StockNotAppliedError):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Изменение остатка не применено: сервис останавливается, повторите запрос"
+        )
+    return stock_quantity_error(str(error))
+
+def stock_quantity_error(error_msg: str) -> HTTPException:
+    if "Product not found" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Товар не найден"
+        )
+    elif "Warehouse not found" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Склад не найден"
+        )
+    elif "Stock quantity cannot be negative" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Количество на складе не может быть отрицательным"
+        )
+    elif "Cannot remove quantity from non-existing stock" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нельзя уменьшить количество несуществующего запаса"
+        )
+    else:
+        return HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при обновлении количества на складе: {error_msg}"
+        )
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+
+from app.events import EVENT_TYPES, OUTBOX_BATCH, OUTBOX_REPLAY_LIMIT, broker, fetch_events, oldest_id
+
+router = APIRouter()
+
+# Комментарий SSE раз в HEARTBEAT секунд: соединение не закрывают прокси
+HEARTBEAT = 15
+
+def _sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+async def _replay(subscriber, after_id: int, up_to: int):
+    """Досылка пропущенных событий (after_id, up_to] из outbox_events"""
+    first = await asyncio.to_thread(oldest_id)
+    # События после after_id уже удалены (или их больше лимита) - клиенту нужен полный перечит
+    if (first is not None and first > after_id + 1) or up_to - after_id > OUTBOX_REPLAY_LIMIT:
+        yield f"id: {up_to}\nevent: reset\ndata: {json.dumps({'id': up_to, 'type': 'reset'})}\n\n"
+        return
+
+    while after_id < up_to:
+        events = await asyncio.to_thread(fetch_events, after_id, up_to, OUTBOX_BATCH)
+        if not events:
+            return
+        for event in events:
+            if subscriber.matches(event):
+                yield _sse(event)
+        after_id = events[-1]['id']
+
+# ==================== Поток изменений товаров =====================
+
+@router.get("/events/stream")
+async def stream_events(
+    request: Request,
+    types: Optional[str] = Query(None, description=f"Типы событий через запятую: {', '.join(EVENT_TYPES)}"),
+    product_id: Optional[List[int]] = Query(None, description="Только эти товары (параметр повторяется)"),
+    last_event_id: Optional[int] = Query(None, description="Продолжить после события (вместо заголовка Last-Event-ID)"),
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Поток изменений товаров (Server-Sent Events)
+
+    События: **stock** (total_quantity), **reservation** (num_reserved_goods),
+    **price** (base_price), **activation** (is_active), **created** (новый товар),
+    **deleted** (товар удален, в data - последнее состояние).
+    В data - id, type, product_id, created_at и текущие total_quantity,
+    num_reserved_goods, available_quantity, base_price, is_active.
+
+    После обрыва клиент (EventSource - автоматически) передает **Last-Event-ID**,
+    и пропущенные события досылаются. Событие **reset** означает, что
+    пропущенное досылать нельзя - состояние нужно перечитать (GET /products).
+    """
+    type_filter = None
+    if types:
+        type_filter = {item.strip() for item in types.split(',') if item.strip()}
+        unknown = type_filter - set(EVENT_TYPES)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Неизвестные типы событий: {', '.join(sorted(unknown))}"
+            )
+
+    after_id = last_event_id if last_event_id is not None else last_event_id_header
+    # Подписка до досылки: события после up_to попадут в очередь, ничего не теряется
+    subscriber = broker.subscribe(type_filter, set(product_id) if product_id else None)
+    up_to = broker.last_id
+
+    async def stream():
+        try:
+            if after_id is not None and after_id < up_to:
+                async for chunk in _replay(subscriber, after_id, up_to):
+                    yield chunk
+            else:
+                yield ": connected\n\n"
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if subscriber.overflowed or await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event)
+                if subscriber.overflowed and subscriber.queue.empty():
+                    return
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
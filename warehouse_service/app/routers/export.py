@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+
+from app.database import read_engine
+
+router = APIRouter()
+
+# Строк в одной порции: столько же читается с сервера БД за раз и
+# столько же уходит клиенту одним куском ответа
+EXPORT_CHUNK_ROWS = 1000
+
+EXPORT_COLUMNS = (
+    'id', 'name', 'sku', 'category_name', 'base_price',
+    'total_quantity', 'num_reserved_goods', 'available_quantity',
+    'is_active', 'path_to_photo', 'created_at', 'updated_at',
+)
+
+_EXPORT_QUERY = text("""
+    SELECT
+        p.id,
+        p.name,
+        p.sku,
+        c.name as category_name,
+        p.base_price,
+        p.total_quantity,
+        COALESCE(p.num_reserved_goods, 0) as num_reserved_goods,
+        (p.total_quantity - COALESCE(p.num_reserved_goods, 0)) as available_quantity,
+        p.is_active,
+        p.path_to_photo,
+        p.created_at,
+        p.updated_at
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+    WHERE
+        (:include_inactive = TRUE OR p.is_active = 1)
+        AND (:category IS NULL OR c.name = :category)
+    ORDER BY p.id
+""")
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _iter_catalog(bind, params: dict):
+    """
+    Строки каталога с серверным курсором: в памяти держится только текущая
+    порция, соединение с БД занято до конца выгрузки.
+    """
+    with bind.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=EXPORT_CHUNK_ROWS
+        ).execute(_EXPORT_QUERY, params)
+        for rows in result.mappings().partitions(EXPORT_CHUNK_ROWS):
+            yield rows
+
+
+def _ndjson_chunks(bind, params: dict):
+    for rows in _iter_catalog(bind, params):
+        yield "".join(
+            json.dumps(dict(row), ensure_ascii=False, default=_json_default) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+def _csv_chunks(bind, params: dict):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    # Заголовок уходит сразу - клиент получает первый байт до выполнения запроса
+    yield buffer.getvalue().encode("utf-8")
+
+    for rows in _iter_catalog(bind, params):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow([row[column] for column in EXPORT_COLUMNS])
+        yield buffer.getvalue().encode("utf-8")
+
+# ==================== Выгрузка каталога =====================
+
+@router.get("/products/export")
+def export_products(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Формат: ndjson или csv"),
+    category: Optional[str] = Query(None, description="Фильтр по категории"),
+    include_inactive: bool = Query(True, description="Включать неактивные товары"),
+):
+    """
+    Потоковая выгрузка всего каталога с остатками
+
+    - **format**: ndjson (по умолчанию) или csv
+    - **category**: Фильтр по названию категории
+    - **include_inactive**: Включать неактивные товары (по умолчанию true)
+
+    Ответ отдается частями по мере чтения из БД (серверный курсор),
+    поэтому память сервиса не зависит от размера каталога.
+    """
+    params = {'include_inactive': include_inactive, 'category': category}
+    # Реплика, если доступна (app/replica.py); выбирается до начала потоковой выдачи
+    bind = read_engine()
+
+    if format == 'csv':
+        return StreamingResponse(
+            _csv_chunks(bind, params),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="products.csv"'}
+        )
+
+    return StreamingResponse(_ndjson_chunks(bind, params), media_type="application/x-ndjson")
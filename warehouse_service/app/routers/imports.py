@@ -0,0 +1,75 @@
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.models import ImportReport
+from app.importer import DEFAULT_BATCH_SIZE, import_thermocups, iter_text_lines
+
+from app.database import get_db
+
+router = APIRouter()
+
+_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+# ==================== Массовый импорт термокружек =====================
+
+@router.post("/products/thermocups/import", response_model=ImportReport)
+async def import_thermocups_catalog(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="Формат тела: csv или ndjson (по умолчанию - по Content-Type)"),
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=5000, description="Строк в одной пачке вставки"),
+    db: Session = Depends(get_db)
+):
+    """
+    Импортировать каталог термокружек из CSV или NDJSON
+
+    Тело запроса - сам файл (не multipart), читается потоково.
+
+    - **CSV**: первая строка - заголовок. Колонки: name, category_id, base_price,
+      initial_quantity, warehouse_id, path_to_photo, volume_ml, color, brand,
+      model, is_hermetic, material
+    - **NDJSON**: по одному JSON-объекту на строку, в формате тела
+      POST /products/thermocups/create (или с плоскими атрибутами, как в CSV)
+
+    Строки проверяются схемой ProductCreateThermocup и записываются пачками
+    по **batch_size**. Ошибочные строки перечисляются в отчете и не прерывают импорт.
+    """
+    fmt = format
+    if fmt is None:
+        content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+        fmt = _CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Укажите format=csv|ndjson или Content-Type text/csv / application/x-ndjson"
+        )
+
+    body = request.stream()
+
+    def body_chunks():
+        # Выполняется в рабочем потоке: забираем куски тела из event loop по мере чтения
+        while True:
+            try:
+                yield anyio.from_thread.run(body.__anext__)
+            except StopAsyncIteration:
+                return
+
+    def run_import():
+        return import_thermocups(db, iter_text_lines(body_chunks()), fmt, batch_size=batch_size)
+
+    try:
+        return await run_in_threadpool(run_import)
+    except Exception as e:
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при импорте каталога: {str(e)}"
+        )
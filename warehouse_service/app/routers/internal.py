@@ -0,0 +1,84 @@
+from fastapi import APIRouter
+
+from app.cache import product_cache, facets_cache
+from app.coalescing import async_stock_coalescer, stock_coalescer
+from app.events import broker
+from app.replica import replica_state
+from app.database import DB_ASYNC, engine, async_engine, replica_engine, async_replica_engine
+from app.pool import pool_status
+
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+# ==================== СЛУЖЕБНЫЕ ЭНДПОИНТЫ ====================
+
+@router.get("/cache")
+def get_cache_stats():
+    """
+    Статистика кэшей карточек товаров и фасет
+
+    - **hits / misses / hit_ratio**: попадания и промахи
+    - **evictions**: вытеснено по размеру (кэш мал - увеличить PRODUCT_CACHE_SIZE)
+    - **expirations**: истекло по TTL (PRODUCT_CACHE_TTL)
+    - **invalidations**: сброшено при изменении товара
+    """
+    return {"product_cache": product_cache.stats(), "facets_cache": facets_cache.stats()}
+
+@router.delete("/cache")
+def clear_cache():
+    """Полностью очистить кэши карточек товаров и фасет"""
+    product_cache.clear()
+    facets_cache.clear()
+    return {"product_cache": product_cache.stats(), "facets_cache": facets_cache.stats()}
+
+@router.get("/pool")
+def get_pool_stats():
+    """
+    Состояние пула соединений с БД
+
+    - **checked_out / checked_in**: выдано и свободно соединений
+    - **overflow**: открыто сверх DB_POOL_SIZE (предел - DB_MAX_OVERFLOW)
+    - **checkouts_waited / checkout_wait_avg_ms / checkout_wait_max_ms**: ожидание
+      свободного соединения (растет - пул меньше числа воркеров)
+    - **checkout_timeouts**: запросы, не дождавшиеся соединения за DB_POOL_TIMEOUT
+    - **connection_age_max_s / connection_age_avg_s**: возраст открытых соединений
+    """
+    pools = {"sync": pool_status(engine)}
+    if async_engine is not None:
+        pools["async"] = pool_status(async_engine.sync_engine)
+    if replica_engine is not None:
+        pools["replica"] = pool_status(replica_engine)
+    if async_replica_engine is not None:
+        pools["async_replica"] = pool_status(async_replica_engine.sync_engine)
+    return pools
+
+@router.get("/stock-coalescing")
+def get_stock_coalescing_stats():
+    """
+    Склейка изменений остатков (STOCK_COALESCING)
+
+    - **requests / transactions**: запросов PATCH .../stock и транзакций на них;
+      чем больше отношение, тем больше изменений склеено
+    - **open_batches**: пачек, собираемых прямо сейчас
+
+    При DB_ASYNC=true - статистика асинхронного варианта (его использует роутер товаров).
+    """
+    if DB_ASYNC:
+        return async_stock_coalescer.stats()
+    return stock_coalescer.stats()
+
+@router.get("/events")
+def get_events_stats():
+    """Брокер событий: последний разосланный id и число подписчиков GET /events/stream"""
+    return broker.stats()
+
+@router.get("/replica")
+def get_replica_stats():
+    """
+    Реплика для чтения (DB_REPLICA_HOST)
+
+    - **healthy / lag_s**: используется ли реплика и ее отставание
+    - **reads_replica / reads_primary**: сессий чтения с реплики и с основной БД
+    """
+    if replica_engine is None:
+        return {"configured": False}
+    return {"configured": True, **replica_state.stats()}
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.models import OrderReservationRequest
+from app.models import OrderReservationResponse
+from app.orders import ReservationError, order_owner, reserve_order_lines
+from app.reservations import reserved_changed
+
+from app.database import get_db
+
+router = APIRouter()
+
+# ==================== Резервирование заказа =====================
+
+@router.post("/orders/reserve", response_model=OrderReservationResponse)
+def reserve_order(
+    request: OrderReservationRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Атомарно зарезервировать все строки заказа
+
+    - **order_id**: Номер заказа (опционально, возвращается в ответе)
+    - **lines**: Строки заказа
+        - **product_id**: ID товара
+        - **quantity**: Количество к резервированию (> 0)
+
+    Резервируются либо все строки, либо ни одной. Если хотя бы одной строки
+    не хватает, возвращается 409 со списком проблемных строк.
+    В ответе по каждому товару: всего, зарезервировано, доступно.
+    Резервы заказа - в журнале с владельцем **order:<order_id>**
+    (GET /reservations?owner=...), снимаются при отгрузке через
+    POST /reservations/{id}/fulfil.
+    """
+    lines = [(line.product_id, line.quantity) for line in request.lines]
+
+    try:
+        reserved = reserve_order_lines(db, lines, order_owner(request.order_id))
+        db.commit()
+
+    except ReservationError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                'message': "Недостаточно доступного товара для резервирования заказа",
+                'order_id': request.order_id,
+                'lines': e.lines
+            }
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при резервировании заказа: {str(e)}"
+        )
+
+    reserved_changed([line['id'] for line in reserved])
+
+    return {'order_id': request.order_id, 'lines': reserved}
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from typing import Optional, List
 from app.models import ProductResponse
 from app.models import ProductCreateThermocup
@@ -10,27 +12,39 @@ from app.models import UpdateReservedGoodsRequest
 from app.models import StockQuantityResponse
 from app.models import UpdateStockQuantityRequest
 from app.models import ThermocupResponse
+from app.models import ProductSearchResponse
+from app.models import ProductFacetsResponse
+from app.models import ProductLookupRequest
+from app.models import ProductLookupResponse
+from app.cache import product_cache, facets_cache, product_key, thermocup_key, invalidate_product
+from app.routers import common
+from app import coalescing, conditional, reservations
 
 # Импортируем зависимости из твоего проекта
-from app.database import get_db
+from app.database import get_db, get_read_db
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 # ==================== PUBLIC ENDPOINTS ====================
 
 # ==================== Получение всех товаров (в том числе и с категорями/спецификациями) =====================
 
 @router.get("/products", response_model=List[ProductResponse])
 def get_products(
+    request: Request,
+    response: Response,
     category: Optional[str] = Query(None, description="Фильтр по категории"),
     min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
     max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
-    search: Optional[str] = Query(None, description="Поиск по названию"),
+    search: Optional[str] = Query(None, description="Поиск по названию и SKU (по началу слов)"),
     include_inactive: bool = Query(False, description="Включать неактивные товары"),
     include_out_of_stock: bool = Query(False, description="Включать товары не в наличии"),
     limit: int = Query(50, ge=1, le=100, description="Лимит записей"),
     offset: int = Query(0, ge=0, description="Смещение"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
+    db: Session = Depends(get_read_db)
 ):
     """
     Получить список товаров с фильтрами
@@ -38,70 +52,261 @@ def get_products(
     - **category**: Фильтр по названию категории
     - **min_price**: Минимальная цена
     - **max_price**: Максимальная цена  
-    - **search**: Поиск по названию товара
+    - **search**: Поиск по названию и SKU товара (полнотекстовый, по началу слов; должны найтись все слова)
     - **include_inactive**: Показать неактивные товары (по умолчанию false)
     - **include_out_of_stock**: Показать товары не в наличии (по умолчанию false)
     - **limit**: Количество записей (по умолчанию 50)
     - **offset**: Смещение для пагинации (по умолчанию 0)
+    - **cursor**: Курсор для keyset-пагинации. Если страница заполнена целиком,
+      курсор следующей страницы возвращается в заголовке **X-Next-Cursor**.
+      Стоимость страницы по курсору не зависит от её глубины. Вместе с offset не используется.
+
+    Ответ содержит **ETag** и **Last-Modified**; при актуальных If-None-Match /
+    If-Modified-Since возвращается 304 без запроса страницы.
+
+    С заголовком **Accept: application/vnd.warehouse.columnar+json** страница
+    отдается в колоночном виде: {"columns": [...], "rows": [[...], ...]}.
     """
+    filters = {
+        'category': category,
+        'min_price': min_price,
+        'max_price': max_price,
+        'search': search,
+        'include_inactive': include_inactive,
+        'include_out_of_stock': include_out_of_stock
+    }
+
+    statement, params = common.products_page_query(filters, limit, offset, cursor)
+
     try:
-        result = db.execute(
-            text("CALL GetProducts(:category, :min_price, :max_price, :search, :include_inactive, :include_out_of_stock, :limit, :offset)"),
-            {
-                'category': category,
-                'min_price': min_price,
-                'max_price': max_price,
-                'search': search,
-                'include_inactive': include_inactive,
-                'include_out_of_stock': include_out_of_stock,
-                'limit': limit,
-                'offset': offset
-            }
-        )
-        
-        products = result.fetchall()
-        return [dict(product._mapping) for product in products]
-        
+        # Версия каталога + параметры страницы -> ETag; при совпадении
+        # с If-None-Match страница не запрашивается
+        version = db.execute(conditional.CATALOG_VERSION).fetchone()
+        not_modified = common.catalog_not_modified(request, response, version, {**filters, 'limit': limit, 'offset': offset, 'cursor': cursor})
+        if not_modified is not None:
+            return not_modified
+
+        rows = db.execute(statement, params).fetchall()
+
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        raise common.database_error(e)
+
+    # Полная страница - отдаем курсор на следующую
+    return common.products_page_response(request, response, rows, limit, filters, ProductResponse)
+
+# ==================== Поиск товаров =====================
+
+@router.get("/products/search", response_model=List[ProductSearchResponse])
+def search_products(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=255, description="Строка поиска"),
+    include_inactive: bool = Query(False, description="Включать неактивные товары"),
+    limit: int = Query(20, ge=1, le=100, description="Лимит записей"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Полнотекстовый поиск товаров, отсортированный по релевантности
+    
+    Ищет по названию, SKU, а также бренду и модели термокружек.
+    Каждое слово запроса сопоставляется по началу слова, поэтому
+    эндпоинт подходит для автодополнения.
+    
+    - **q**: Строка поиска
+    - **include_inactive**: Показать неактивные товары (по умолчанию false)
+    - **limit**: Количество записей (по умолчанию 20)
+    """
+    params = common.search_params(q, include_inactive, limit)
+    if params is None:
+        return []
+
+    try:
+        rows = db.execute(common.SEARCH_PRODUCTS, params).fetchall()
+    except Exception as e:
+        raise common.database_error(e)
+
+    return common.rows_response(request, response, rows, ProductSearchResponse)
+
+# ==================== Фасеты для панели фильтров =====================
+
+@router.get("/products/facets", response_model=ProductFacetsResponse)
+def get_product_facets(
+    category: Optional[str] = Query(None, description="Фильтр по категории"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+    search: Optional[str] = Query(None, description="Поиск по названию и SKU (по началу слов)"),
+    include_inactive: bool = Query(False, description="Включать неактивные товары"),
+    include_out_of_stock: bool = Query(False, description="Включать товары не в наличии"),
+    price_step: float = Query(1000, gt=0, description="Ширина корзины гистограммы цен"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Счетчики для панели фильтров при текущем наборе фильтров
+
+    Фильтры те же, что у GET /products. Возвращает одним запросом:
+    - **total**: Сколько товаров подходит под фильтры
+    - **categories / brands / colors / materials**: Количество товаров по значениям
+    - **volumes**: Корзины объема (0-350, 351-500, 501-750, 751+ мл)
+    - **price_histogram**: Гистограмма цен с шагом **price_step**
+    - **hermetic**: Герметичные / негерметичные
+
+    Результат кэшируется по набору фильтров на FACETS_CACHE_TTL секунд.
+    """
+    filters = {
+        'category': category,
+        'min_price': min_price,
+        'max_price': max_price,
+        'search': search,
+        'include_inactive': include_inactive,
+        'include_out_of_stock': include_out_of_stock
+    }
+
+    key = common.facets_key(filters, price_step)
+    cached = facets_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        rows = db.execute(common.GET_PRODUCT_FACETS, common.facets_params(filters, price_step)).fetchall()
+    except Exception as e:
+        raise common.database_error(e)
+
+    facets = common.facets_from_rows(rows, price_step)
+    facets_cache.set(key, facets)
+    return facets
+
+# ==================== Список термокружек с фильтрами по атрибутам =====================
+
+@router.get("/products/thermocups", response_model=List[ThermocupResponse])
+def get_thermocups(
+    request: Request,
+    response: Response,
+    category: Optional[str] = Query(None, description="Фильтр по категории"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+    min_volume: Optional[int] = Query(None, ge=0, description="Минимальный объем, мл"),
+    max_volume: Optional[int] = Query(None, ge=0, description="Максимальный объем, мл"),
+    color: Optional[List[str]] = Query(None, description="Цвет (можно несколько)"),
+    brand: Optional[List[str]] = Query(None, description="Бренд (можно несколько)"),
+    material: Optional[List[str]] = Query(None, description="Материал (можно несколько)"),
+    is_hermetic: Optional[bool] = Query(None, description="Герметичность"),
+    include_inactive: bool = Query(False, description="Включать неактивные товары"),
+    include_out_of_stock: bool = Query(False, description="Включать товары не в наличии"),
+    limit: int = Query(50, ge=1, le=100, description="Лимит записей"),
+    offset: int = Query(0, ge=0, description="Смещение"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Получить список термокружек с фильтрами по атрибутам
+
+    - **min_volume / max_volume**: Диапазон объема в мл
+    - **color / brand / material**: Одно или несколько значений (?color=черный&color=белый)
+    - **is_hermetic**: Только герметичные (true) или негерметичные (false)
+    - **category / min_price / max_price / include_inactive / include_out_of_stock**: Как в GET /products
+    - **limit / offset**: Пагинация
+
+    Сортировка та же, что у GET /products. Атрибутные фильтры опираются
+    на составные индексы product_attributes_thermocups, поэтому читаются
+    только подходящие строки, а не вся категория.
+    """
+    filters = {
+        'category': category,
+        'min_price': min_price,
+        'max_price': max_price,
+        'min_volume': min_volume,
+        'max_volume': max_volume,
+        'color': color,
+        'brand': brand,
+        'material': material,
+        'is_hermetic': is_hermetic,
+        'include_inactive': include_inactive,
+        'include_out_of_stock': include_out_of_stock
+    }
+
+    statement, params = common.thermocups_query(filters, limit, offset)
+
+    try:
+        rows = db.execute(statement, params).fetchall()
+    except Exception as e:
+        raise common.database_error(e)
+
+    return common.rows_response(request, response, rows, ThermocupResponse)
+
+# ==================== Пакетное получение товаров =====================
+
+@router.post("/products/lookup", response_model=ProductLookupResponse)
+def lookup_products(
+    request: ProductLookupRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Получить много товаров одним запросом (корзина, заказ, избранное)
+
+    - **ids**: ID товаров (до 500)
+    - **skus**: SKU товаров (до 500)
+
+    Возвращает товары по ключу ID, а также ID и SKU, которых нет в каталоге.
+    Товары по ID сначала ищутся в кэше карточек; остальные читаются
+    из БД одним вызовом GetProductsByIds.
+    """
+    common.check_lookup_request(request.ids, request.skus)
+
+    found, misses = common.lookup_cached(request.ids)
+    rows = []
+
+    generation = product_cache.generation
+    if misses or request.skus:
+        try:
+            rows = db.execute(common.GET_PRODUCTS_BY_IDS, common.lookup_params(misses, request.skus)).fetchall()
+        except Exception as e:
+            raise common.database_error(e)
+
+    return common.lookup_response(found, rows, request.ids, request.skus, generation)
 
 # ==================== Получение товара по ID =====================
 
 @router.get("/products/{product_id}", response_model=ProductResponse)
 def get_product_by_id(
     product_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db)
 ):
     """
     Получить товар по ID
     
     - **product_id**: ID товара
+
+    Поддерживает условные запросы (If-None-Match / If-Modified-Since -> 304).
     """
+    # Условный запрос: версия - одно чтение строки products по первичному ключу
+    if conditional.is_conditional(request):
+        try:
+            version = db.execute(conditional.PRODUCT_VERSION, {'product_id': product_id}).fetchone()
+        except Exception as e:
+            raise common.database_error(e)
+        not_modified = conditional.product_not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    cached = common.cached_card_response(response, product_key(product_id))
+    if cached is not None:
+        return cached
+
+    generation = product_cache.generation
     try:
-        result = db.execute(
-            text("CALL GetProductById(:product_id)"),
-            {'product_id': product_id}
-        )
-        
-        product = result.fetchone()
-        
-        if not product:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Product with ID {product_id} not found"
-            )
-            
-        return dict(product._mapping)
-        
-    except HTTPException:
-        raise
+        row = db.execute(common.GET_PRODUCT_BY_ID, {'product_id': product_id}).fetchone()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        raise common.database_error(e)
+
+    return common.card_response(db, response, product_key(product_id), common.product_card(row, product_id), generation)
 
 @router.get("/products/thermocups/{product_id}", response_model=ThermocupResponse)
 def get_thermocup_by_id(
     product_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db)
 ):
     """
     Получить детальную информацию о термокружке по ID
@@ -109,31 +314,30 @@ def get_thermocup_by_id(
     Возвращает:
     - Все поля из ProductResponse (базовые данные товара)
     - Специфичные атрибуты термокружки
-    - Информацию о наличии на складах
+    - Информацию о наличии на складах: списком **warehouses**
+      (warehouse_id, warehouse_name, quantity) и строкой **warehouse_info**
     """
+    # Условный запрос: версия - одно чтение строки products по первичному ключу
+    if conditional.is_conditional(request):
+        try:
+            version = db.execute(conditional.PRODUCT_VERSION, {'product_id': product_id}).fetchone()
+        except Exception as e:
+            raise common.database_error(e)
+        not_modified = conditional.product_not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    cached = common.cached_card_response(response, thermocup_key(product_id))
+    if cached is not None:
+        return cached
+
+    generation = product_cache.generation
     try:
-        result = db.execute(
-            text("CALL GetThermocupById(:product_id)"),
-            {'product_id': product_id}
-        )
-        
-        thermocup = result.fetchone()
-        
-        if not thermocup:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Thermocup with ID {product_id} not found"
-            )
-            
-        return dict(thermocup._mapping)
-        
-    except HTTPException:
-        raise
+        row = db.execute(common.GET_THERMOCUP_BY_ID, {'product_id': product_id}).fetchone()
     except Exception as e:
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Database error: {str(e)}"
-        )
+        raise common.database_error(e)
+
+    return common.card_response(db, response, thermocup_key(product_id), common.thermocup_card(row, product_id), generation)
 
 # ==================== СПЕЦИАЛИЗИРОВАННЫЕ ФИЛЬТРЫ ====================
 
@@ -144,7 +348,6 @@ def create_thermocup(
     product_data: ProductCreateThermocup,
     db: Session = Depends(get_db)
 ):
-    print("LOG: create_thermocup: запрос получен: %s", product_data.name)
     """
     Создать новую термокружку
     
@@ -163,68 +366,29 @@ def create_thermocup(
         - **path_to_photo**:  Путь к фото (url-link) (опционально)
     """
     try:
-        print("LOG: create_thermocup: try: %s", product_data.name)
         # Вызываем хранимую процедуру для создания термокружки
         result = db.execute(
-            text("CALL CreateThermos(:name, :category_id, :base_price, :initial_quantity, :warehouse_id, :volume_ml, :color, :brand, :model, :is_hermetic, :material, :path_to_photo)"),
-            {
-                'name': product_data.name,
-                'category_id': product_data.category_id,
-                'base_price': product_data.base_price,
-                # 'description': product_data.description,
-                'initial_quantity': product_data.initial_quantity,
-                'warehouse_id': product_data.warehouse_id,
-                'volume_ml': product_data.attributes.volume_ml,
-                'color': product_data.attributes.color,
-                'brand': product_data.attributes.brand,
-                'model': product_data.attributes.model or '',
-                'is_hermetic': 1 if product_data.attributes.is_hermetic else 0,
-                'material': product_data.attributes.material or '',
-                'path_to_photo': product_data.path_to_photo or ''
-            }
+            common.CREATE_THERMOS,
+            common.create_thermocup_params(product_data)
         )
         
-        print("LOG: create_thermocup: Получаем созданный товар: %s", product_data.name)
         # Получаем созданный товар
         new_product = result.fetchone()
         
         # Фиксируем изменения в БД
         db.commit()
+        new_product = dict(new_product._mapping)
+        invalidate_product(new_product['id'])
         
-        print("LOG: create_thermocup: thermocup added: ", product_data.name)
-        return dict(new_product._mapping)
+        logger.info("create_thermocup: товар создан", extra={'product_id': new_product['id'], 'sampled': True})
+        return new_product
         
     except Exception as e:
         # Откатываем изменения в случае ошибки
         db.rollback()
         
         # Обрабатываем возможные ошибки БД
-        error_msg = str(e)
-        if "Duplicate entry" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Товар с таким названием уже существует"
-            )
-        elif "Category not found" in error_msg or "foreign key constraint fails" in error_msg and "category_id" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Указанная категория не существует"
-            )
-        elif "foreign key constraint fails" in error_msg and "warehouse_id" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, 
-                detail="Указанный склад не существует"
-            )
-        elif "thermocups" in error_msg.lower():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Неверная категория для термокружки. Убедитесь что category_id соответствует категории 'thermocups'"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Ошибка при создании термокружки: {error_msg}"
-            )
+        raise common.create_thermocup_error(str(e))
 
 # ==================== Обновление продукта Thermocup =====================
 
@@ -248,59 +412,26 @@ def update_thermocup(
         - **attributes**: Специфичные атрибуты термокружки
     """
     try:
-        print(f"LOG: update_thermocup: обновление товара ID {product_id}")
-        
         # Подготавливаем параметры для процедуры
-        params = {
-            'product_id': product_id,
-            'name': product_data.name,
-            'category_id': product_data.category_id,
-            'base_price': product_data.base_price,
-            'sku': product_data.sku,
-            'is_active': product_data.is_active,
-            'path_to_photo': product_data.path_to_photo,
-            # Атрибуты термокружки (может быть None)
-            'volume_ml': None,
-            'color': None,
-            'brand': None,
-            'model': None,
-            'is_hermetic': None,
-            'material': None
-        }
-        
-        # Если переданы атрибуты, заполняем их
-        if product_data.attributes:
-            params.update({
-                'volume_ml': product_data.attributes.volume_ml,
-                'color': product_data.attributes.color,
-                'brand': product_data.attributes.brand,
-                'model': product_data.attributes.model,
-                'is_hermetic': product_data.attributes.is_hermetic,
-                'material': product_data.attributes.material
-            })
+        params = common.update_thermocup_params(product_id, product_data)
         
-        print(f"LOG: Параметры обновления: {params}")
+        logger.debug("update_thermocup: обновляемые поля", extra={'product_id': product_id, 'fields': sorted(k for k, v in params.items() if v is not None)})
         
         # Вызываем хранимую процедуру для обновления
         result = db.execute(
-            text("CALL UpdateThermocup(:product_id, :name, :category_id, :base_price, :sku, :is_active, :path_to_photo, :volume_ml, :color, :brand, :model, :is_hermetic, :material)"),
+            common.UPDATE_THERMOCUP,
             params
         )
         
         # Получаем обновленный товар
-        updated_product = result.fetchone()
-        
-        if not updated_product:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Товар не найден"
-            )
-        
+        updated_product = common.written_row(result.fetchone())
+
         # Фиксируем изменения в БД
         db.commit()
-        print(f"LOG: Товар ID {product_id} успешно обновлен")
-        
-        return dict(updated_product._mapping)
+        invalidate_product(product_id)
+        logger.info("update_thermocup: товар обновлен", extra={'product_id': product_id, 'sampled': True})
+
+        return updated_product
         
     except HTTPException:
         raise
@@ -309,29 +440,10 @@ def update_thermocup(
         db.rollback()
         error_msg = str(e)
         
-        print(f"LOG: Ошибка при обновлении товара: {error_msg}")
+        logger.warning("update_thermocup: ошибка обновления", extra={'product_id': product_id, 'error': error_msg})
         
         # Обрабатываем возможные ошибки БД
-        if "Duplicate entry" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Товар с таким SKU уже существует"
-            )
-        elif "foreign key constraint fails" in error_msg and "category_id" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Указанная категория не существует"
-            )
-        elif "Product not found" in error_msg or "doesn't exist" in error_msg.lower():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Товар не найден"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Ошибка при обновлении термокружки: {error_msg}"
-            )
+        raise common.update_thermocup_error(error_msg)
 
 @router.patch("/products/thermocups/update/{product_id}/reserved", response_model=ReservedGoodsResponse)
 def update_thermocup_num_reserved_goods(
@@ -344,62 +456,40 @@ def update_thermocup_num_reserved_goods(
     
     - **product_id**: ID товара
     - **quantity_change**: Изменение количества (положительное - прибавить, отрицательное - отнять)
+
+    Изменение записывается в журнал резервов: прибавка - подтвержденный резерв
+    (владелец patch:reserved), уменьшение - отгрузка резервов patch:reserved
+    товара, начиная со старых. Резервы заказов и POST /reservations этим
+    эндпоинтом не снимаются: 400, если резервов patch:reserved меньше уменьшения.
+    **reserved_quantity** в ответе - текущий резерв; в списках и карточке
+    товара он появляется с задержкой до RESERVED_SYNC_INTERVAL_MS.
     """
     try:
-        print(f"LOG: update_thermocup_num_reserved_goods: товар ID {product_id}, изменение: {request.quantity_change}")
-        
         result = db.execute(
-            text("CALL UpdateProductReservedGoods(:product_id, :quantity_change)"),
-            {
-                'product_id': product_id,
-                'quantity_change': request.quantity_change
-            }
+            common.UPDATE_RESERVED_GOODS,
+            common.reserved_goods_params(product_id, request)
         )
-        
-        updated_product = result.fetchone()
-        
-        if not updated_product:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Товар не найден"
-            )
-        
+
+        updated_product = common.written_row(result.fetchone())
+
         db.commit()
-        
-        print(f"LOG: Зарезервированное количество обновлено: {dict(updated_product._mapping)}")
-        
-        return dict(updated_product._mapping)
+        reservations.reserved_changed([product_id])
+
+        logger.info("update_reserved: резерв обновлен", extra={'product_id': product_id, 'quantity_change': request.quantity_change, 'sampled': True})
+
+        return updated_product
         
     except HTTPException:
         raise
     except Exception as e:
         db.rollback()
         error_msg = str(e)
-        print(f"LOG: Ошибка при обновлении зарезервированного количества: {error_msg}")
+        logger.warning("update_reserved: ошибка обновления резерва", extra={'product_id': product_id, 'quantity_change': request.quantity_change, 'error': error_msg})
         
-        if "Product not found" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Товар не найден"
-            )
-        elif "Reserved quantity cannot be negative" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Зарезервированное количество не может быть отрицательным"
-            )
-        elif "Not enough available goods to reserve" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Недостаточно доступного товара для резервирования"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Ошибка при обновлении зарезервированного количества: {error_msg}"
-            )
+        raise common.reserved_goods_error(error_msg)
 
 @router.patch("/products/thermocups/update/{product_id}/stock", response_model=StockQuantityResponse)
-def update_thermocup_quantity(
+async def update_thermocup_quantity(
     product_id: int,
     request: UpdateStockQuantityRequest,
     db: Session = Depends(get_db)
@@ -411,64 +501,45 @@ def update_thermocup_quantity(
     - **warehouse_id**: ID склада
     - **quantity_change**: Изменение количества (положительное - прибавить, отрицательное - отнять)
     """
+    # STOCK_COALESCING: параллельные изменения того же товара и склада
+    # применяются одной транзакцией (app/coalescing.py). Обработчик
+    # асинхронный: запрос ждет пачку в event loop, а не в потоке threadpool
+    if coalescing.STOCK_COALESCING:
+        try:
+            result = await coalescing.stock_coalescer.submit(product_id, request.warehouse_id, request.quantity_change)
+        except Exception as e:
+            raise common.coalesced_stock_error(e)
+        updated_stock = common.coalesced_stock_response(result)
+        invalidate_product(product_id)
+        return updated_stock
+
+    return await run_in_threadpool(_update_stock, db, product_id, request)
+
+def _update_stock(db: Session, product_id: int, request: UpdateStockQuantityRequest):
+    """Изменение остатка без склейки - процедурой UpdateProductStockQuantity"""
     try:
-        print(f"LOG: update_thermocup_quantity: товар ID {product_id}, склад ID {request.warehouse_id}, изменение: {request.quantity_change}")
-        
         result = db.execute(
-            text("CALL UpdateProductStockQuantity(:product_id, :warehouse_id, :quantity_change)"),
-            {
-                'product_id': product_id,
-                'warehouse_id': request.warehouse_id,
-                'quantity_change': request.quantity_change
-            }
+            common.UPDATE_STOCK_QUANTITY,
+            common.stock_quantity_params(product_id, request)
         )
-        
-        updated_stock = result.fetchone()
-        
-        if not updated_stock:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Товар или склад не найден"
-            )
-        
+
+        updated_stock = common.written_row(result.fetchone(), "Товар или склад не найден")
+
         db.commit()
-        
-        print(f"LOG: Количество на складе обновлено: {dict(updated_stock._mapping)}")
-        
-        return dict(updated_stock._mapping)
+        invalidate_product(product_id)
+
+        logger.info("update_stock: остаток обновлен", extra={'product_id': product_id, 'warehouse_id': request.warehouse_id, 'quantity_change': request.quantity_change, 'sampled': True})
+
+        return updated_stock
         
     except HTTPException:
         raise
     except Exception as e:
         db.rollback()
         error_msg = str(e)
-        print(f"LOG: Ошибка при обновлении количества на складе: {error_msg}")
+        logger.warning("update_stock: ошибка обновления остатка", extra={'product_id': product_id, 'warehouse_id': request.warehouse_id, 'quantity_change': request.quantity_change, 'error': error_msg})
         
-        if "Product not found" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Товар не найден"
-            )
-        elif "Warehouse not found" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Склад не найден"
-            )
-        elif "Stock quantity cannot be negative" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Количество на складе не может быть отрицательным"
-            )
-        elif "Cannot remove quantity from non-existing stock" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Нельзя уменьшить количество несуществующего запаса"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Ошибка при обновлении количества на складе: {error_msg}"
-            )
+        raise common.stock_quantity_error(error_msg)
 
 # @router.patch("/thermocups/{product_id}", response_model=ProductResponse)
 # def update_thermocup_(
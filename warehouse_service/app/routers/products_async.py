@@ -0,0 +1,403 @@
+"""
+Асинхронная версия роутера товаров (включается DB_ASYNC=true).
+
+Пути, параметры и ответы совпадают с app/routers/products.py; обработчики
+только выполняют запросы через AsyncSession поверх aiomysql, а параметры,
+разбор строк, условные запросы, кэш карточек и ошибки - общие (app/routers/common.py).
+"""
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List
+from app.models import ProductResponse
+from app.models import ProductCreateThermocup
+from app.models import ProductUpdateThermocup
+from app.models import ReservedGoodsResponse
+from app.models import UpdateReservedGoodsRequest
+from app.models import StockQuantityResponse
+from app.models import UpdateStockQuantityRequest
+from app.models import ThermocupResponse
+from app.models import ProductSearchResponse
+from app.models import ProductFacetsResponse
+from app.models import ProductLookupRequest
+from app.models import ProductLookupResponse
+from app.cache import product_cache, facets_cache, product_key, thermocup_key, invalidate_product
+from app.routers import common
+from app import coalescing, conditional, reservations
+
+from app.database import get_async_db, get_async_read_db
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+# ==================== Получение всех товаров =====================
+
+@router.get("/products", response_model=List[ProductResponse])
+async def get_products(
+    request: Request,
+    response: Response,
+    category: Optional[str] = Query(None, description="Фильтр по категории"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+    search: Optional[str] = Query(None, description="Поиск по названию и SKU (по началу слов)"),
+    include_inactive: bool = Query(False, description="Включать неактивные товары"),
+    include_out_of_stock: bool = Query(False, description="Включать товары не в наличии"),
+    limit: int = Query(50, ge=1, le=100, description="Лимит записей"),
+    offset: int = Query(0, ge=0, description="Смещение"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Получить список товаров с фильтрами (см. описание в синхронном роутере)
+    """
+    filters = {
+        'category': category,
+        'min_price': min_price,
+        'max_price': max_price,
+        'search': search,
+        'include_inactive': include_inactive,
+        'include_out_of_stock': include_out_of_stock
+    }
+
+    statement, params = common.products_page_query(filters, limit, offset, cursor)
+
+    try:
+        version = (await db.execute(conditional.CATALOG_VERSION)).fetchone()
+        not_modified = common.catalog_not_modified(request, response, version, {**filters, 'limit': limit, 'offset': offset, 'cursor': cursor})
+        if not_modified is not None:
+            return not_modified
+
+        rows = (await db.execute(statement, params)).fetchall()
+
+    except Exception as e:
+        raise common.database_error(e)
+
+    return common.products_page_response(request, response, rows, limit, filters, ProductResponse)
+
+# ==================== Поиск товаров =====================
+
+@router.get("/products/search", response_model=List[ProductSearchResponse])
+async def search_products(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=255, description="Строка поиска"),
+    include_inactive: bool = Query(False, description="Включать неактивные товары"),
+    limit: int = Query(20, ge=1, le=100, description="Лимит записей"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Полнотекстовый поиск товаров, отсортированный по релевантности
+    """
+    params = common.search_params(q, include_inactive, limit)
+    if params is None:
+        return []
+
+    try:
+        rows = (await db.execute(common.SEARCH_PRODUCTS, params)).fetchall()
+    except Exception as e:
+        raise common.database_error(e)
+
+    return common.rows_response(request, response, rows, ProductSearchResponse)
+
+# ==================== Фасеты для панели фильтров =====================
+
+@router.get("/products/facets", response_model=ProductFacetsResponse)
+async def get_product_facets(
+    category: Optional[str] = Query(None, description="Фильтр по категории"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+    search: Optional[str] = Query(None, description="Поиск по названию и SKU (по началу слов)"),
+    include_inactive: bool = Query(False, description="Включать неактивные товары"),
+    include_out_of_stock: bool = Query(False, description="Включать товары не в наличии"),
+    price_step: float = Query(1000, gt=0, description="Ширина корзины гистограммы цен"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Счетчики для панели фильтров (см. описание в синхронном роутере)
+    """
+    filters = {
+        'category': category,
+        'min_price': min_price,
+        'max_price': max_price,
+        'search': search,
+        'include_inactive': include_inactive,
+        'include_out_of_stock': include_out_of_stock
+    }
+
+    key = common.facets_key(filters, price_step)
+    cached = facets_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        rows = (await db.execute(common.GET_PRODUCT_FACETS, common.facets_params(filters, price_step))).fetchall()
+    except Exception as e:
+        raise common.database_error(e)
+
+    facets = common.facets_from_rows(rows, price_step)
+    facets_cache.set(key, facets)
+    return facets
+
+# ==================== Список термокружек с фильтрами по атрибутам =====================
+
+@router.get("/products/thermocups", response_model=List[ThermocupResponse])
+async def get_thermocups(
+    request: Request,
+    response: Response,
+    category: Optional[str] = Query(None, description="Фильтр по категории"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+    min_volume: Optional[int] = Query(None, ge=0, description="Минимальный объем, мл"),
+    max_volume: Optional[int] = Query(None, ge=0, description="Максимальный объем, мл"),
+    color: Optional[List[str]] = Query(None, description="Цвет (можно несколько)"),
+    brand: Optional[List[str]] = Query(None, description="Бренд (можно несколько)"),
+    material: Optional[List[str]] = Query(None, description="Материал (можно несколько)"),
+    is_hermetic: Optional[bool] = Query(None, description="Герметичность"),
+    include_inactive: bool = Query(False, description="Включать неактивные товары"),
+    include_out_of_stock: bool = Query(False, description="Включать товары не в наличии"),
+    limit: int = Query(50, ge=1, le=100, description="Лимит записей"),
+    offset: int = Query(0, ge=0, description="Смещение"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Получить список термокружек с фильтрами по атрибутам (см. описание в синхронном роутере)
+    """
+    filters = {
+        'category': category,
+        'min_price': min_price,
+        'max_price': max_price,
+        'min_volume': min_volume,
+        'max_volume': max_volume,
+        'color': color,
+        'brand': brand,
+        'material': material,
+        'is_hermetic': is_hermetic,
+        'include_inactive': include_inactive,
+        'include_out_of_stock': include_out_of_stock
+    }
+
+    statement, params = common.thermocups_query(filters, limit, offset)
+
+    try:
+        rows = (await db.execute(statement, params)).fetchall()
+    except Exception as e:
+        raise common.database_error(e)
+
+    return common.rows_response(request, response, rows, ThermocupResponse)
+
+# ==================== Пакетное получение товаров =====================
+
+@router.post("/products/lookup", response_model=ProductLookupResponse)
+async def lookup_products(
+    request: ProductLookupRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Получить много товаров одним запросом (см. описание в синхронном роутере)
+    """
+    common.check_lookup_request(request.ids, request.skus)
+
+    found, misses = common.lookup_cached(request.ids)
+    rows = []
+
+    generation = product_cache.generation
+    if misses or request.skus:
+        try:
+            rows = (await db.execute(common.GET_PRODUCTS_BY_IDS, common.lookup_params(misses, request.skus))).fetchall()
+        except Exception as e:
+            raise common.database_error(e)
+
+    return common.lookup_response(found, rows, request.ids, request.skus, generation)
+
+# ==================== Получение товара по ID =====================
+
+@router.get("/products/{product_id}", response_model=ProductResponse)
+async def get_product_by_id(
+    product_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Получить товар по ID
+    """
+    if conditional.is_conditional(request):
+        try:
+            version = (await db.execute(conditional.PRODUCT_VERSION, {'product_id': product_id})).fetchone()
+        except Exception as e:
+            raise common.database_error(e)
+        not_modified = conditional.product_not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    cached = common.cached_card_response(response, product_key(product_id))
+    if cached is not None:
+        return cached
+
+    generation = product_cache.generation
+    try:
+        row = (await db.execute(common.GET_PRODUCT_BY_ID, {'product_id': product_id})).fetchone()
+    except Exception as e:
+        raise common.database_error(e)
+
+    return common.card_response(db, response, product_key(product_id), common.product_card(row, product_id), generation)
+
+@router.get("/products/thermocups/{product_id}", response_model=ThermocupResponse)
+async def get_thermocup_by_id(
+    product_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Получить детальную информацию о термокружке по ID
+    """
+    if conditional.is_conditional(request):
+        try:
+            version = (await db.execute(conditional.PRODUCT_VERSION, {'product_id': product_id})).fetchone()
+        except Exception as e:
+            raise common.database_error(e)
+        not_modified = conditional.product_not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+    cached = common.cached_card_response(response, thermocup_key(product_id))
+    if cached is not None:
+        return cached
+
+    generation = product_cache.generation
+    try:
+        row = (await db.execute(common.GET_THERMOCUP_BY_ID, {'product_id': product_id})).fetchone()
+    except Exception as e:
+        raise common.database_error(e)
+
+    return common.card_response(db, response, thermocup_key(product_id), common.thermocup_card(row, product_id), generation)
+
+# ==================== Создание и обновление термокружек =====================
+
+@router.post("/products/thermocups/create", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
+async def create_thermocup(
+    product_data: ProductCreateThermocup,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Создать новую термокружку
+    """
+    try:
+        result = await db.execute(common.CREATE_THERMOS, common.create_thermocup_params(product_data))
+        new_product = result.fetchone()
+
+        await db.commit()
+        new_product = dict(new_product._mapping)
+        invalidate_product(new_product['id'])
+
+        logger.info("create_thermocup: товар создан", extra={'product_id': new_product['id'], 'sampled': True})
+        return new_product
+
+    except Exception as e:
+        await db.rollback()
+        raise common.create_thermocup_error(str(e))
+
+@router.put("/products/thermocups/update/{product_id}", response_model=ProductResponse)
+async def update_thermocup(
+    product_id: int,
+    product_data: ProductUpdateThermocup,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Обновить термокружку по ID
+    """
+    try:
+        params = common.update_thermocup_params(product_id, product_data)
+
+        logger.debug("update_thermocup: обновляемые поля", extra={'product_id': product_id, 'fields': sorted(k for k, v in params.items() if v is not None)})
+
+        result = await db.execute(common.UPDATE_THERMOCUP, params)
+        updated_product = common.written_row(result.fetchone())
+
+        await db.commit()
+        invalidate_product(product_id)
+        logger.info("update_thermocup: товар обновлен", extra={'product_id': product_id, 'sampled': True})
+
+        return updated_product
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        error_msg = str(e)
+
+        logger.warning("update_thermocup: ошибка обновления", extra={'product_id': product_id, 'error': error_msg})
+
+        raise common.update_thermocup_error(error_msg)
+
+@router.patch("/products/thermocups/update/{product_id}/reserved", response_model=ReservedGoodsResponse)
+async def update_thermocup_num_reserved_goods(
+    product_id: int,
+    request: UpdateReservedGoodsRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Обновить количество зарезервированного товара
+    """
+    try:
+        result = await db.execute(common.UPDATE_RESERVED_GOODS, common.reserved_goods_params(product_id, request))
+        updated_product = common.written_row(result.fetchone())
+
+        await db.commit()
+        reservations.reserved_changed([product_id])
+
+        logger.info("update_reserved: резерв обновлен", extra={'product_id': product_id, 'quantity_change': request.quantity_change, 'sampled': True})
+
+        return updated_product
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        error_msg = str(e)
+        logger.warning("update_reserved: ошибка обновления резерва", extra={'product_id': product_id, 'quantity_change': request.quantity_change, 'error': error_msg})
+
+        raise common.reserved_goods_error(error_msg)
+
+@router.patch("/products/thermocups/update/{product_id}/stock", response_model=StockQuantityResponse)
+async def update_thermocup_quantity(
+    product_id: int,
+    request: UpdateStockQuantityRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Обновить количество товара на складе
+    """
+    # STOCK_COALESCING: параллельные изменения того же товара и склада
+    # применяются одной транзакцией (app/coalescing.py, asyncio-вариант)
+    if coalescing.STOCK_COALESCING:
+        try:
+            result = await coalescing.async_stock_coalescer.submit(product_id, request.warehouse_id, request.quantity_change)
+        except Exception as e:
+            raise common.coalesced_stock_error(e)
+        updated_stock = common.coalesced_stock_response(result)
+        invalidate_product(product_id)
+        return updated_stock
+
+    try:
+        result = await db.execute(common.UPDATE_STOCK_QUANTITY, common.stock_quantity_params(product_id, request))
+        updated_stock = common.written_row(result.fetchone(), "Товар или склад не найден")
+
+        await db.commit()
+        invalidate_product(product_id)
+
+        logger.info("update_stock: остаток обновлен", extra={'product_id': product_id, 'warehouse_id': request.warehouse_id, 'quantity_change': request.quantity_change, 'sampled': True})
+
+        return updated_stock
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        error_msg = str(e)
+        logger.warning("update_stock: ошибка обновления остатка", extra={'product_id': product_id, 'warehouse_id': request.warehouse_id, 'quantity_change': request.quantity_change, 'error': error_msg})
+
+        raise common.stock_quantity_error(error_msg)
@@ -0,0 +1,125 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import List
+
+from app.models import ReservationCreateRequest
+from app.models import ReservationResponse
+from app import reservations
+from app.reservations import ReservationConflictError, ReservationNotFoundError
+
+from app.database import get_db
+
+router = APIRouter()
+
+def _run(db: Session, action, *args):
+    """Выполнить переход резерва в транзакции и перевести ошибки в HTTP"""
+    try:
+        reservation = action(db, *args)
+        db.commit()
+        return reservation
+
+    except ReservationNotFoundError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ReservationConflictError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при изменении резерва: {str(e)}"
+        )
+
+# ==================== Журнал резервов =====================
+
+@router.post("/reservations", response_model=ReservationResponse, status_code=status.HTTP_201_CREATED)
+def create_reservation(
+    request: ReservationCreateRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Зарезервировать товар на время
+
+    - **product_id**: ID товара
+    - **quantity**: Количество (> 0)
+    - **owner**: Владелец резерва (корзина, заказ, клиент)
+    - **ttl_seconds**: Срок жизни резерва (по умолчанию RESERVATION_TTL)
+
+    Не подтвержденный до **expires_at** резерв снимается автоматически.
+    404 - товар не найден, 409 - недостаточно доступного товара.
+    """
+    reservation = _run(
+        db, reservations.create_reservation,
+        request.product_id, request.quantity, request.owner, request.ttl_seconds or reservations.RESERVATION_TTL
+    )
+    reservations.reserved_changed([request.product_id])
+    return reservation
+
+@router.get("/reservations", response_model=List[ReservationResponse])
+def get_reservations(
+    owner: str = Query(..., min_length=1, max_length=255, description="Владелец резерва"),
+    limit: int = Query(100, ge=1, le=1000, description="Лимит записей"),
+    db: Session = Depends(get_db)
+):
+    """
+    Резервы владельца по возрастанию ID
+
+    Резервы POST /orders/reserve записаны с владельцем **order:<order_id>**,
+    прибавки PATCH .../reserved - с владельцем **patch:reserved**.
+    """
+    return reservations.list_reservations(db, owner, limit)
+
+@router.get("/reservations/{reservation_id}", response_model=ReservationResponse)
+def get_reservation(
+    reservation_id: int,
+    db: Session = Depends(get_db)
+):
+    """Получить резерв по ID"""
+    try:
+        return reservations.get_reservation(db, reservation_id)
+    except ReservationNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+@router.post("/reservations/{reservation_id}/confirm", response_model=ReservationResponse)
+def confirm_reservation(
+    reservation_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    Подтвердить резерв (заказ оформлен)
+
+    Подтвержденный резерв не истекает; количество остается зарезервированным
+    до отгрузки (POST /reservations/{id}/fulfil). 409 - резерв уже истек,
+    отменен или подтвержден.
+    """
+    return _run(db, reservations.confirm_reservation, reservation_id)
+
+@router.post("/reservations/{reservation_id}/cancel", response_model=ReservationResponse)
+def cancel_reservation(
+    reservation_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    Отменить резерв и вернуть количество в доступное
+
+    409 - резерв не активен (уже истек, отменен или подтвержден).
+    """
+    reservation = _run(db, reservations.cancel_reservation, reservation_id)
+    reservations.reserved_changed([reservation['product_id']])
+    return reservation
+
+@router.post("/reservations/{reservation_id}/fulfil", response_model=ReservationResponse)
+def fulfil_reservation(
+    reservation_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    Отгрузить подтвержденный резерв
+
+    Количество снимается с зарезервированного (остатки на складах меняются
+    отдельно - PATCH .../stock). 409 - резерв не подтвержден или уже отгружен.
+    """
+    reservation = _run(db, reservations.fulfil_reservation, reservation_id)
+    reservations.reserved_changed([reservation['product_id']])
+    return reservation
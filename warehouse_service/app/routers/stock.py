@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.models import BatchStockAdjustmentRequest
+from app.models import BatchStockAdjustmentResponse
+from app.models import StockMatrixRequest
+from app.models import StockMatrixResponse
+from app.cache import invalidate_product
+from app.stock import apply_stock_adjustments, stock_matrix
+
+from app.database import get_db
+
+router = APIRouter()
+
+# ==================== Пакетное изменение остатков =====================
+
+@router.post("/products/stock/batch", response_model=BatchStockAdjustmentResponse)
+def batch_update_stock(
+    request: BatchStockAdjustmentRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Применить пакет изменений остатков одной транзакцией
+
+    - **lines**: Список изменений
+        - **product_id**: ID товара
+        - **warehouse_id**: ID склада
+        - **quantity_change**: Изменение количества (положительное - прибавить, отрицательное - отнять)
+
+    Строки применяются по порядку, каждая видит результат предыдущих.
+    Пакет применяется целиком или не применяется вовсе: если хотя бы одна
+    строка ошибочна, возвращается 409 с результатами по всем строкам
+    (status = rejected у ошибочных, not_applied у остальных).
+    """
+    lines = [(line.product_id, line.warehouse_id, line.quantity_change) for line in request.lines]
+
+    try:
+        results, changed = apply_stock_adjustments(db, lines)
+
+        if not all(result['status'] == 'applied' for result in results):
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={
+                    'message': "Пакет не применен: есть ошибочные строки",
+                    'results': results
+                }
+            )
+
+        db.commit()
+
+        if changed:
+            for product_id in {product_id for product_id, _, _ in lines}:
+                invalidate_product(product_id)
+
+        return {'applied': True, 'results': results}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при пакетном обновлении остатков: {str(e)}"
+        )
+
+# ==================== Матрица остатков товар x склад =====================
+
+@router.post("/products/stock/matrix", response_model=StockMatrixResponse)
+def get_stock_matrix(
+    request: StockMatrixRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Остатки многих товаров по всем складам одним запросом
+
+    - **product_ids**: ID товаров (до 1000)
+
+    В ответе:
+    - **warehouses**: Склады, на которых есть остатки запрошенных товаров
+    - **products**: По каждому найденному товару - total_quantity и
+      quantities {warehouse_id: количество}
+    - **missing_product_ids**: ID, которых нет в каталоге
+    """
+    try:
+        return stock_matrix(db, request.product_ids)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database error: {str(e)}"
+        )
@@ -1,6 +1,7 @@
 from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Boolean
 # from sqlalchemy.types import Decimal
 from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Boolean, Numeric
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -27,7 +28,7 @@ class Product(Base):
     num_reserved_goods = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
-    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    updated_at = Column(mysql.TIMESTAMP(fsp=6), server_default=func.now(6), onupdate=func.now(6))
     
     category = relationship("Category", back_populates="products")
     stocks = relationship("ProductStock", back_populates="product")
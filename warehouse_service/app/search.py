@@ -0,0 +1,33 @@
+import re
+from typing import Optional
+
+# Слова запроса: буквы/цифры любого алфавита. Всё остальное (в том числе
+# операторы boolean-режима FULLTEXT: + - < > ( ) ~ * " @) отбрасывается.
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+MAX_QUERY_TOKENS = 8
+
+
+def build_boolean_query(raw: Optional[str], require_all: bool = False) -> Optional[str]:
+    """
+    Превратить пользовательскую строку поиска в запрос MATCH ... AGAINST
+    в BOOLEAN MODE.
+
+    Каждое слово ищется по префиксу ("терм" -> "терм*"), поэтому запрос
+    подходит для автодополнения. Слова с '*' не отбрасываются FULLTEXT
+    даже если они короче innodb_ft_min_token_size.
+
+    require_all=False - слова через ИЛИ, порядок задает релевантность
+    (GET /products/search). require_all=True - каждое слово обязательно
+    ("+терм* +500*"): фильтр search списка и фасет.
+    Возвращает None, если в строке нет ни одного слова.
+    """
+    if not raw:
+        return None
+
+    tokens = _TOKEN_RE.findall(raw.lower())[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+
+    prefix = "+" if require_all else ""
+    return " ".join(f"{prefix}{token}*" for token in tokens)
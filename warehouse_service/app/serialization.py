@@ -0,0 +1,131 @@
+"""
+Быстрая сериализация списков товаров.
+
+Строки процедур уже имеют нужную структуру, поэтому повторная проверка
+каждой строки через response_model не нужна: ответ собирается из строк
+напрямую и кодируется orjson (если установлен, иначе - стандартным json).
+Поля приводятся к типам модели ответа (bool из TINYINT, float из DECIMAL),
+отсутствующие поля заполняются значениями по умолчанию - тело ответа
+совпадает с обычным путем FastAPI, response_model остается в OpenAPI.
+
+Колоночный формат для массовых потребителей - по заголовку
+Accept: application/vnd.warehouse.columnar+json:
+    {"columns": ["id", "name", ...], "rows": [[1, "..."], ...]}
+
+Отключается FAST_SERIALIZATION=0 (ответ идет через response_model).
+"""
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union, get_args, get_origin
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+load_dotenv()
+
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "1") == "1"
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.warehouse.columnar+json"
+
+_COERCE: Dict[Any, Callable[[Any], Any]] = {bool: bool, int: int, float: float, str: str}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _base_type(annotation: Any) -> Any:
+    # Optional[X] -> X
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+@lru_cache(maxsize=None)
+def _fields(model: Type[BaseModel]) -> Tuple[Tuple[str, Optional[Callable[[Any], Any]], bool, Any], ...]:
+    """(имя, приведение типа, есть ли значение по умолчанию, фабрика значения) по полям модели"""
+    fields = []
+    for name, field in model.model_fields.items():
+        coerce = _COERCE.get(_base_type(field.annotation))
+        if field.default_factory is not None:
+            fields.append((name, coerce, True, field.default_factory))
+        elif not field.is_required():
+            default = field.default
+            fields.append((name, coerce, True, lambda default=default: default))
+        else:
+            fields.append((name, coerce, False, None))
+    return tuple(fields)
+
+
+def _values(mapping, fields) -> List[Any]:
+    values = []
+    for name, coerce, has_default, default in fields:
+        if name in mapping:
+            value = mapping[name]
+            if value is not None and coerce is not None and type(value) is not coerce:
+                value = coerce(value)
+        elif has_default:
+            value = default()
+        else:
+            value = None
+        values.append(value)
+    return values
+
+
+def rows_response(
+    request: Request,
+    response: Response,
+    rows,
+    model: Type[BaseModel],
+) -> Response:
+    """
+    Ответ списка из строк БД (mapping-и или Row) по полям модели ответа.
+    Заголовки, выставленные обработчиком в response (X-Next-Cursor, ETag), переносятся.
+    """
+    fields = _fields(model)
+    names = [name for name, _, _, _ in fields]
+    mappings = [getattr(row, '_mapping', row) for row in rows]
+
+    if COLUMNAR_MEDIA_TYPE in request.headers.get('accept', ''):
+        content: Any = {'columns': names, 'rows': [_values(mapping, fields) for mapping in mappings]}
+        media_type = COLUMNAR_MEDIA_TYPE
+    else:
+        content = [dict(zip(names, _values(mapping, fields))) for mapping in mappings]
+        media_type = None
+
+    fast_response = FastJSONResponse(content, media_type=media_type)
+    fast_response.raw_headers.extend(
+        header for header in response.raw_headers
+        if header[0] not in (b'content-length', b'content-type')
+    )
+    return fast_response
@@ -0,0 +1,249 @@
+"""
+Пакетное изменение остатков на складах.
+
+Все строки пакета применяются в одной транзакции за фиксированное число
+запросов к БД (не зависит от количества строк). Блокировки берутся в
+детерминированном порядке - как в UpdateProductStockQuantity: сначала
+строки product_stocks по (product_id, warehouse_id), затем products по id -
+поэтому пакеты не взаимоблокируются ни друг с другом, ни с PATCH .../stock.
+"""
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Ошибки строк совпадают с текстами SIGNAL из UpdateProductStockQuantity
+PRODUCT_NOT_FOUND = "Product not found"
+WAREHOUSE_NOT_FOUND = "Warehouse not found"
+NEGATIVE_STOCK = "Stock quantity cannot be negative"
+NON_EXISTING_STOCK = "Cannot remove quantity from non-existing stock"
+
+_LOCK_STOCKS = text("""
+    SELECT ps.product_id, ps.warehouse_id, ps.quantity
+    FROM JSON_TABLE(:pairs, '$[*]' COLUMNS (
+        product_id INT PATH '$.product_id',
+        warehouse_id INT PATH '$.warehouse_id'
+    )) k
+    JOIN product_stocks ps ON ps.product_id = k.product_id AND ps.warehouse_id = k.warehouse_id
+    FOR UPDATE OF ps
+""")
+
+_LOCK_PRODUCTS = text("""
+    SELECT p.id, p.name, p.total_quantity
+    FROM JSON_TABLE(:ids, '$[*]' COLUMNS (id INT PATH '$')) k
+    JOIN products p ON p.id = k.id
+    FOR UPDATE OF p
+""")
+
+_GET_WAREHOUSES = text("""
+    SELECT w.id, w.name
+    FROM JSON_TABLE(:ids, '$[*]' COLUMNS (id INT PATH '$')) k
+    JOIN warehouses w ON w.id = k.id
+""")
+
+_DELETE_STOCKS = text("""
+    DELETE ps FROM product_stocks ps
+    JOIN JSON_TABLE(:pairs, '$[*]' COLUMNS (
+        product_id INT PATH '$.product_id',
+        warehouse_id INT PATH '$.warehouse_id'
+    )) k ON ps.product_id = k.product_id AND ps.warehouse_id = k.warehouse_id
+""")
+
+_UPDATE_TOTALS = text("""
+    UPDATE products p
+    JOIN JSON_TABLE(:deltas, '$[*]' COLUMNS (
+        product_id INT PATH '$.product_id',
+        delta INT PATH '$.delta'
+    )) d ON d.product_id = p.id
+    SET p.total_quantity = p.total_quantity + d.delta,
+        p.updated_at = CURRENT_TIMESTAMP(6)
+""")
+
+# Матрица остатков: один запрос, по товару - range по индексу
+# idx_product_stocks_matrix (product_id, warehouse_id, quantity), покрывающему
+# для product_stocks. LEFT JOIN products отличает отсутствующий товар от
+# товара без остатков.
+_STOCK_MATRIX = text("""
+    SELECT k.id as product_id, p.id IS NOT NULL as found, ps.warehouse_id, w.name as warehouse_name, ps.quantity
+    FROM JSON_TABLE(:ids, '$[*]' COLUMNS (id INT PATH '$')) k
+    LEFT JOIN products p ON p.id = k.id
+    LEFT JOIN product_stocks ps ON ps.product_id = p.id
+    LEFT JOIN warehouses w ON w.id = ps.warehouse_id
+    ORDER BY k.id, ps.warehouse_id
+""")
+
+
+def _pairs_json(pairs) -> str:
+    return json.dumps([{"product_id": p, "warehouse_id": w} for p, w in pairs])
+
+
+def _upsert_stocks(rows: List[Dict[str, Any]]):
+    """
+    Вставка/обновление остатков одним запросом: один VALUES (...) на строку
+    (как _multirow_insert в app/importer.py). Список параметров в executemany
+    PyMySQL отправил бы отдельным запросом на каждую строку.
+    """
+    values = []
+    params = {}
+    for index, row in enumerate(rows):
+        values.append(f"(:product_id_{index}, :warehouse_id_{index}, :quantity_{index})")
+        params[f"product_id_{index}"] = row['product_id']
+        params[f"warehouse_id_{index}"] = row['warehouse_id']
+        params[f"quantity_{index}"] = row['quantity']
+    statement = text(
+        "INSERT INTO product_stocks (product_id, warehouse_id, quantity) "
+        f"VALUES {', '.join(values)} AS new "
+        "ON DUPLICATE KEY UPDATE quantity = new.quantity"
+    )
+    return statement, params
+
+
+def apply_stock_adjustments(
+    db: Session,
+    lines: Sequence[Tuple[int, int, int]],
+    all_or_nothing: bool = True,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Применить изменения остатков (product_id, warehouse_id, quantity_change).
+
+    Строки обрабатываются в порядке передачи, каждая видит результат
+    предыдущих (две строки по одному товару и складу складываются).
+    Возвращает (результаты по строкам, были ли изменения записаны в БД).
+
+    all_or_nothing=True: при ошибке хотя бы в одной строке ничего не
+    записывается. all_or_nothing=False: ошибочные строки пропускаются,
+    остальные применяются.
+
+    Транзакцию (commit/rollback) завершает вызывающий код.
+    """
+    product_ids = sorted({product_id for product_id, _, _ in lines})
+    warehouse_ids = sorted({warehouse_id for _, warehouse_id, _ in lines})
+    pairs = sorted({(product_id, warehouse_id) for product_id, warehouse_id, _ in lines})
+
+    # 1. Блокируем существующие строки остатков (в порядке ключа)
+    stocks = {
+        (row.product_id, row.warehouse_id): row.quantity
+        for row in db.execute(_LOCK_STOCKS, {'pairs': _pairs_json(pairs)})
+    }
+    existing_pairs = set(stocks)
+
+    # 2. Блокируем товары (в порядке id) - их total_quantity будет изменен
+    products = {
+        row.id: {'name': row.name, 'total_quantity': row.total_quantity}
+        for row in db.execute(_LOCK_PRODUCTS, {'ids': json.dumps(product_ids)})
+    }
+    warehouses = {
+        row.id: row.name
+        for row in db.execute(_GET_WAREHOUSES, {'ids': json.dumps(warehouse_ids)})
+    }
+
+    # 3. Считаем новые остатки построчно
+    quantities = dict(stocks)
+    totals = {product_id: product['total_quantity'] for product_id, product in products.items()}
+    results = []
+    has_errors = False
+
+    for index, (product_id, warehouse_id, quantity_change) in enumerate(lines):
+        result = {
+            'line': index,
+            'product_id': product_id,
+            'warehouse_id': warehouse_id,
+            'quantity_change': quantity_change,
+            'product_name': products.get(product_id, {}).get('name'),
+            'warehouse_name': warehouses.get(warehouse_id),
+            'status': 'applied',
+            'error': None,
+            'current_quantity': None,
+            'total_quantity_all_warehouses': None,
+        }
+        key = (product_id, warehouse_id)
+
+        if product_id not in products:
+            result['error'] = PRODUCT_NOT_FOUND
+        elif warehouse_id not in warehouses:
+            result['error'] = WAREHOUSE_NOT_FOUND
+        elif key not in quantities and quantity_change <= 0:
+            result['error'] = NON_EXISTING_STOCK
+        elif quantities.get(key, 0) + quantity_change < 0:
+            result['error'] = NEGATIVE_STOCK
+        else:
+            new_quantity = quantities.get(key, 0) + quantity_change
+            # Как в процедуре: нулевой остаток - строки на складе нет
+            if new_quantity == 0:
+                quantities.pop(key, None)
+            else:
+                quantities[key] = new_quantity
+            totals[product_id] += quantity_change
+            result['current_quantity'] = new_quantity
+            result['total_quantity_all_warehouses'] = totals[product_id]
+
+        if result['error'] is not None:
+            result['status'] = 'rejected'
+            has_errors = True
+
+        results.append(result)
+
+    if has_errors and all_or_nothing:
+        for result in results:
+            if result['status'] == 'applied':
+                result['status'] = 'not_applied'
+        return results, False
+
+    # 4. Записываем итоговое состояние: одна вставка/обновление, одно удаление,
+    #    одно обновление общих остатков
+    upserts = [
+        {'product_id': product_id, 'warehouse_id': warehouse_id, 'quantity': quantity}
+        for (product_id, warehouse_id), quantity in sorted(quantities.items())
+        if quantity != stocks.get((product_id, warehouse_id))
+    ]
+    deletes = sorted(existing_pairs - set(quantities))
+    # Товары с изменившимися остатками - даже при нулевой разнице итога
+    # (перенос между складами) обновляется updated_at: по нему строится ETag
+    touched = {row['product_id'] for row in upserts} | {product_id for product_id, _ in deletes}
+    deltas = [
+        {'product_id': product_id, 'delta': totals[product_id] - products[product_id]['total_quantity']}
+        for product_id in sorted(totals)
+        if product_id in touched or totals[product_id] != products[product_id]['total_quantity']
+    ]
+
+    if upserts:
+        statement, params = _upsert_stocks(upserts)
+        db.execute(statement, params)
+    if deletes:
+        db.execute(_DELETE_STOCKS, {'pairs': _pairs_json(deletes)})
+    if deltas:
+        db.execute(_UPDATE_TOTALS, {'deltas': json.dumps(deltas)})
+
+    return results, bool(upserts or deletes or deltas)
+
+
+def stock_matrix(db: Session, product_ids: Sequence[int]) -> Dict[str, Any]:
+    """
+    Остатки товаров по складам одним запросом.
+
+    Возвращает склады, встретившиеся в остатках, строки по найденным товарам
+    (в порядке id) и список id, которых нет в products.
+    """
+    ids = sorted(set(product_ids))
+    rows = db.execute(_STOCK_MATRIX, {'ids': json.dumps(ids)}).fetchall()
+
+    warehouses: Dict[int, str] = {}
+    products: Dict[int, Dict[str, Any]] = {}
+    missing: List[int] = []
+
+    for row in rows:
+        if not row.found:
+            missing.append(row.product_id)
+            continue
+        product = products.setdefault(row.product_id, {'product_id': row.product_id, 'total_quantity': 0, 'quantities': {}})
+        if row.warehouse_id is not None:
+            warehouses[row.warehouse_id] = row.warehouse_name
+            product['quantities'][row.warehouse_id] = row.quantity
+            product['total_quantity'] += row.quantity
+
+    return {
+        'warehouses': [{'id': warehouse_id, 'name': name} for warehouse_id, name in sorted(warehouses.items())],
+        'products': list(products.values()),
+        'missing_product_ids': missing,
+    }
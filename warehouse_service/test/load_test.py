@@ -0,0 +1,288 @@
+"""
+Нагрузочный тест API склада.
+
+Смесь запросов (веса задаются --mix):
+    list       - GET /products с фильтрами (категория, цена, поиск, наличие)
+    list_deep  - GET /products с большим offset
+    product    - GET /products/{id}
+    thermocup  - GET /products/thermocups/{id}
+    reserved   - PATCH /products/thermocups/update/{id}/reserved (+1, затем -1)
+    stock      - PATCH /products/thermocups/update/{id}/stock (+1, затем -1)
+
+Изменяющие запросы парные (+1/-1), поэтому данные после прогона те же.
+Сначала идет прогрев (--warmup), затем --duration секунд замера при
+--concurrency параллельных клиентах. По каждому эндпоинту считаются
+пропускная способность, ошибки и p50/p95/p99; результат пишется в JSON.
+
+Сравнение с прошлым прогоном: --compare baseline.json. Если p95 хоть
+одного эндпоинта вырос больше чем на --max-regression процентов,
+скрипт завершается с кодом 1.
+
+    python test/seed_data.py --count 50000
+    python test/load_test.py --concurrency 32 --duration 60 --output run.json
+    python test/load_test.py --compare run.json
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import requests
+
+DEFAULT_MIX = 'list=30,list_deep=10,product=25,thermocup=20,reserved=10,stock=5'
+
+CATEGORIES = [None, 'Термокружки']
+SEARCH_TERMS = [None, None, None, 'stanley', 'термокружка 500', 'yeti']
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100.0 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = int(weight)
+    return weights
+
+
+class Recorder:
+    """Задержки и ошибки по эндпоинтам (общий для всех потоков)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.enabled = False
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+class Scenario:
+    def __init__(self, base_url: str, product_ids: List[int], thermocup_ids: List[int],
+                 warehouse_ids: List[int], deep_offset: int, recorder: Recorder):
+        self.base_url = base_url
+        self.product_ids = product_ids
+        self.thermocup_ids = thermocup_ids or product_ids
+        self.warehouse_ids = warehouse_ids
+        self.deep_offset = deep_offset
+        self.recorder = recorder
+
+    def call(self, session, endpoint: str, method: str, path: str, **kwargs) -> None:
+        started = time.perf_counter()
+        try:
+            response = session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code < 500
+        except requests.exceptions.RequestException:
+            ok = False
+        self.recorder.record(endpoint, time.perf_counter() - started, ok)
+
+    def run(self, name: str, session, rnd: random.Random) -> None:
+        if name == 'list':
+            params = {'limit': rnd.choice([20, 50, 100])}
+            category = rnd.choice(CATEGORIES)
+            if category:
+                params['category'] = category
+            search = rnd.choice(SEARCH_TERMS)
+            if search:
+                params['search'] = search
+            if rnd.random() < 0.3:
+                params['min_price'] = rnd.choice([500, 1000, 2000])
+                params['max_price'] = params['min_price'] + rnd.choice([1000, 3000])
+            if rnd.random() < 0.2:
+                params['include_out_of_stock'] = 'true'
+            self.call(session, 'GET /products', 'GET', '/products', params=params)
+        elif name == 'list_deep':
+            params = {'limit': 50, 'offset': rnd.randint(self.deep_offset // 2, self.deep_offset)}
+            self.call(session, 'GET /products?offset=deep', 'GET', '/products', params=params)
+        elif name == 'product':
+            product_id = rnd.choice(self.product_ids)
+            self.call(session, 'GET /products/{product_id}', 'GET', f'/products/{product_id}')
+        elif name == 'thermocup':
+            product_id = rnd.choice(self.thermocup_ids)
+            self.call(session, 'GET /products/thermocups/{product_id}', 'GET', f'/products/thermocups/{product_id}')
+        elif name == 'reserved':
+            product_id = rnd.choice(self.thermocup_ids)
+            path = f'/products/thermocups/update/{product_id}/reserved'
+            for change in (1, -1):
+                self.call(session, 'PATCH /products/thermocups/update/{product_id}/reserved', 'PATCH', path,
+                          json={'quantity_change': change})
+        elif name == 'stock':
+            product_id = rnd.choice(self.thermocup_ids)
+            warehouse_id = rnd.choice(self.warehouse_ids)
+            path = f'/products/thermocups/update/{product_id}/stock'
+            for change in (1, -1):
+                self.call(session, 'PATCH /products/thermocups/update/{product_id}/stock', 'PATCH', path,
+                          json={'warehouse_id': warehouse_id, 'quantity_change': change})
+        else:
+            raise ValueError(f"Неизвестный сценарий: {name}")
+
+
+def load_ids(base_url: str, thermocup_category: str):
+    """ID товаров из потоковой выгрузки каталога"""
+    product_ids, thermocup_ids = [], []
+    with requests.get(f"{base_url}/products/export", params={'format': 'ndjson'}, stream=True, timeout=600) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            product = json.loads(line)
+            if not product['is_active']:
+                continue
+            product_ids.append(product['id'])
+            if product['category_name'] == thermocup_category:
+                thermocup_ids.append(product['id'])
+    return product_ids, thermocup_ids
+
+
+def worker(scenario: Scenario, names: List[str], weights: List[int], stop: threading.Event, seed: int) -> None:
+    rnd = random.Random(seed)
+    session = requests.Session()
+    while not stop.is_set():
+        scenario.run(rnd.choices(names, weights)[0], session, rnd)
+
+
+def summarize(recorder: Recorder, duration: float) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        summary[endpoint] = {
+            'requests': len(values),
+            'errors': recorder.errors.get(endpoint, 0),
+            'rps': round(len(values) / duration, 2),
+            'mean_ms': round(sum(values) / len(values) * 1000, 2),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{'Эндпоинт':<58} {'RPS':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'ошибки':>7}")
+    print("-" * 101)
+    for endpoint, stats in summary.items():
+        print(f"{endpoint:<58} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} "
+              f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['errors']:>7}")
+
+
+def compare(summary: Dict[str, Dict[str, float]], baseline_path: str, max_regression: float) -> bool:
+    """Сравнить p95 с прошлым прогоном; False - есть регрессия"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['endpoints']
+
+    ok = True
+    print(f"\n📈 Сравнение с {baseline_path} (p95, мс)")
+    for endpoint, stats in summary.items():
+        before = baseline.get(endpoint)
+        if not before or not before['p95_ms']:
+            continue
+        change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        mark = '❌' if change > max_regression else '✅'
+        if change > max_regression:
+            ok = False
+        print(f"   {mark} {endpoint}: {before['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ({change:+.1f}%)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API склада")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--concurrency', type=int, default=16, help="Параллельных клиентов")
+    parser.add_argument('--duration', type=float, default=30, help="Секунд замера")
+    parser.add_argument('--warmup', type=float, default=5, help="Секунд прогрева (не учитываются)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Веса сценариев: name=weight,...")
+    parser.add_argument('--deep-offset', type=int, default=10000, help="Максимальный offset для list_deep")
+    parser.add_argument('--warehouse-ids', default='1', help="ID складов для PATCH /stock")
+    parser.add_argument('--thermocup-category', default='Термокружки', help="Название категории термокружек")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='load_test_results.json', help="Файл результатов JSON")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--max-regression', type=float, default=10.0, help="Допустимый рост p95, %%")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    warehouse_ids = [int(x) for x in args.warehouse_ids.split(',') if x.strip()]
+
+    print(f"🔄 Загрузка списка товаров из {args.base_url} ...")
+    try:
+        product_ids, thermocup_ids = load_ids(args.base_url, args.thermocup_category)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Не удалось получить каталог: {e}")
+        sys.exit(1)
+    if not product_ids:
+        print("❌ Каталог пуст - сначала запустите test/seed_data.py")
+        sys.exit(1)
+    print(f"   Товаров: {len(product_ids)}, термокружек: {len(thermocup_ids)}")
+
+    recorder = Recorder()
+    scenario = Scenario(args.base_url, product_ids, thermocup_ids, warehouse_ids, args.deep_offset, recorder)
+    stop = threading.Event()
+    names, weights = list(mix), list(mix.values())
+    threads = [
+        threading.Thread(target=worker, args=(scenario, names, weights, stop, args.seed + i), daemon=True)
+        for i in range(args.concurrency)
+    ]
+
+    print(f"🚀 Прогрев {args.warmup:.0f} с, замер {args.duration:.0f} с, клиентов: {args.concurrency}")
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    recorder.enabled = True
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    recorder.enabled = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=35)
+
+    summary = summarize(recorder, elapsed)
+    print_summary(summary)
+
+    result = {
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {
+            'base_url': args.base_url,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'mix': mix,
+            'deep_offset': args.deep_offset,
+            'seed': args.seed,
+            'products': len(product_ids),
+        },
+        'total_rps': round(sum(stats['rps'] for stats in summary.values()), 2),
+        'endpoints': summary,
+    }
+
+    ok = True
+    if args.compare:
+        ok = compare(summary, args.compare, args.max_regression)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Результаты сохранены в файл: {args.output}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
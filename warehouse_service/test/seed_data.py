@@ -0,0 +1,92 @@
+"""
+Наполнение базы тестовыми термокружками для нагрузочного теста.
+
+Товары загружаются через POST /products/thermocups/import (NDJSON),
+поэтому скрипт работает с любой базой, к которой подключен сервис:
+локальный MySQL, контейнер, стенд. Категория и склады должны существовать.
+
+Генерация детерминирована (--seed): один и тот же размер и seed дают
+одинаковый каталог - результаты прогонов можно сравнивать.
+
+    python test/seed_data.py --count 50000 --category-id 1 --warehouse-ids 1,2,3
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import requests
+
+BRANDS = ['Stanley', 'Contigo', 'Thermos', 'Zojirushi', 'Tiger', 'Hydro Flask', 'Yeti', 'Camelbak']
+COLORS = ['черный', 'белый', 'красный', 'синий', 'зеленый', 'серый', 'стальной', 'розовый']
+MATERIALS = ['нержавеющая сталь', 'пластик', 'стекло', 'керамика']
+VOLUMES = [250, 300, 350, 400, 450, 500, 600, 750, 1000]
+
+
+def generate_rows(count: int, category_id: int, warehouse_ids, seed: int):
+    rnd = random.Random(seed)
+    for i in range(count):
+        brand = rnd.choice(BRANDS)
+        volume = rnd.choice(VOLUMES)
+        yield {
+            'name': f"{brand} термокружка {volume} мл #{i:07d}",
+            'category_id': category_id,
+            'base_price': round(rnd.uniform(300, 8000), 2),
+            # Часть товаров без остатка - для фильтра in_stock_only
+            'initial_quantity': rnd.choice([0, 0, 5, 10, 25, 50, 100, 500]),
+            'warehouse_id': rnd.choice(warehouse_ids),
+            'path_to_photo': '',
+            'attributes': {
+                'volume_ml': volume,
+                'color': rnd.choice(COLORS),
+                'brand': brand,
+                'model': f"M{rnd.randint(100, 999)}",
+                'is_hermetic': rnd.random() < 0.7,
+                'material': rnd.choice(MATERIALS),
+            },
+        }
+
+
+def ndjson_body(rows):
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Наполнение БД термокружками для нагрузочного теста")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--count', type=int, default=10000, help="Сколько товаров создать")
+    parser.add_argument('--category-id', type=int, default=1, help="ID категории термокружек")
+    parser.add_argument('--warehouse-ids', default='1', help="ID складов через запятую")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Строк в одной пачке вставки")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    warehouse_ids = [int(x) for x in args.warehouse_ids.split(',') if x.strip()]
+
+    print(f"🔄 Загрузка {args.count} товаров в {args.base_url} ...")
+    started = time.perf_counter()
+    try:
+        response = requests.post(
+            f"{args.base_url}/products/thermocups/import",
+            params={'format': 'ndjson', 'batch_size': args.batch_size},
+            data=ndjson_body(generate_rows(args.count, args.category_id, warehouse_ids, args.seed)),
+            headers={'Content-Type': 'application/x-ndjson'},
+            timeout=3600,
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Ошибка загрузки: {e}")
+        sys.exit(1)
+
+    report = response.json()
+    elapsed = time.perf_counter() - started
+    print(f"✅ Загружено: {report['imported']} из {report['total_rows']} за {elapsed:.1f} с")
+    if report['failed']:
+        print(f"⚠️  Ошибочных строк: {report['failed']}, первые: {report['errors'][:5]}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
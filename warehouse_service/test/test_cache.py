@@ -0,0 +1,58 @@
+"""
+Проверка кэша карточек (app/cache.py): значение, прочитанное из БД до
+инвалидации своего ключа, в кэш не попадает; инвалидация других ключей
+заполнению не мешает.
+
+Запуск из warehouse_service:
+    python -m pytest test/test_cache.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.cache import TTLCache
+
+
+def test_fill_after_own_invalidation_is_dropped():
+    cache = TTLCache(max_size=10, ttl_seconds=60)
+    generation = cache.generation
+    cache.invalidate('a')
+    cache.set('a', 1, generation)
+    assert cache.get('a') is None
+
+
+def test_other_keys_do_not_block_fill():
+    cache = TTLCache(max_size=10, ttl_seconds=60)
+    generation = cache.generation
+    cache.invalidate('b')
+    cache.set('a', 1, generation)
+    assert cache.get('a') == 1
+
+
+def test_fill_started_after_invalidation_is_cached():
+    cache = TTLCache(max_size=10, ttl_seconds=60)
+    cache.invalidate('a')
+    generation = cache.generation
+    cache.set('a', 1, generation)
+    assert cache.get('a') == 1
+
+
+def test_forgotten_invalidations_block_older_fills():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    generation = cache.generation
+    for key in ('a', 'b', 'c'):
+        cache.invalidate(key)
+    # Инвалидация 'a' вытеснена из истории - заполнение, начатое до нее, отклоняется
+    cache.set('a', 1, generation)
+    assert cache.get('a') is None
+    cache.set('a', 1, cache.generation)
+    assert cache.get('a') == 1
+
+
+def test_clear_blocks_fills_started_before_it():
+    cache = TTLCache(max_size=10, ttl_seconds=60)
+    generation = cache.generation
+    cache.clear()
+    cache.set('a', 1, generation)
+    assert cache.get('a') is None
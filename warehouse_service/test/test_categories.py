@@ -0,0 +1,56 @@
+"""
+Проверка реестра категорий (app/categories.py) по схеме БД: имена категорий
+и таблицы атрибутов должны совпадать с тем, чем заполняется новая БД
+(db_storaged_procedures/schema.txt).
+
+Запуск из warehouse_service:
+    python -m pytest test/test_categories.py
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.bootstrap import load_objects
+from app.categories import CATEGORIES, CATEGORIES_BY_DB_NAME
+
+_SEED_NAME = re.compile(r"SELECT '([^']+)'")
+_CREATE_TABLE = re.compile(r'^CREATE TABLE IF NOT EXISTS (\w+) \((.*)\)$', re.DOTALL)
+
+
+def _migrations():
+    objects, _ = load_objects()
+    return [obj.ddl for obj in objects if obj.object_type == 'migration']
+
+
+def _seeded_categories():
+    seeds = [ddl for ddl in _migrations() if ddl.startswith('INSERT INTO categories')]
+    assert len(seeds) == 1
+    return _SEED_NAME.findall(seeds[0])
+
+
+def _tables():
+    tables = {}
+    for ddl in _migrations():
+        match = _CREATE_TABLE.match(ddl)
+        if match:
+            tables[match.group(1)] = [line.split()[0] for line in match.group(2).splitlines() if line.strip()]
+    return tables
+
+
+def test_registry_matches_seeded_categories():
+    assert sorted(category.db_name for category in CATEGORIES.values()) == sorted(_seeded_categories())
+
+
+def test_products_are_found_by_db_name():
+    for name in _seeded_categories():
+        assert CATEGORIES_BY_DB_NAME[name].db_name == name
+
+
+def test_attribute_tables_exist():
+    tables = _tables()
+    for category in CATEGORIES.values():
+        assert category.table in tables
+        assert 'product_id' in tables[category.table]
+        assert set(category.columns) <= set(tables[category.table])
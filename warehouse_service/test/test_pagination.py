@@ -0,0 +1,57 @@
+"""
+Проверка постраничной выдачи товаров: курсор (app/pagination.py) читается
+обратно только с теми же фильтрами, а процедуры выдачи
+(GetProducts, GetProductsAfterCursor) не агрегируют остатки по набору
+фильтров - страница по курсору читает только свои строки products.
+
+Запуск из warehouse_service:
+    python -m pytest test/test_pagination.py
+"""
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.bootstrap import load_objects
+from app.pagination import InvalidCursorError, decode_cursor, encode_cursor
+
+_AGGREGATE = re.compile(r'\b(SUM|COUNT)\s*\(|\bGROUP\s+BY\b|\bHAVING\b|\bproduct_stocks\b', re.IGNORECASE)
+
+_ROW = {'is_active': True, 'total_quantity': 7, 'name': 'Кружка', 'id': 42}
+_FILTERS = {'category': 'Термокружки', 'include_inactive': False}
+
+
+def _procedure(name):
+    objects, _ = load_objects()
+    return next(obj.ddl for obj in objects if obj.name == name)
+
+
+def test_cursor_round_trip():
+    after = decode_cursor(encode_cursor(_ROW, _FILTERS), _FILTERS)
+    assert after == {
+        'after_is_active': True,
+        'after_total_quantity': 7,
+        'after_name': 'Кружка',
+        'after_id': 42,
+    }
+
+
+def test_cursor_rejects_other_filters():
+    cursor = encode_cursor(_ROW, _FILTERS)
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, dict(_FILTERS, include_inactive=True))
+
+
+def test_cursor_rejects_garbage():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor('не курсор', _FILTERS)
+
+
+@pytest.mark.parametrize('name', ['GetProducts', 'GetProductsAfterCursor'])
+def test_listing_does_not_aggregate_stocks(name):
+    # Ключ сортировки - хранимый products.total_quantity; подсчет по
+    # product_stocks сделал бы стоимость страницы зависимой от набора фильтров
+    assert not _AGGREGATE.search(_procedure(name))
@@ -0,0 +1,38 @@
+"""
+Проверка сборки запроса FULLTEXT BOOLEAN MODE (app/search.py).
+
+Запуск из warehouse_service:
+    python -m pytest test/test_search.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.search import MAX_QUERY_TOKENS, build_boolean_query
+
+
+def test_empty_query():
+    assert build_boolean_query(None) is None
+    assert build_boolean_query('') is None
+    assert build_boolean_query('+-<>()~*"@') is None
+    assert build_boolean_query('  ', require_all=True) is None
+
+
+def test_any_token_for_ranked_search():
+    assert build_boolean_query('Термокружка 500') == 'термокружка* 500*'
+
+
+def test_all_tokens_for_filter():
+    assert build_boolean_query('Термокружка 500', require_all=True) == '+термокружка* +500*'
+
+
+def test_operators_are_stripped():
+    raw = '+термо -кружка "stanley" (500) ~мл* @3 <a> b'
+    assert build_boolean_query(raw) == 'термо* кружка* stanley* 500* мл* 3* a* b*'
+    assert build_boolean_query('-stanley*', require_all=True) == '+stanley*'
+
+
+def test_token_limit():
+    raw = ' '.join(f'w{i}' for i in range(MAX_QUERY_TOKENS + 3))
+    assert build_boolean_query(raw, require_all=True).split() == [f'+w{i}*' for i in range(MAX_QUERY_TOKENS)]